@@ -0,0 +1,147 @@
+import io
+import json
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+
+_public = 'https://www.w3.org/ns/activitystreams#Public'
+
+
+class ArchiveImporter:
+    def __init__(self, status_store, batch_size=500, chunk_size=1 << 16, verbose=False):
+        """
+        Seeds a StatusStore from a Mastodon account archive (Preferences > Import and export > Request your
+        archive) instead of thousands of account_statuses() calls. The archive's outbox.json can be hundreds of
+        megabytes, so it is never loaded whole: it is read a chunk at a time and each activity is decoded on its
+        own, so memory use stays the same whatever the size of the archive. Each post is converted to the shape
+        the API returns and stored with StatusStore.add_statuses(), so the text is normalized and fingerprinted
+        exactly as already_posted() expects, and its tags and media go in with it.
+        :param status_store: The StatusStore to fill
+        :param batch_size: Statuses stored per transaction
+        :param chunk_size: Characters read from outbox.json at a time
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.status_store = status_store
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.verbose = verbose
+
+    def import_archive(self, archive_file):
+        """
+        Import every post in the archive. Boosts are left out - the archive only has the address of the boosted post.
+        If the store was empty, the archive is the whole history up to when it was made, so the next
+        sync_statuses() only fetches the statuses posted since.
+        :param archive_file: The archive .zip file, or its outbox.json
+        :return: Dictionary with the counts of 'statuses' imported, 'media' and 'skipped' activities
+        """
+        store_was_empty = self.status_store.newest_id() is None
+        counts = {'statuses': 0, 'media': 0, 'skipped': 0}
+        batch = []
+        with self.__open_outbox(archive_file) as outbox:
+            for activity in self.activities(outbox):
+                status = self.to_status(activity)
+                if status is None:
+                    counts['skipped'] += 1
+                    continue
+                counts['media'] += len(status['media_attachments'])
+                batch.append(status)
+                if len(batch) >= self.batch_size:
+                    counts['statuses'] += self.status_store.add_statuses(batch)
+                    batch = []
+        if batch:
+            counts['statuses'] += self.status_store.add_statuses(batch)
+        if store_was_empty and counts['statuses']:
+            self.status_store.set_state('history_complete', 'yes')
+        print(f"Imported {counts['statuses']} statuses with {counts['media']} media from {archive_file}, "
+              f"skipped {counts['skipped']} other activities") if self.verbose else None
+        return counts
+
+    @staticmethod
+    @contextmanager
+    def __open_outbox(archive_file):
+        if zipfile.is_zipfile(archive_file):
+            with zipfile.ZipFile(archive_file) as archive, \
+                    io.TextIOWrapper(archive.open('outbox.json'), encoding='utf-8') as outbox:
+                yield outbox
+        else:
+            with open(archive_file, 'r', encoding='utf-8') as outbox:
+                yield outbox
+
+    def activities(self, outbox):
+        """
+        Decode the items of the outbox's orderedItems list one at a time, with JSONDecoder.raw_decode() on a
+        buffer that only ever holds the current item and the next chunk
+        :param outbox: outbox.json, open as text
+        :return: Generator of activity dictionaries
+        """
+        decoder = json.JSONDecoder()
+        buffer = ''
+        key = '"orderedItems"'
+        while key not in buffer:
+            chunk = outbox.read(self.chunk_size)
+            if not chunk:
+                return
+            buffer = buffer[-len(key):] + chunk
+        buffer = buffer[buffer.index(key) + len(key):].lstrip(' \t\r\n:')
+        while not buffer:
+            chunk = outbox.read(self.chunk_size)
+            if not chunk:
+                return
+            buffer = chunk.lstrip(' \t\r\n:')
+        if not buffer.startswith('['):
+            raise ValueError("Error 7160: orderedItems in the archive's outbox.json is not a list")
+        position = 1
+        end_of_file = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                activity, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise ValueError("Error 7161: the archive's outbox.json ends part way through an activity")
+                chunk = outbox.read(self.chunk_size)
+                end_of_file = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield activity
+
+    @staticmethod
+    def to_status(activity):
+        """
+        Convert one ActivityPub 'Create' activity of a post into a status dictionary like the API returns
+        :param activity: Dictionary from the outbox
+        :return: Status dictionary, or None for anything other than a post (like a boost)
+        """
+        note = activity.get('object')
+        if activity.get('type') != 'Create' or not isinstance(note, dict):
+            return None
+        to, cc = note.get('to') or [], note.get('cc') or []
+        if _public in to:
+            visibility = 'public'
+        elif _public in cc:
+            visibility = 'unlisted'
+        elif any(address.endswith('/followers') for address in to):
+            visibility = 'private'
+        else:
+            visibility = 'direct'
+        tags = note.get('tag') or []
+        return {
+            'id': note['id'].rstrip('/').rsplit('/', 1)[-1],
+            'created_at': datetime.fromisoformat((note.get('published') or activity['published']).replace('Z', '+00:00')),
+            'content': note.get('content'),
+            'visibility': visibility,
+            'url': note.get('url') or note['id'],
+            'mentions': [{'acct': tag['name'].lstrip('@')} for tag in tags if tag.get('type') == 'Mention'],
+            'tags': [{'name': tag['name'].lstrip('#')} for tag in tags if tag.get('type') == 'Hashtag'],
+            # The archive has no media IDs, so the file's place in the archive (media_attachments/...) stands in for one
+            'media_attachments': [{
+                'id': attachment['url'], 'type': (attachment.get('mediaType') or '').split('/')[0] or None,
+                'url': attachment['url'], 'description': attachment.get('name'),
+                'meta': {'original': {'width': attachment.get('width'), 'height': attachment.get('height')}}
+            } for attachment in note.get('attachment') or []],
+            'reblog': None
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from MastodonWrapper import MastodonWrapper
+
+
+def pooled_session(pool_size=20):
+    """
+    A requests.Session with a connection pool big enough to be shared by many MastodonWrapper objects
+    :param pool_size: Maximum number of connections kept open per server
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class AsyncMastodonWrapper:
+    def __init__(self, wrapper, executor=None):
+        """
+        An asyncio front end to a MastodonWrapper. Mastodon.py is synchronous, so each call runs in a
+        worker thread; calls for this one account are run one at a time, in the order they were made,
+        while calls for other accounts run at the same time.
+        Create these with AsyncMastodonWrapper.connect() rather than directly.
+        :param wrapper: A connected MastodonWrapper
+        :param executor: ThreadPoolExecutor to run the calls in, or None for the event loop's default
+        """
+        self.wrapper = wrapper
+        self.executor = executor
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, executor=None, **wrapper_args):
+        """
+        Create the MastodonWrapper (which verifies the credentials) without blocking the event loop
+        :param executor: ThreadPoolExecutor to run the calls in, or None for the event loop's default
+        :param wrapper_args: Arguments for MastodonWrapper, like base_url, access_token and session
+        :return: AsyncMastodonWrapper
+        """
+        loop = asyncio.get_running_loop()
+        wrapper = await loop.run_in_executor(executor, partial(MastodonWrapper, **wrapper_args))
+        return cls(wrapper, executor)
+
+    async def __run(self, method_name, *args, **kwargs):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(getattr(self.wrapper, method_name), *args, **kwargs))
+
+    async def sync_statuses(self, force=False, verbose=False):
+        return await self.__run('sync_statuses', force=force, verbose=verbose)
+
+    async def already_posted(self, next_dict, verbose=False):
+        return await self.__run('already_posted', next_dict, verbose=verbose)
+
+    async def already_posted_batch(self, postings, verbose=False):
+        return await self.__run('already_posted_batch', postings, verbose=verbose)
+
+    async def hours_since_last_post(self, verbose=False):
+        return await self.__run('hours_since_last_post', verbose=verbose)
+
+    async def time_for_next_post(self, delay, verbose=False):
+        return await self.__run('time_for_next_post', delay, verbose=verbose)
+
+    async def post_update(self, details, verbose=False):
+        return await self.__run('post_update', details, verbose=verbose)
+
+    def state(self):
+        return self.wrapper.state()
+
+    def __repr__(self):
+        return f"Async {self.wrapper!r}"
+
+
+class MultiAccountPoster:
+    def __init__(self, accounts, pool_size=20, verbose=False):
+        """
+        Runs the whole posting cycle - connect, duplicate check, frequency check and post - for
+        several bot accounts at the same time, so a cycle takes about as long as the slowest account.
+        :param accounts: List of dictionaries, one per account, with:
+            'name': A label for the account, used in the results
+            'wrapper_args': Arguments for MastodonWrapper (base_url, access_token, time_zone, ok_to_post, ...).
+                            ok_to_post should be 'yes' or 'no' - 'ask' would have every account waiting for the keyboard
+            'post_limit_hours': Minimum hours between posts for this account
+            'postings': List of posting dictionaries to consider, in order, like DataForUpdates.postings_for()
+        :param pool_size: Size of the HTTP connection pool shared by all the accounts
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.accounts = accounts
+        self.pool_size = pool_size
+        self.verbose = verbose
+        self.wrappers = {}  # account name -> AsyncMastodonWrapper, once connected
+
+    def run(self):
+        """
+        Run one posting cycle for all the accounts
+        :return: List of result dictionaries, one per account
+        """
+        return asyncio.run(self.run_cycle())
+
+    async def run_cycle(self):
+        """
+        Run one posting cycle for all the accounts, concurrently
+        :return: List of result dictionaries, one per account
+        """
+        session = pooled_session(self.pool_size)
+        # One thread per account, so one account's pause after uploading media never holds up another account
+        with ThreadPoolExecutor(max_workers=max(len(self.accounts), 1)) as executor:
+            start_time = time.monotonic()
+            results = await asyncio.gather(*[self.__run_account(account, session, executor) for account in self.accounts])
+        session.close()
+        print(f"Posting cycle for {len(self.accounts)} accounts took {time.monotonic() - start_time:.2f} seconds") if self.verbose else None
+        return results
+
+    async def __run_account(self, account, session, executor):
+        """
+        The posting cycle for one account. Any error is reported in the result rather than raised,
+        so one failing account does not stop the others.
+        :return: Dictionary with 'account', 'result' ('posted', 'skipped' or 'error'), 'details' and 'seconds'
+        """
+        name = account['name']
+        start_time = time.monotonic()
+        try:
+            m = await AsyncMastodonWrapper.connect(executor=executor, session=session, **account['wrapper_args'])
+            self.wrappers[name] = m
+            if m.state() != "Connected to server":
+                return self.__result(name, 'error', m.state(), start_time)
+
+            postings = account['postings']
+            posted = await m.already_posted_batch(postings, verbose=self.verbose)
+            new_postings = [p for p, already in zip(postings, posted) if not already]
+            if not new_postings:
+                return self.__result(name, 'skipped', f"All {len(postings)} postings have already been posted", start_time)
+
+            hours_since = await m.hours_since_last_post()
+            if hours_since < account['post_limit_hours']:
+                next_time = await m.time_for_next_post(delay=account['post_limit_hours'])
+                return self.__result(name, 'skipped', f"Only {hours_since:.2f} hours since the last post, try again at {next_time}", start_time)
+
+            if await m.post_update(new_postings[0], verbose=self.verbose):
+                return self.__result(name, 'posted', new_postings[0]['full_update_text'], start_time)
+            return self.__result(name, 'skipped', f"Ready to post, but not posted: {new_postings[0]['full_update_text']}", start_time)
+        except Exception as e:
+            return self.__result(name, 'error', f"Error 7130: {e}", start_time)
+
+    def __result(self, name, result, details, start_time):
+        print(f"{name}: {result} - {details}") if self.verbose else None
+        return {'account': name, 'result': result, 'details': details, 'seconds': time.monotonic() - start_time}
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import re
+import sqlite3  # https://docs.python.org/3/library/sqlite3.html
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class CachingSession(requests.Session):
+    # Seconds a response is served without asking the server, by endpoint - None for the endpoints not listed,
+    # which are never cached. At 0 the response is still kept, and revalidated with If-None-Match every time:
+    # the server answers 304 Not Modified with no body if it has not changed.
+    default_ttls = {
+        r'/api/v[12]/instance': 86400,
+        r'/api/v1/accounts/verify_credentials': 300,
+        r'/api/v1/accounts/\d+': 300,
+        r'/api/v1/accounts/\d+/statuses': 0,  # Posts made from anywhere else have to show up at once
+        r'/api/v1/statuses/\d+': 0,
+    }
+    schema = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,  -- hash of the URL and the Authorization header
+            url TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            headers TEXT,  -- JSON, without the rate limit headers
+            body BLOB,
+            size INTEGER,
+            stored_at REAL,  -- UTC epoch seconds the response was fetched or last revalidated
+            used_at REAL  -- UTC epoch seconds the response was last served, for the LRU eviction
+        );
+        CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+    """
+    # Headers that describe this one response rather than the data, so are never served from the cache
+    uncached_headers = ('x-ratelimit-limit', 'x-ratelimit-remaining', 'x-ratelimit-reset', 'date',
+                        'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive')
+
+    def __init__(self, cache_file=None, ttls=None, max_bytes=50_000_000, verbose=False):
+        """
+        A requests.Session that keeps the responses of read (GET) endpoints on disk, for MastodonWrapper's
+        session argument. A fresh response (younger than its endpoint's TTL) is served without contacting the
+        server. An older one is revalidated with If-None-Match (ETag) or If-Modified-Since, and if the server
+        answers 304 Not Modified, the stored body is served. Anything posted, changed or deleted through the
+        session marks every stored response as stale, so it is checked again before being served. The least
+        recently used responses are dropped once the cache is over max_bytes.
+        :param cache_file: SQLite file to keep the responses in, or None to keep them in memory for this run only
+        :param ttls: Dictionary of path regular expression -> seconds (or None to not cache), merged over default_ttls
+        :param max_bytes: Largest total size of the stored response bodies
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        super().__init__()
+        self.cache_file = cache_file if cache_file else ':memory:'
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in {**self.default_ttls, **(ttls or {})}.items()]
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        self.lock = threading.RLock()  # The session is shared by the wrapper's worker and streaming threads
+        self.db = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(self.schema)
+        self.total_bytes = self.db.execute("SELECT coalesce(SUM(size), 0) FROM responses").fetchone()[0]
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'uncached': 0, 'evictions': 0,
+                         'bytes_saved': 0, 'bytes_fetched': 0, 'fetch_seconds': 0.0}
+
+    def ttl_for(self, url):
+        """
+        :param url: Full URL of a request
+        :return: TTL in seconds for its endpoint, or None if it is not cached
+        """
+        path = urlparse(url).path.rstrip('/')
+        for pattern, ttl in self.ttls:
+            if pattern.fullmatch(path):
+                return ttl
+        return None
+
+    @staticmethod
+    def cache_key(request):
+        """
+        The key for one URL (with its query string) and access token - the token itself is never saved
+        :return: String
+        """
+        return hashlib.sha256(f"{request.url}\n{request.headers.get('Authorization', '')}".encode('utf-8')).hexdigest()
+
+    def send(self, request, **kwargs):
+        """
+        Every request made through the session ends up here, already prepared
+        """
+        ttl = self.ttl_for(request.url) if request.method == 'GET' and not kwargs.get('stream') else None
+        if ttl is None:
+            if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                self.expire()
+            self.__count('uncached')
+            return super().send(request, **kwargs)
+        key = self.cache_key(request)
+        with self.lock:
+            entry = self.db.execute("SELECT * FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if entry is not None and now - entry['stored_at'] < ttl:
+            self.__count('hits')
+            self.__count('bytes_saved', entry['size'])
+            self.__touch(key, now)
+            print(f"Cache hit for {request.url}") if self.verbose else None
+            return self.__cached_response(entry, request)
+        if entry is not None:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        self.__count('fetch_seconds', time.perf_counter() - started)
+        if response.status_code == 304 and entry is not None:
+            self.__count('revalidated')
+            self.__count('bytes_saved', entry['size'])
+            self.__touch(key, time.time(), revalidated=True)
+            print(f"Cache revalidated {request.url}") if self.verbose else None
+            return self.__cached_response(entry, request, fresh_headers=response.headers)
+        self.__count('misses')
+        if response.status_code == 200:
+            self.__count('bytes_fetched', len(response.content))
+            if ttl > 0 or 'ETag' in response.headers or 'Last-Modified' in response.headers:
+                self.__store(key, request.url, response)
+        return response
+
+    def __count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def __touch(self, key, now, revalidated=False):
+        with self.lock, self.db:
+            if revalidated:
+                self.db.execute("UPDATE responses SET stored_at = ?, used_at = ? WHERE key = ?", (now, now, key))
+            else:
+                self.db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+
+    def __store(self, key, url, response):
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in self.uncached_headers}
+        now = time.time()
+        with self.lock, self.db:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.total_bytes -= old['size'] if old else 0
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                             json.dumps(headers), body, len(body), now, now))
+            self.total_bytes += len(body)
+            if self.total_bytes > self.max_bytes:
+                self.__evict()
+
+    def __evict(self):
+        """
+        Drop the least recently used responses until the cache is back under max_bytes - called with the lock held
+        """
+        for row in self.db.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall():
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (row['key'],))
+            self.total_bytes -= row['size']
+            self.counters['evictions'] += 1
+
+    @staticmethod
+    def __cached_response(entry, request, fresh_headers=None):
+        """
+        Rebuild a requests.Response from a stored entry. With fresh_headers (from a 304), its rate limit
+        headers are passed on, so Mastodon.py and the request scheduler still see the current budget.
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response._content = entry['body']
+        response.headers = CaseInsensitiveDict(json.loads(entry['headers']))
+        for name, value in (fresh_headers or {}).items():
+            if name.lower().startswith('x-ratelimit') or name.lower() == 'date':
+                response.headers[name] = value
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+        return response
+
+    def expire(self):
+        """
+        Mark every stored response as stale, so each is revalidated with the server before it is served again
+        :return: None
+        """
+        with self.lock, self.db:
+            self.db.execute("UPDATE responses SET stored_at = 0")
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def stats(self):
+        """
+        How well the cache is doing. 'hit_ratio' counts both the responses served without asking the server and
+        those the server said had not changed; 'bytes_saved' is the body bytes not downloaded because of either,
+        and 'seconds_saved' estimates the time the hits saved, at the average time of the requests that went out.
+        :return: Dictionary
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        stats['bytes_stored'] = self.total_bytes
+        served = stats['hits'] + stats['revalidated']
+        cacheable = served + stats['misses']
+        stats['hit_ratio'] = round(served / cacheable, 3) if cacheable else None
+        fetches = stats['revalidated'] + stats['misses']
+        stats['seconds_saved'] = round(stats['hits'] * stats['fetch_seconds'] / fetches, 3) if fetches else 0.0
+        stats['fetch_seconds'] = round(stats['fetch_seconds'], 3)
+        return stats
+
+    def close(self):
+        super().close()
+        with self.lock:
+            self.db.close()
+
+    def __repr__(self):
+        return f"CachingSession {self.cache_file} with {self.total_bytes} bytes stored"
@@ -1,51 +1,52 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import os
+import pickle
+from datetime import date
+
+
 class DataForUpdates:
-    def __init__(self, csv_file, image_folder, include_calc_url=True, max_len=500, max_image_text=1500, verbose=False):
+    # Columns expected in the schedule CSV file, one row per planned posting
+    schedule_columns = ["month", "day", "image_name", "image_text", "tags", "post_text", "spoiler_text", "sensitive"]
+    # Bump this if the layout of the cached index changes, so old caches are ignored
+    index_version = 1
+
+    def __init__(self, csv_file, image_folder, include_calc_url=True, max_len=500, max_image_text=1500, verbose=False,
+                 post_date=None, cache_index=True, index_cache_file=None):
         self.object_state = "Unable to access data"
         self.csv_input_file = csv_file
         self.image_folder = image_folder
+        self.include_calc_url = include_calc_url
         self.verbose = verbose
         self.max_len = max_len
         self.max_image_text = max_image_text
+        self.post_date = post_date if post_date else date.today()
+        self.cache_index = cache_index
+        self.index_cache_file = index_cache_file if index_cache_file else f"{csv_file}.index.pickle"
+        self.index = {}  # (month, day) -> list of posting dictionaries, in CSV file order
+        self.skipped_rows = []  # (line number, reason) of each row that is not a valid posting
+        self.return_dict = None
 
-        #TODO Read and process the input csv file
-
-        # For development, will hardcode the data that will be returned,
-        # eventually this is read from the CSV file and processed
-        self.return_dict = {
-            'month': 12,
-            'day': 28,
-            'image_name': 'month-12-day-28-s0372_ss0072_it1006.jpeg',
-            'image_text': 'A black and white photo of a large piece of machinery with the brand name De Laval on a plaque.',
-            'tags': '#OTD, #Toronto #torontophoto #BWPhotography #HistoricPhoto #machinery #pump',
-            'post_text': "A 26 M.G. DeLaval turbine pump in the Toronto High Level pumping station in the Republic of Rathnelly - 98 years ago today, on December 28th, 1925.",
-            'spoiler_text': None,  # Set to None normally, or some teaser text for 'show more'
-            'sensitive': False  # Set to False normally, or True to hide the image by default
+        # Read and process the input csv file - or the cached index if the file has not changed
+        try:
+            self.index, self.skipped_rows = self.__load_index()
+        except Exception as e:
+            self.object_state = f"Error 5210: Unable to read the schedule file >{self.csv_input_file}<: {e}"
+            print(self.object_state)
+            return
+        if self.skipped_rows:
+            # One bad row only loses that posting - the rest of the schedule still goes out
+            print(f"WARNING 5217: Skipped {len(self.skipped_rows)} rows of >{self.csv_input_file}< that are not a valid posting")
+            for line_num, reason in self.skipped_rows:
+                print(f"\tLine {line_num}: {reason}")
 
-        }
+        todays_postings = self.postings_for(self.post_date.month, self.post_date.day)
+        if not todays_postings:
+            self.object_state = f"Error 5211: No posting for month {self.post_date.month} / day {self.post_date.day} in >{self.csv_input_file}<"
+            print(self.object_state) if verbose else None
+            return
+        self.return_dict = todays_postings[0]
         self.object_state = "Data ready"
 
-        # Calculate the URL - specific to this example
-        if include_calc_url:
-            self.return_dict['url'] = f"https://wholemap.com/historic/toronto.php?month={self.return_dict['month']}&day={self.return_dict['day']}"
-        else:
-            self.return_dict['url'] = ''
-        # Some clean up
-        # Ensure the list of tags all start with a hashtag
-        if 'tags' in self.return_dict:
-            tag_string = self.return_dict['tags']
-            tag_string_no_commas = tag_string.replace(',', '')  # Remove commas
-            tags_fixed = ' '.join(['#' + tag if not tag.startswith('#') else tag for tag in tag_string_no_commas.split()])
-            if tag_string != tags_fixed:
-                self.return_dict['tags'] = tags_fixed
-                print(f"Added one or more '#' or removed commas in the list of tags, now:\n\t{self.return_dict['tags']}") if verbose else None
-
-        self.return_dict['full_update_text'] = f"{self.return_dict['post_text']} {self.return_dict.get('tags', '')} {self.return_dict.get('url', '')}"
-        self.return_dict['full_update_len'] = len(self.return_dict['full_update_text'])
-        self.return_dict['image_text_len'] = len(self.return_dict['image_text'])
-
-        # Add the folder to the file name
-        self.return_dict['full_image_name'] = f"{self.image_folder}{self.return_dict['image_name']}"
-
         if verbose:
             print("One set of data has been loaded:")
             for key, value in self.return_dict.items():
@@ -56,16 +57,246 @@ class DataForUpdates:
         else:
             print(f"\nPass: The full post text w/ tags and URL is {self.return_dict['full_update_len']} characters which is < {self.max_len}") if self.verbose else None
 
-        if len(self.return_dict['image_text']) > self.max_image_text:
-            print(f"WARNING 3144: The image alt text is {len(self.return_dict['image_text'])} characters which is > {self.max_image_text}")
-            self.object_state = f"Warning 3144: The image alt text is {self.return_dict['full-update-len']} characters which is > {self.max_image_text}"
+        if self.return_dict['image_text_len'] > self.max_image_text:
+            print(f"WARNING 3144: The image alt text is {self.return_dict['image_text_len']} characters which is > {self.max_image_text}")
+            self.object_state = f"Warning 3144: The image alt text is {self.return_dict['image_text_len']} characters which is > {self.max_image_text}"
         else:
-            print(f"\nPass: The image alt text is {len(self.return_dict['image_text'])} characters which is < {self.max_image_text}") if self.verbose else None
-
+            print(f"\nPass: The image alt text is {self.return_dict['image_text_len']} characters which is < {self.max_image_text}") if self.verbose else None
 
     def next_posting(self):
         return self.return_dict
 
+    def postings_for(self, month, day):
+        """
+        All the postings scheduled for one calendar day, in the order they appear in the CSV file.
+        A dictionary lookup in the (month, day) index, so cheap to call for any date.
+        :param month: Month number, 1 to 12
+        :param day: Day of the month
+        :return: List of posting dictionaries, empty if nothing is scheduled
+        """
+        return self.index.get((int(month), int(day)), [])
+
+    def __load_index(self):
+        """
+        Return the (month, day) index for the schedule CSV file. The index is cached on disk, keyed
+        by the CSV file's modification time and size, so repeat runs skip parsing the CSV entirely.
+        :return: Tuple of (dictionary of (month, day) -> list of posting dictionaries, list of skipped rows)
+        """
+        file_stat = os.stat(self.csv_input_file)
+        cache_key = (self.index_version, file_stat.st_mtime_ns, file_stat.st_size, self.image_folder, self.include_calc_url)
+
+        if self.cache_index and os.path.isfile(self.index_cache_file):
+            try:
+                with open(self.index_cache_file, "rb") as infile:
+                    cached = pickle.load(infile)
+                if cached.get('key') == cache_key:
+                    print(f"Using the cached schedule index {self.index_cache_file}") if self.verbose else None
+                    return cached['index'], cached['skipped_rows']
+            except Exception as e:
+                print(f"Ignoring unreadable schedule index cache {self.index_cache_file}: {e}") if self.verbose else None
+
+        index, skipped_rows = self.__build_index()
+        if self.cache_index:
+            try:
+                temp_file = f"{self.index_cache_file}.tmp"
+                with open(temp_file, "wb") as outfile:
+                    pickle.dump({'key': cache_key, 'index': index, 'skipped_rows': skipped_rows}, outfile,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_file, self.index_cache_file)
+            except OSError as e:
+                print(f"Unable to write the schedule index cache {self.index_cache_file}: {e}") if self.verbose else None
+        return index, skipped_rows
+
+    def __build_index(self):
+        """
+        Stream the schedule CSV file once, preparing each row and adding it to the (month, day) index.
+        A row that is not a valid posting (a blank line of commas, a month of 13, February 30th) is skipped
+        and noted, rather than stopping the whole schedule from loading.
+        :return: Tuple of (dictionary of (month, day) -> list of posting dictionaries,
+                 list of (line number, reason) for the skipped rows)
+        """
+        index = {}
+        skipped_rows = []
+        tags_fixed = 0
+        with open(self.csv_input_file, "r", newline='', encoding="utf-8") as infile:
+            reader = csv.DictReader(infile, skipinitialspace=True)
+            for row in reader:
+                try:
+                    posting = self.prepare_posting(row)
+                except ValueError as e:
+                    skipped_rows.append((reader.line_num, str(e)))
+                    continue
+                if posting['tags'] != (row.get('tags') or ''):
+                    tags_fixed += 1
+                index.setdefault((posting['month'], posting['day']), []).append(posting)
+        if self.verbose:
+            print(f"Read {sum(len(postings) for postings in index.values())} postings for {len(index)} different days from {self.csv_input_file}")
+            if tags_fixed:
+                print(f"Added one or more '#' or removed commas in the list of tags for {tags_fixed} rows")
+        return index, skipped_rows
+
+    def prepare_posting(self, row):
+        """
+        Turn one row of the schedule CSV file into the dictionary passed to MastodonWrapper.post_update()
+        :param row: Dictionary of column name -> string value, as read by csv.DictReader
+        :return: Posting dictionary
+        :raises ValueError: If the row's month and day are not a date
+        """
+        try:
+            month, day = int(row['month']), int(row['day'])
+            date(2000, month, day)  # A leap year, so February 29th is a date
+        except (TypeError, ValueError):
+            raise ValueError(f"Not a valid month and day: >{row['month']}< / >{row['day']}<") from None
+        posting = {
+            'month': month,
+            'day': day,
+            'image_name': (row.get('image_name') or '').strip(),
+            'image_text': row.get('image_text') or '',
+            'tags': row.get('tags') or '',
+            'post_text': row.get('post_text') or '',
+            'spoiler_text': row.get('spoiler_text') or None,  # Set to None normally, or some teaser text for 'show more'
+            'sensitive': (row.get('sensitive') or '').strip().lower() in ('1', 'true', 'yes', 'y')  # True to hide the image by default
+        }
+
+        # Calculate the URL - specific to this example
+        if self.include_calc_url:
+            posting['url'] = f"https://wholemap.com/historic/toronto.php?month={posting['month']}&day={posting['day']}"
+        else:
+            posting['url'] = ''
+        # Some clean up
+        # Ensure the list of tags all start with a hashtag
+        tag_string_no_commas = posting['tags'].replace(',', '')  # Remove commas
+        posting['tags'] = ' '.join(['#' + tag if not tag.startswith('#') else tag for tag in tag_string_no_commas.split()])
+
+        posting['full_update_text'] = f"{posting['post_text']} {posting['tags']} {posting['url']}"
+        posting['full_update_len'] = len(posting['full_update_text'])
+        posting['image_text_len'] = len(posting['image_text'])
+
+        # Add the folder to the file name
+        posting['full_image_name'] = f"{self.image_folder}{posting['image_name']}"
+        return posting
+
+    def preflight(self, max_image_bytes=16 * 1024 * 1024):
+        """
+        Check every row of the schedule CSV file at once, rather than finding problems one day at a time
+        when they come up for posting. The same clean up and calculations as prepare_posting() are done
+        on whole columns with pandas, and each image folder is listed once to check the images.
+        :param max_image_bytes: Largest image file to accept - Mastodon's default limit is 16 MB
+        :return: pandas DataFrame with one row per CSV row, with an 'issues' column and 'ok' set to False for any row with an error
+        """
+        import numpy as np
+        import pandas as pd  # Only needed here, so importing this module stays cheap
+
+        df = pd.read_csv(self.csv_input_file, dtype=object, na_filter=False, skipinitialspace=True, encoding="utf-8")
+        for column in self.schedule_columns:
+            if column not in df.columns:
+                df[column] = ''
+
+        def lengths(values):
+            return np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+
+        # A schedule repeats the same few months, days and lists of tags, so each distinct value is only
+        # worked out once - in plain Python, exactly as prepare_posting() does - and then spread over the rows
+        month_codes, months = pd.factorize(df['month'])
+        day_codes, days = pd.factorize(df['day'])
+        distinct_dates, first_row, date_codes = np.unique(month_codes * len(days) + day_codes, return_index=True, return_inverse=True)
+        date_values = [self.__month_and_day(df['month'].iat[i], df['day'].iat[i]) for i in first_row]
+        urls = np.array([f"https://wholemap.com/historic/toronto.php?month={month}&day={day}"
+                         if self.include_calc_url and valid else '' for month, day, valid in date_values], dtype=object)
+        tag_codes, tag_lists = pd.factorize(df['tags'])
+        # The same tag clean up as prepare_posting(): no commas, and every tag starts with a '#'
+        clean_tags = np.array([' '.join(tag if tag.startswith('#') else '#' + tag for tag in tags.replace(',', '').split())
+                               for tags in tag_lists], dtype=object)
+
+        report = pd.DataFrame({'row': np.arange(len(df)) + 2})  # Line number in the CSV file, after the header
+        report['month'] = pd.array([month for month, day, valid in date_values], dtype='Int64').take(date_codes)
+        report['day'] = pd.array([day for month, day, valid in date_values], dtype='Int64').take(date_codes)
+        image_names = [name.strip() for name in df['image_name']]
+        report['image_name'] = image_names
+        report['tags'] = clean_tags[tag_codes]
+        report['url'] = urls[date_codes]
+        # The length of f"{post_text} {tags} {url}", without building the text
+        report['full_update_len'] = lengths(df['post_text']) + lengths(clean_tags)[tag_codes] + lengths(urls)[date_codes] + 2
+        report['image_text_len'] = lengths(df['image_text'])
+        report['image_bytes'] = pd.array(self.__image_sizes(image_names), dtype='Int64')
+
+        valid_date = np.array([valid for month, day, valid in date_values], dtype=bool)[date_codes]
+        report['postings_that_day'] = np.bincount(date_codes, minlength=len(distinct_dates))[date_codes]
+        repeated = pd.DataFrame({'date': date_codes, 'tags': tag_codes, 'post_text': df['post_text']}).duplicated(keep='first').to_numpy()
+
+        has_image = np.array([name != '' for name in image_names], dtype=bool)
+        image_bytes = report['image_bytes'].to_numpy(dtype=float, na_value=np.nan)
+        image_text_len = report['image_text_len'].to_numpy()
+        errors = [
+            (~valid_date, "Error 5212: Not a valid month and day"),
+            (report['full_update_len'].to_numpy() > self.max_len, f"Error 8812: The full post text w/ tags and URL is > {self.max_len} characters"),
+            (image_text_len > self.max_image_text, f"Error 3144: The image alt text is > {self.max_image_text} characters"),
+            (has_image & np.isnan(image_bytes), f"Error 5213: Image not found in {self.image_folder}"),
+            (repeated & valid_date, "Error 5214: Same text as an earlier posting for the same day, so it would never be posted"),
+        ]
+        warnings = [
+            (image_bytes > max_image_bytes, f"Warning 5215: Image is > {max_image_bytes:,} bytes"),
+            (has_image & (image_text_len == 0), "Warning 5216: Image has no alt text"),
+        ]
+        # One bit per check, so the text of the issues is only put together once per distinct combination
+        flags = np.zeros(len(report), dtype=np.int64)
+        for bit, (mask, message) in enumerate(errors + warnings):
+            flags |= mask.astype(np.int64) << bit
+        codes, combinations = pd.factorize(flags)
+        issue_texts = np.array(['; '.join(message for bit, (mask, message) in enumerate(errors + warnings) if combination >> bit & 1)
+                                for combination in combinations], dtype=object)
+        report['issues'] = issue_texts[codes] if len(codes) else ''
+        report['ok'] = (flags & ((1 << len(errors)) - 1)) == 0
+
+        if self.verbose:
+            print(f"Preflight of {len(report)} rows in {self.csv_input_file}: {(~report['ok']).sum()} rows with errors, "
+                  f"{(report['ok'] & (flags > 0)).sum()} more with warnings")
+        return report
+
+    @staticmethod
+    def __month_and_day(month, day):
+        """
+        The month and day of a row, the way prepare_posting() reads them
+        :return: Tuple of (month or None, day or None, True if they are a date)
+        """
+        try:
+            month, day = int(month), int(day)
+            date(2000, month, day)
+            return month, day, True
+        except ValueError:
+            return (month if isinstance(month, int) else None), (day if isinstance(day, int) else None), False
+
+    def __image_sizes(self, image_names):
+        """
+        The size of each image, found the way post_update() will look for it: at image_folder + image_name,
+        so an image name can include a subfolder. Each folder is listed once, rather than a stat() per row.
+        :param image_names: Image file names from the schedule, '' for a row without an image
+        :return: List of sizes in bytes, None where there is no image or it is not found
+        """
+        # Where image_folder + image_name is, for a name without a subfolder - like ('/photos', '') for '/photos/'
+        base_folder, prefix = os.path.split(self.image_folder)
+        by_folder = {}
+        for name in set(image_names):
+            if not name:
+                continue
+            if os.sep in name or (os.altsep and os.altsep in name):
+                folder, file_name = os.path.split(f"{self.image_folder}{name}")
+            else:
+                folder, file_name = base_folder, f"{prefix}{name}"
+            by_folder.setdefault(folder, []).append((name, file_name))
+        sizes = {}
+        for folder, names in by_folder.items():
+            try:
+                with os.scandir(folder or '.') as entries:
+                    listing = {entry.name: entry for entry in entries}
+            except OSError:
+                continue  # No such folder, so none of its images are there
+            for name, file_name in names:
+                entry = listing.get(file_name)
+                if entry is not None and entry.is_file():
+                    sizes[name] = entry.stat().st_size
+        return [sizes.get(name) for name in image_names]
+
     def __repr__(self):
         """
         A string representation explaining the object
@@ -82,5 +313,3 @@ class DataForUpdates:
         :return: String
         """
         return self.object_state
-
-
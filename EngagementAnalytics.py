@@ -0,0 +1,124 @@
+class EngagementAnalytics:
+    # Upper bounds of the text length and hours-since-the-previous-post groups
+    length_bins = (0, 100, 200, 300, 400, 500, float('inf'))
+    gap_bins = (0, 3, 6, 12, 24, 48, float('inf'))
+
+    def __init__(self, status_store, time_zone, verbose=False):
+        """
+        How the account's own posts perform - favourites, reblogs and replies - grouped by tag, by the
+        hour and day they were posted (in time_zone), by media or no media, by text length and by the
+        time since the previous post. Reads the counts StatusStore keeps for each status into pandas
+        once, and does every grouping on whole columns.
+        :param status_store: The StatusStore with the account's history
+        :param time_zone: Time zone for the posting hour and day, like 'America/Toronto'
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.status_store = status_store
+        self.time_zone = time_zone
+        self.verbose = verbose
+        self.posts = None
+        self.tags = None
+
+    def load(self):
+        """
+        Read the original posts (not reblogs) and their engagement counts from the store
+        :return: pandas DataFrame, one row per post
+        """
+        import pandas as pd  # Only needed for the analytics, so importing this module stays cheap
+
+        posts = self.__query(pd, """
+            SELECT statuses.id, statuses.created_at, length(statuses.text) AS text_length,
+                EXISTS (SELECT 1 FROM media WHERE media.status_id = statuses.id) AS has_media,
+                coalesce(engagement.favourites, 0) AS favourites, coalesce(engagement.reblogs, 0) AS reblogs,
+                coalesce(engagement.replies, 0) AS replies
+            FROM statuses LEFT JOIN engagement ON engagement.status_id = statuses.id
+            WHERE statuses.reblog_id IS NULL
+            ORDER BY statuses.created_at""")
+        posts['has_media'] = posts['has_media'].astype(bool)
+        posts['engagement'] = posts['favourites'] + posts['reblogs'] + posts['replies']
+        posted = pd.to_datetime(posts['created_at'], unit='s', utc=True).dt.tz_convert(self.time_zone)
+        posts['hour'] = posted.dt.hour
+        posts['weekday'] = posted.dt.day_name()
+        posts['hours_since_previous'] = posts['created_at'].diff() / 3600
+        self.posts = posts
+        self.tags = self.__query(pd, "SELECT status_id AS id, tag FROM status_tags")
+        print(f"Loaded {len(posts)} posts and {len(self.tags)} tags for the engagement analytics") if self.verbose else None
+        return posts
+
+    def __query(self, pd, query):
+        """
+        Run a query on the store into a DataFrame - with plain tuples rather than the store's sqlite3.Row
+        rows, which take several times longer to fetch
+        """
+        with self.status_store.lock:
+            cursor = self.status_store.db.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(query).fetchall()
+        return pd.DataFrame.from_records(rows, columns=[column[0] for column in cursor.description])
+
+    def __summarize(self, frame, by):
+        """
+        Count the posts and average their engagement for each value of by
+        :return: pandas DataFrame indexed by the group
+        """
+        summary = frame.groupby(by, observed=True).agg(
+            posts=('id', 'size'), favourites=('favourites', 'mean'), reblogs=('reblogs', 'mean'),
+            replies=('replies', 'mean'), engagement=('engagement', 'mean'), median_engagement=('engagement', 'median'))
+        return summary.round(2)
+
+    def by_tag(self, min_posts=5):
+        """
+        :param min_posts: Leave out tags used on fewer posts than this
+        :return: pandas DataFrame indexed by tag, best average engagement first
+        """
+        if self.posts is None:
+            self.load()
+        summary = self.__summarize(self.tags.merge(self.posts, on='id'), 'tag')
+        return summary[summary['posts'] >= min_posts].sort_values('engagement', ascending=False)
+
+    def by_hour(self):
+        if self.posts is None:
+            self.load()
+        return self.__summarize(self.posts, 'hour')
+
+    def by_weekday(self):
+        if self.posts is None:
+            self.load()
+        return self.__summarize(self.posts, 'weekday')
+
+    def by_media(self):
+        if self.posts is None:
+            self.load()
+        return self.__summarize(self.posts, 'has_media')
+
+    def by_length(self):
+        import pandas as pd
+        if self.posts is None:
+            self.load()
+        return self.__summarize(self.posts.assign(length=pd.cut(self.posts['text_length'], self.length_bins, right=False)), 'length')
+
+    def by_gap(self):
+        """
+        Engagement by the hours since the previous post - how soon is too soon to post again
+        :return: pandas DataFrame indexed by range of hours
+        """
+        import pandas as pd
+        if self.posts is None:
+            self.load()
+        return self.__summarize(self.posts.assign(gap=pd.cut(self.posts['hours_since_previous'], self.gap_bins)), 'gap')
+
+    def report(self, min_posts=5):
+        """
+        Every grouping at once
+        :param min_posts: Leave out tags used on fewer posts than this
+        :return: Dictionary of name -> pandas DataFrame
+        """
+        self.load()
+        return {
+            'tag': self.by_tag(min_posts),
+            'hour': self.by_hour(),
+            'weekday': self.by_weekday(),
+            'media': self.by_media(),
+            'length': self.by_length(),
+            'hours_since_previous': self.by_gap()
+        }
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import math
+import os
+
+
+def _load_pillow():
+    """
+    Import Pillow the first time an image is prepared, rather than whenever this module is imported
+    :return: Tuple of the (Image, ImageOps) modules, or (None, None) if Pillow is not installed
+    """
+    try:
+        from PIL import Image, ImageOps  # https://pillow.readthedocs.io/
+        return Image, ImageOps
+    except ImportError:  # Pillow is optional - without it images are uploaded as they are
+        return None, None
+
+
+class ImagePreparer:
+    # Mastodon itself downscales images bigger than 3840x2160, so there is no point uploading more pixels
+    default_max_pixels = 3840 * 2160
+    default_max_bytes = 16 * 1024 * 1024
+    # Image.info keys that carry metadata (camera details, GPS location, editing history) rather than pixels
+    metadata_keys = frozenset(('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop'))
+
+    def __init__(self, cache_folder, max_pixels=None, max_bytes=None, jpeg_quality=85, verbose=False):
+        """
+        Prepares images before they are uploaded: resizes them to the server's limits, recompresses
+        them and strips their metadata. The optimized images are cached by the hash of the original
+        file, and the media IDs of uploads are remembered too, so a retried post reuses an upload.
+        :param cache_folder: Folder for the optimized images and the uploaded-media.json map
+        :param max_pixels: Maximum width x height to upload
+        :param max_bytes: Maximum file size to upload
+        :param jpeg_quality: JPEG quality to recompress with (1 to 95)
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.cache_folder = cache_folder
+        self.max_pixels = max_pixels if max_pixels else self.default_max_pixels
+        self.max_bytes = max_bytes if max_bytes else self.default_max_bytes
+        self.jpeg_quality = jpeg_quality
+        self.verbose = verbose
+        self.uploads_file = os.path.join(cache_folder, "uploaded-media.json")
+        os.makedirs(cache_folder, exist_ok=True)
+
+    def set_server_limits(self, image_matrix_limit=None, image_size_limit=None):
+        """
+        Lower max_pixels and max_bytes to the limits the server reports, if they are lower
+        :param image_matrix_limit: configuration.media_attachments.image_matrix_limit from Mastodon.instance()
+        :param image_size_limit: configuration.media_attachments.image_size_limit from Mastodon.instance()
+        :return: None
+        """
+        if image_matrix_limit:
+            self.max_pixels = min(self.max_pixels, int(image_matrix_limit))
+        if image_size_limit:
+            self.max_bytes = min(self.max_bytes, int(image_size_limit))
+
+    @staticmethod
+    def content_hash(file_name):
+        """
+        SHA-256 of a file's contents, read in chunks
+        :return: 64 character hex string
+        """
+        sha = hashlib.sha256()
+        with open(file_name, "rb") as infile:
+            for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def prepare(self, file_name):
+        """
+        Return the file to upload for this image: the cached optimized copy if there is one, otherwise
+        a newly optimized copy, or the original if it is within the limits, has no metadata to strip and
+        can't be made any smaller. Animated images are always uploaded as they are.
+        :param file_name: Full path of the original image
+        :return: Tuple of (file name to upload, content hash of the original)
+        """
+        original_hash = self.content_hash(file_name)
+        for extension in ('jpeg', 'png'):
+            cached_file = os.path.join(self.cache_folder, f"{original_hash}.{extension}")
+            if os.path.isfile(cached_file):
+                print(f"Using the cached optimized image {cached_file}") if self.verbose else None
+                return cached_file, original_hash
+        Image, ImageOps = _load_pillow()
+        if Image is None:
+            print("Pillow is not installed, uploading the image without optimizing it") if self.verbose else None
+            return file_name, original_hash
+
+        original_size = os.path.getsize(file_name)
+        temp_file = os.path.join(self.cache_folder, f"{original_hash}.tmp")
+        try:
+            with Image.open(file_name) as img:
+                if getattr(img, 'is_animated', False):
+                    return file_name, original_hash  # Pillow would only keep the first frame
+                source_format = img.format
+                has_metadata = bool(self.metadata_keys.intersection(img.info)) or bool(getattr(img, 'text', None))
+                has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+                original_pixels = img.width * img.height
+                too_big = original_pixels > self.max_pixels or original_size > self.max_bytes
+                if source_format != 'JPEG' and not too_big and not has_metadata:
+                    return file_name, original_hash  # Nothing to gain from converting a small PNG, GIF or WebP
+                img = ImageOps.exif_transpose(img)  # Keep the orientation before the EXIF data is dropped
+                if original_pixels > self.max_pixels:
+                    scale = math.sqrt(self.max_pixels / original_pixels)
+                    img = img.resize((max(int(img.width * scale), 1), max(int(img.height * scale), 1)), Image.LANCZOS)
+                # Photos stay JPEG, and other images become JPEG when they are too big - unless they have
+                # transparency, which is kept in a lossless PNG if that fits
+                output_format = 'JPEG' if source_format == 'JPEG' or (too_big and not has_alpha) else 'PNG'
+                if output_format == 'PNG':
+                    # Saving without exif= or pnginfo= leaves all the metadata behind
+                    if img.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+                        img = img.convert('RGBA' if has_alpha else 'RGB')
+                    img.save(temp_file, format='PNG', optimize=True)
+                    if os.path.getsize(temp_file) > self.max_bytes:
+                        output_format = 'JPEG'
+                        img = self.__flatten(img.convert('RGBA'))
+                if output_format == 'JPEG':
+                    self.__save_jpeg(img, temp_file)
+        except (OSError, ValueError) as e:
+            print(f"Unable to optimize {file_name}, will upload it as it is: {e}") if self.verbose else None
+            if os.path.isfile(temp_file):
+                os.remove(temp_file)
+            return file_name, original_hash
+
+        optimized_size = os.path.getsize(temp_file)
+        if optimized_size >= original_size and not too_big and not has_metadata:
+            os.remove(temp_file)
+            print(f"{file_name} is already as small as it gets, uploading the original") if self.verbose else None
+            return file_name, original_hash
+        # Smaller, or the only copy without the EXIF (and any GPS location) of the original
+        cached_file = os.path.join(self.cache_folder, f"{original_hash}.{output_format.lower()}")
+        os.replace(temp_file, cached_file)
+        print(f"Optimized {file_name} from {original_size:,} to {optimized_size:,} bytes") if self.verbose else None
+        return cached_file, original_hash
+
+    def __save_jpeg(self, img, temp_file):
+        """
+        Save as JPEG, lowering the quality in steps (down to 40) until the file fits max_bytes
+        """
+        if img.mode not in ('RGB', 'L'):
+            img = self.__flatten(img.convert('RGBA'))
+        quality = self.jpeg_quality
+        while True:
+            # Saving without exif= or icc_profile= leaves all the metadata behind
+            img.save(temp_file, format='JPEG', quality=quality, optimize=True, progressive=True)
+            if os.path.getsize(temp_file) <= self.max_bytes or quality <= 40:
+                return
+            quality -= 10
+
+    @staticmethod
+    def __flatten(img):
+        """
+        JPEG has no transparency: put an RGBA image on a white background
+        """
+        background = img.convert('RGB')
+        # White, wherever the image is (partly) transparent
+        background.paste((255, 255, 255), mask=img.getchannel('A').point(lambda alpha: 255 - alpha))
+        return background
+
+    def __upload_key(self, content_hash, description):
+        return f"{content_hash}|{hashlib.sha256((description or '').encode('utf-8')).hexdigest()[:16]}"
+
+    def __read_uploads(self):
+        if not os.path.isfile(self.uploads_file):
+            return {}
+        try:
+            with open(self.uploads_file, "r", encoding="utf-8") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_uploads(self, uploads):
+        temp_file = f"{self.uploads_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as outfile:
+            json.dump(uploads, outfile, indent=1)
+        os.replace(temp_file, self.uploads_file)
+
+    def uploaded_media_id(self, content_hash, description):
+        """
+        The media ID of an earlier upload of the same image with the same description (ALT text)
+        that has not yet been used in a status
+        :return: Media ID, or None
+        """
+        return self.__read_uploads().get(self.__upload_key(content_hash, description))
+
+    def remember_upload(self, content_hash, description, media_id):
+        uploads = self.__read_uploads()
+        uploads[self.__upload_key(content_hash, description)] = str(media_id)
+        self.__write_uploads(uploads)
+
+    def forget_upload(self, content_hash, description):
+        """
+        Drop a remembered upload, once it has been used in a status (the server won't let one media
+        attachment be used in two statuses) or if the server no longer has it
+        :return: None
+        """
+        uploads = self.__read_uploads()
+        if uploads.pop(self.__upload_key(content_hash, description), None) is not None:
+            self.__write_uploads(uploads)
@@ -0,0 +1,121 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import json
+import os
+import threading
+from datetime import datetime
+
+
+class LogBuffer:
+    def __init__(self, column_names=("task", "details", "timestamp"), flush_file=None, flush_format=None,
+                 flush_every=100, max_bytes=10_000_000, backup_count=5):
+        """
+        An append-only log. Rows are kept as tuples in a plain list (amortized O(1) to append), and
+        can be flushed incrementally to a CSV or JSONL file that is rotated once it gets too big.
+        :param column_names: Names of the columns in each row
+        :param flush_file: File to append the rows to as they are logged, or None to keep them in memory only
+        :param flush_format: 'csv' or 'jsonl' - if None, taken from the flush_file extension
+        :param flush_every: Number of new rows that triggers a flush to flush_file
+        :param max_bytes: Rotate flush_file once it is at least this size
+        :param backup_count: Number of rotated files to keep (flush_file.1, flush_file.2, ...)
+        """
+        self.column_names = tuple(column_names)
+        self.flush_file = flush_file
+        if flush_format is None and flush_file:
+            flush_format = 'jsonl' if flush_file.endswith(('.jsonl', '.json')) else 'csv'
+        self.flush_format = flush_format
+        self.flush_every = flush_every
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rows = []
+        self.flushed_rows = 0  # rows[:flushed_rows] have already been written to flush_file
+        self.dropped_rows = 0  # Rows written to flush_file and then dropped from memory by flush(drop=True)
+        self.flush_lock = threading.Lock()  # Rows can be logged from a background thread, like the streaming listener
+
+    def append(self, *values):
+        """
+        Add one row to the log, stamped with the current time
+        :param values: One value for each column except the last (timestamp) column
+        :return: None
+        """
+        self.rows.append((*values, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        if self.flush_file and len(self.rows) - self.flushed_rows >= self.flush_every:
+            self.flush()
+
+    def flush(self, drop=False):
+        """
+        Append any rows not yet written to the flush_file, rotating the file first if it is too big
+        :param drop: Set to TRUE to also drop the written rows from memory, so a long running process
+                     (like PostingDaemon) doesn't hold its whole log - only done if there is a flush_file
+        :return: Number of rows written
+        """
+        with self.flush_lock:
+            written = self.__flush()
+            if drop and self.flush_file and self.flushed_rows:
+                # Rows appended from another thread during the flush are after flushed_rows, so they stay
+                del self.rows[:self.flushed_rows]
+                self.dropped_rows += self.flushed_rows
+                self.flushed_rows = 0
+            return written
+
+    def __flush(self):
+        new_rows = self.rows[self.flushed_rows:]
+        if not self.flush_file or not new_rows:
+            return 0
+        self.__rotate_if_needed()
+        new_file = not os.path.isfile(self.flush_file)
+        with open(self.flush_file, "a", newline='', encoding="utf-8") as outfile:
+            if self.flush_format == 'jsonl':
+                for row in new_rows:
+                    outfile.write(json.dumps(dict(zip(self.column_names, row)), default=str) + "\n")
+            else:
+                writer = csv.writer(outfile)
+                if new_file:
+                    writer.writerow(self.column_names)
+                writer.writerows(new_rows)
+        self.flushed_rows += len(new_rows)
+        return len(new_rows)
+
+    def __rotate_if_needed(self):
+        """
+        Rotate flush_file to flush_file.1 (and .1 to .2, and so on) once it reaches max_bytes
+        :return: None
+        """
+        if not self.max_bytes or not os.path.isfile(self.flush_file) or os.path.getsize(self.flush_file) < self.max_bytes:
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.isfile(f"{self.flush_file}.{i}"):
+                os.replace(f"{self.flush_file}.{i}", f"{self.flush_file}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.flush_file, f"{self.flush_file}.1")
+        else:
+            os.remove(self.flush_file)
+
+    def write_csv(self, file_name):
+        """
+        Stream every row still held in the log to a new CSV file, without building a DataFrame first -
+        rows dropped by flush(drop=True) are only in the flush_file
+        :param file_name: Full path of the CSV file to write
+        :return: None
+        """
+        with open(file_name, "w", newline='', encoding="utf-8") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow(self.column_names)
+            writer.writerows(self.rows)
+
+    def to_dataframe(self):
+        """
+        Build a pandas DataFrame of the rows still held in the log - only done when asked for
+        :return: pandas DataFrame
+        """
+        import pandas as pd
+        return pd.DataFrame.from_records(self.rows, columns=list(self.column_names))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __repr__(self):
+        return (f"LogBuffer with {len(self.rows)} rows ({self.flushed_rows} flushed to {self.flush_file}, "
+                f"{self.dropped_rows} more dropped after flushing)")
@@ -1,25 +1,64 @@
-from mastodon import Mastodon
+# Mastodon.py (and requests under it) is only imported when a wrapper object is created, so a script
+# can import this module, check its local state and exit early without paying for those imports
 from datetime import datetime, timedelta
 import pytz
-import pandas as pd
 import os
 import time
 import random
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from LogBuffer import LogBuffer
+from ProfileCache import ProfileCache
+from StatusStore import StatusStore
+from StatusRecord import text_fingerprint
+from SearchIndex import SearchIndex
+from ArchiveImporter import ArchiveImporter
+from MediaInventory import MediaInventory
+from EngagementAnalytics import EngagementAnalytics
+from ImagePreparer import ImagePreparer
+from RequestScheduler import RequestScheduler
+from SpanRecorder import SpanRecorder, count_transfer_bytes, timed
 
 class MastodonWrapper:
-    def __init__(self, base_url, access_token, time_zone, ok_to_post, pause_seconds=8, verbose=False):
+    def __init__(self, base_url, access_token, time_zone, ok_to_post, pause_seconds=8, verbose=False, log_file=None,
+                 profile_cache_file=None, profile_cache_ttl=86400, status_store_file=None, session=None,
+                 media_ready_timeout=60, image_cache_folder=None, request_scheduler=None, span_recorder=None,
+                 mastodon_client=None, clock=None):
         self.object_state = "Unable to connect"
+        # clock: returns the current UTC epoch seconds - time.time, unless a simulation supplies a virtual clock
+        self.clock = clock if clock else time.time
+        # Timings of every API call and stage - pass in a SpanRecorder to share it with the calling script,
+        # or to export the spans (SpanRecorder(export_file=...) is written out with the log)
+        self.spans = span_recorder if span_recorder is not None else SpanRecorder()
         self.base_url = base_url
         self.access_token = access_token
         self.time_zone = time_zone
         self.local_timezone = pytz.timezone(self.time_zone)
         self.verbose = verbose  # If set to TRUE will print out debug information
         self.ok_to_post = ok_to_post
-        self.pause_seconds = pause_seconds
-        self.recent_toots = False
+        self.pause_seconds = pause_seconds  # Longest wait between polls of media processing, and the fallback pause
+        self.media_ready_timeout = media_ready_timeout
+        self.media_poll_first_delay = 0.25
+        # Optional - optimize images before uploading them, and cache the results in image_cache_folder
+        self.image_preparer = ImagePreparer(image_cache_folder, verbose=verbose) if image_cache_folder else None
+        self.server_limits_checked = False
+        self.prepared_media = {}  # (full_image_name, image_text) -> (media, content hash), uploaded by prepare_upload()
+        # Optional on-disk cache of the account profile, to skip account_verify_credentials() on repeat runs
+        self.profile_cache = ProfileCache(profile_cache_file, profile_cache_ttl, verbose) if profile_cache_file else None
+        self.profile_from_cache = False
+        # Local SQLite copy of the account's statuses - in memory only unless status_store_file is given
+        self.status_store = StatusStore(status_store_file, verbose)
+        self.statuses_synced = False
+        self.search_index = None  # Full text index of the store, set up by the first search()
+        # Every media attachment posted, and the local image files they came from, for image_posted_before()
+        self.media_inventory = MediaInventory(self.status_store, verbose)
+        # Optional streaming API subscription that keeps the store current - see start_streaming()
+        self.stream_listener = None
+        self.stream_thread = None
+        self.stream_stop = threading.Event()
         self.log_column_names = ["task", "details", "timestamp"]
-        self.log = pd.DataFrame(columns=self.log_column_names)
+        # Append-only log, optionally flushed as it grows to log_file (.csv or .jsonl, rotated when large)
+        self.log = LogBuffer(self.log_column_names, flush_file=log_file)
 
         # Will use some ANSI colours - not TOO many
         self.color_reset = '\033[0m'
@@ -29,17 +68,28 @@ class MastodonWrapper:
 
 
 
-        # Connect to the Mastodon server - this never seemed to return an error
-        self.m_object = Mastodon(access_token=self.access_token, api_base_url=self.base_url)
+        # Every call to the server goes through the scheduler, which keeps within the rate limits
+        self.scheduler = request_scheduler if request_scheduler else RequestScheduler(verbose=verbose)
+
+        if mastodon_client is not None:
+            # Anything with the Mastodon methods the wrapper calls, like ScheduleSimulator's in-memory SimulatedAccount
+            self.m_object = mastodon_client
+        else:
+            from mastodon import Mastodon
+
+            # Connect to the Mastodon server - this never seemed to return an error
+            # session: optional requests.Session, so several wrappers can share one connection pool
+            # ratelimit_method='throw': the scheduler, not Mastodon.py, decides how long to wait
+            self.m_object = Mastodon(access_token=self.access_token, api_base_url=self.base_url, session=session,
+                                     ratelimit_method='throw')
+            if count_transfer_bytes not in self.m_object.session.hooks['response']:
+                self.m_object.session.hooks['response'].append(count_transfer_bytes)
         self.to_log("mastodon-connect", f"base URL: >{self.base_url}<")
 
         # Step 3. Get details of the user associated with the token, specifically
         # the user ID associated with the mastodon server we've connected to
         try:
-            self.user_id = self.m_object.account_verify_credentials()['id']
-            self.user_name = self.m_object.account_verify_credentials()['username']
-            self.display_name = self.m_object.account_verify_credentials()['display_name']
-
+            self.__load_profile()
         except Exception as e:
             self.object_state = f"Error 7121 connecting to {self.base_url}:\n\tAPI: {self.access_token[:3]}...{self.access_token[-3:]} \n\tMastodonError: {e}"
             print(self.object_state) if verbose else None
@@ -55,13 +105,93 @@ class MastodonWrapper:
             print(f"\t          id: {self.user_id}'")
         self.object_state = "Connected to server"
 
+    @timed('load_profile')
+    def __load_profile(self, use_cache=True):
+        """
+        Set user_id, user_name and display_name - from the profile cache if there is a fresh entry,
+        otherwise from a single call to account_verify_credentials()
+        :param use_cache: Set to False to skip the cache and always ask the server
+        :return: None
+        """
+        profile = None
+        if use_cache and self.profile_cache:
+            profile = self.profile_cache.get(self.base_url, self.access_token)
+        self.profile_from_cache = profile is not None
+        if profile:
+            print(f"Using the cached profile from {self.profile_cache.cache_file}") if self.verbose else None
+            self.to_log("mastodon-profile-cache", "Using cached account profile")
+        else:
+            profile = self.__timed_call('account_verify_credentials')
+            if self.profile_cache:
+                self.profile_cache.put(self.base_url, self.access_token, profile)
+        self.user_id = profile['id']
+        self.user_name = profile['username']
+        self.display_name = profile['display_name']
+
+    def __call_api(self, method_name, *args, **kwargs):
+        """
+        Call one method of the Mastodon object, through the request scheduler so it stays within the
+        server's rate limits. If the account profile came from the profile cache and the call is refused
+        (401), or a call for the cached account ID finds no such account (404), the cached profile may be
+        stale: revalidate it with the server and try the call once more. Any other 404, like a media
+        attachment the server has dropped, is raised as it is.
+        :param method_name: Name of the Mastodon method, like 'account_statuses'
+        :return: Whatever the Mastodon method returns
+        """
+        from mastodon import MastodonUnauthorizedError, MastodonNotFoundError
+        try:
+            return self.__timed_call(method_name, *args, **kwargs)
+        except (MastodonUnauthorizedError, MastodonNotFoundError) as e:
+            if not self.profile_from_cache:
+                raise
+            if isinstance(e, MastodonNotFoundError) and kwargs.get('id') != self.user_id:
+                raise
+            print(f"Call to {method_name}() failed with the cached profile, revalidating: {e}") if self.verbose else None
+            self.to_log("mastodon-profile-revalidate", f"{method_name}() failed with the cached profile: {e}")
+            old_user_id = self.user_id
+            self.profile_cache.invalidate(self.base_url, self.access_token)
+            self.__load_profile(use_cache=False)
+            if kwargs.get('id') == old_user_id:
+                kwargs['id'] = self.user_id
+            return self.__timed_call(method_name, *args, **kwargs)
+
+    def __timed_call(self, method_name, *args, **kwargs):
+        """
+        Make one call through the scheduler as an 'api.<method_name>' span, counting the calls and retries
+        """
+        retries_before = self.scheduler.retries
+        with self.spans.span(f"api.{method_name}") as span:
+            self.spans.count('api_calls')
+            try:
+                return self.scheduler.call(self.m_object, method_name, *args, **kwargs)
+            finally:
+                retries = self.scheduler.retries - retries_before
+                if retries:
+                    span.attributes['retries'] = retries
+                    self.spans.count('api_retries', retries)
+
+    def rate_limit_status(self):
+        """
+        The current rate limit budget for each endpoint class, and the number of calls waiting for it,
+        so batch jobs can run as fast as the server allows
+        :return: Dictionary with 'budget' (see RequestScheduler.budget()), 'queue_depth', 'calls' and 'retries'
+        """
+        return {
+            'budget': self.scheduler.budget(),
+            'queue_depth': self.scheduler.queue_depth(),
+            'calls': self.scheduler.calls,
+            'retries': self.scheduler.retries
+        }
+
+    @timed('post_update')
     def post_update(self, details, verbose=False):
         """
         Ready to post an update to the Mastodon serve, with the data in the details dictionary
         :param details: A dictionary with the details of this one update
         :param verbose: Set to TRUE to have some debug and status info printed
-        :return:
+        :return: The status dictionary returned by status_post(), or None if nothing was posted
         """
+        from mastodon import MastodonAPIError
         include_image = False
         possible_keyboard_input = random.choice('wrpsdfghjkzvmb')
         if len(details['image_name']) > 0:
@@ -71,19 +201,35 @@ class MastodonWrapper:
             if os.path.isfile(details['full_image_name']):
                 self.to_log("File exists", f"Will upload the file {details['full_image_name']}")
                 self.to_log("Image ALT text", details['image_text'])
+                self.image_posted_before(details['full_image_name'], verbose=verbose)
                 if self.__user_ok_to_post(self.ok_to_post, possible_keyboard_input, details):
-                    m_image_post = self.m_object.media_post(media_file=details['full_image_name'], description=details['image_text'])
-                    self.to_log("Image post results", m_image_post)
-                    self.to_log("Image ID", m_image_post['id'])
-                    print(f"Image was uploaded, now pausing for {self.pause_seconds} seconds before posting the update itself...")
-                    time.sleep(self.pause_seconds)
+                    m_image_post, content_hash = self.__upload_image(details, verbose=verbose)
                     print("... posting the status now.")
-                    res = self.m_object.status_post(status=details['full_update_text'],
-                                                    media_ids=m_image_post['id'],
-                                                    spoiler_text=details.get('spoiler_text', None),
-                                                    sensitive=details.get('sensitive', False)
-                                                    )
+                    try:
+                        res = self.__call_api('status_post', status=details['full_update_text'],
+                                              media_ids=m_image_post['id'],
+                                              spoiler_text=details.get('spoiler_text', None),
+                                              sensitive=details.get('sensitive', False)
+                                              )
+                    except MastodonAPIError as e:
+                        if not m_image_post.get('reused'):
+                            raise
+                        # The earlier upload can't be used after all - upload the image again and retry once
+                        self.to_log("Reused image rejected", f"Media {m_image_post['id']}: {e}")
+                        if self.image_preparer:
+                            self.image_preparer.forget_upload(content_hash, details['image_text'])
+                        m_image_post, content_hash = self.__upload_image(details, verbose=verbose)
+                        res = self.__call_api('status_post', status=details['full_update_text'],
+                                              media_ids=m_image_post['id'],
+                                              spoiler_text=details.get('spoiler_text', None),
+                                              sensitive=details.get('sensitive', False)
+                                              )
+                    if self.image_preparer:
+                        self.image_preparer.forget_upload(content_hash, details['image_text'])
                     self.to_log("Image status_post()", res)
+                    self.media_inventory.link(m_image_post['id'], details['full_image_name'])
+                    self.__store_posted(res)
+                    return res
                 else:
                     print("Did NOT upload photo to Mastodon, but was ready to.")
                     self.to_log("Did NOT call media_post()", "Was ready to post image to Mastodon, but the variable was set to False")
@@ -95,15 +241,134 @@ class MastodonWrapper:
         else:
             print(f"Now create the API call we'll need using Mastodon.status_post():\n{details['full_update_text']}")
             if self.__user_ok_to_post(self.ok_to_post, possible_keyboard_input, details):
-                res = self.m_object.status_post(status=details['full_update_text'],
-                                                spoiler_text=details.get('spoiler_text', None),
-                                                sensitive=details.get('sensitive', False)
-                                                )
+                res = self.__call_api('status_post', status=details['full_update_text'],
+                                      spoiler_text=details.get('spoiler_text', None),
+                                      sensitive=details.get('sensitive', False)
+                                      )
                 self.to_log("No image status_post()", res)
+                self.__store_posted(res)
+                return res
             else:
                 print("Did NOT post to Mastodon, but was ready to.")
                 self.to_log("Did NOT call status_post()", "Was ready to post to Mastodon, but the variable was set to False")
 
+    def __store_posted(self, status):
+        """
+        While following the user stream, add a new post to the status store at once - the stream's copy of
+        it may not arrive before the next already_posted() check. Otherwise the next sync_statuses() fetches it,
+        along with anything posted from elsewhere just before it.
+        """
+        if self.streaming():
+            self.status_store.add_statuses([status])
+        else:
+            self.statuses_synced = False
+
+    @timed('upload_image')
+    def __upload_image(self, details, verbose=False):
+        """
+        Upload the image for a posting and wait for the server to process it. With an image_cache_folder,
+        the image is optimized first, and an earlier upload of the same image and ALT text that was
+        never used (say the status post failed) is reused instead of uploading it again.
+        :param details: A dictionary with the details of this one update
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: Tuple of (media dictionary, content hash of the original image or None)
+        """
+        from mastodon import MastodonAPIError
+        prepared = self.prepared_media.pop((details['full_image_name'], details['image_text']), None)
+        if prepared:
+            # Uploaded ahead of time by prepare_upload() - if the server has dropped it since, post_update() uploads it again
+            prepared[0]['reused'] = True
+            return prepared
+        upload_file = details['full_image_name']
+        content_hash = None
+        if self.image_preparer:
+            if not self.server_limits_checked:
+                self.server_limits_checked = True
+                try:
+                    limits = self.__call_api('instance').get('configuration', {}).get('media_attachments', {})
+                    self.image_preparer.set_server_limits(limits.get('image_matrix_limit'), limits.get('image_size_limit'))
+                except Exception as e:
+                    print(f"Unable to read the server's media limits, using the defaults: {e}") if verbose else None
+            upload_file, content_hash = self.image_preparer.prepare(details['full_image_name'])
+            media_id = self.image_preparer.uploaded_media_id(content_hash, details['image_text'])
+            if media_id:
+                try:
+                    m_image_post = self.__call_api('media', media_id)
+                    m_image_post['reused'] = True
+                    print(f"Reusing the earlier upload of this image, media ID {media_id}")
+                    self.to_log("Image reused", media_id)
+                    self.wait_for_media(m_image_post, verbose=verbose)
+                    return m_image_post, content_hash
+                except MastodonAPIError as e:
+                    self.to_log("Image upload expired", f"Media {media_id}: {e}")
+                    self.image_preparer.forget_upload(content_hash, details['image_text'])
+
+        m_image_post = self.__call_api('media_post', media_file=upload_file, description=details['image_text'])
+        self.to_log("Image post results", m_image_post)
+        self.to_log("Image ID", m_image_post['id'])
+        if self.image_preparer:
+            self.image_preparer.remember_upload(content_hash, details['image_text'], m_image_post['id'])
+        print("Image was uploaded, now waiting for the server to finish processing it...")
+        self.wait_for_media(m_image_post, verbose=verbose)
+        return m_image_post, content_hash
+
+    @timed('prepare_upload')
+    def prepare_upload(self, details, verbose=False):
+        """
+        Upload the image for a posting ahead of time and wait until the server has processed it, so
+        post_update() for the same posting can post straight away
+        :param details: A dictionary with the details of this one update
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: The media dictionary, or None if the posting has no image or the image file is missing
+        """
+        if not details['image_name'] or not os.path.isfile(details['full_image_name']):
+            return None
+        key = (details['full_image_name'], details['image_text'])
+        if key not in self.prepared_media:
+            self.prepared_media[key] = self.__upload_image(details, verbose=verbose)
+            self.to_log("Image prepared", self.prepared_media[key][0]['id'])
+        return self.prepared_media[key][0]
+
+    @timed('wait_for_media')
+    def wait_for_media(self, media, verbose=False):
+        """
+        Wait until an uploaded media attachment has been processed by the server, polling its state with
+        exponential backoff (the server sets the 'url' once processing is done). Only if the server gives
+        no readiness signal does this fall back to pausing for pause_seconds.
+        :param media: Media dictionary returned by media_post()
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: Seconds waited until the media was ready
+        """
+        start_time = time.monotonic()
+        delay = self.media_poll_first_delay
+        while True:
+            if 'url' not in media:  # No readiness signal from this server at all
+                break
+            if media['url'] is not None:
+                ready_seconds = time.monotonic() - start_time
+                print(f"Image {media['id']} was ready after {ready_seconds:.2f} seconds") if verbose else None
+                self.to_log("Image ready", f"Media {media['id']} ready after {ready_seconds:.3f} seconds")
+                return ready_seconds
+            if time.monotonic() - start_time + delay > self.media_ready_timeout:
+                print(f"Image {media['id']} still not processed after {self.media_ready_timeout} seconds, posting anyway")
+                self.to_log("Image not ready", f"Media {media['id']} not processed after {self.media_ready_timeout} seconds")
+                return time.monotonic() - start_time
+            time.sleep(delay)
+            delay = min(delay * 2, self.pause_seconds)
+            try:
+                media = self.__call_api('media', media['id'])
+            except Exception as e:
+                print(f"Unable to check on the processing of image {media['id']}: {e}") if verbose else None
+                break
+
+        # Fall back to the fixed pause, less any time already spent polling
+        remaining = max(self.pause_seconds - (time.monotonic() - start_time), 0)
+        print(f"No processing state for image {media['id']}, pausing for {remaining:.1f} seconds") if verbose else None
+        time.sleep(remaining)
+        ready_seconds = time.monotonic() - start_time
+        self.to_log("Image ready", f"Media {media['id']}: no readiness signal, paused {ready_seconds:.3f} seconds")
+        return ready_seconds
+
     def time_for_next_post(self, delay, verbose=False):
         """
         Many bots have a delay between posts - this method will return the time the next
@@ -113,85 +378,201 @@ class MastodonWrapper:
         :return: A datetime string
         """
         hours_since = self.hours_since_last_post()
-        current_time = datetime.now(self.local_timezone)
-        return current_time + timedelta(hours=(delay-hours_since))
+        current_time = datetime.fromtimestamp(self.clock(), self.local_timezone)
+        return current_time + timedelta(hours=max(delay-hours_since, 0))
 
+    @timed('hours_since_last_post')
     def hours_since_last_post(self, verbose=False):
         """Calculate the number of hours since the last Mastodon toot
 
         :param verbose: Set to TRUE to have some debug and status info printed
         :return: number of hours since last Mastodon toot
         """
-        if not self.recent_toots:  # Don't want to read this again and again
-            print(f"Call account_status() to get recent toots") if verbose else None
-            self.recent_toots = self.m_object.account_statuses(id=self.user_id)
-
-        i = self.recent_toots[0]
+        self.sync_statuses(verbose=verbose)
+        latest = self.status_store.latest(1)
+        if not latest:
+            print("No postings by this user yet") if verbose else None
+            self.to_log("mastodon-hours_since_post", "No postings yet")
+            return float('inf')
+        i = latest[0]
 
-        post_datetime_utc = i['created_at'].astimezone(pytz.timezone('UTC'))
+        post_datetime_utc = datetime.fromtimestamp(i.created_at, pytz.timezone('UTC'))
         local_timezone = self.local_timezone
         local_time = post_datetime_utc.astimezone(local_timezone)
-        current_local_time = datetime.now(self.local_timezone)
+        current_local_time = datetime.fromtimestamp(self.clock(), self.local_timezone)
         time_difference = current_local_time - local_time
         hours_ago = time_difference.total_seconds() / 3600
 
         if verbose:
-            print(f"\nMost recent user posting:\n\t{i['content'][:100]}")
-            print(f"\tCreated: {i['created_at']}")   # like 2023-12-11 21:12:47.197000+00:00
+            print(f"\nMost recent user posting:\n\t{i.text[:100]}")
             print(f"\tUTC time:", post_datetime_utc)
             print(f"\t{self.time_zone} time:", local_time)
             print(f"\t{hours_ago:.2f} hours ago")
         self.to_log("mastodon-hours_since_post", hours_ago)
         return hours_ago
 
-    def simple_recent(self, verbose=False):
+    def simple_recent(self, limit=20, verbose=False):
         """
         Prints out the details of the most recent Mastodon toots. Nothing too sophisticated
         yet, just a demonstration of including this code in the object.
+        :param limit: Number of toots to print
         :param verbose: Set to TRUE to have some debug and status info printed
         :return: None
         """
-        if not self.recent_toots:  # Don't want to read this again and again
-            print(f"Call account_status() to get recent toots") if verbose else None
-            self.recent_toots = self.m_object.account_statuses(id=self.user_id)
-        for i in self.recent_toots:
-            # See https://mastodonpy.readthedocs.io/en/stable/02_return_values.html#toot-status-dicts for all returned values in the dictionary
-            if not i['reblog']:  # An original post by this user
-                print(f"\nUser posting:: {i['content'][:100]}")
-                print(f"\tVisibility: {i['visibility']}")
-                print(f"\tCreated: {i['created_at']}")
-                print(f"\tTags: {i['tags']}")
-                print(f"\tMedia: {i['media_attachments']}")
-                print(f"\tMentions: {i['mentions']}")
-                print(f"\turl: {i['url']}")
+        self.sync_statuses(verbose=verbose)
+        for i in self.status_store.latest(limit):
+            created_at = datetime.fromtimestamp(i.created_at, self.local_timezone)
+            if not i.reblog_id:  # An original post by this user
+                print(f"\nUser posting:: {i.text[:100]}")
+                print(f"\tVisibility: {i.visibility}")
+                print(f"\tCreated: {created_at}")
+                print(f"\tTags: {list(i.tags)}")
+                print(f"\tMedia: {[dict(media) for media in self.status_store.media_for(i.id)] if i.media_ids else []}")
+                print(f"\tMentions: {' '.join(i.mentions)}")
+                print(f"\turl: {i.url}")
             else:
                 print("\nA reblog by the user:")
-                print(f"\tContent: {i['reblog']['content'][:100]}")
-                print(f"\tCreated at: {i['reblog']['created_at']}")
-                print(f"\tReblog details: {i['reblog']}")
-                print(f"\tVisibility: {i['visibility']}")
+                print(f"\tContent: {i.reblog_text[:100]}")
+                print(f"\tCreated at: {datetime.fromtimestamp(i.reblog_created_at, self.local_timezone)}")
+                print(f"\tReblog ID: {i.reblog_id}")
+                print(f"\tVisibility: {i.visibility}")
+
+    @timed('search')
+    def search(self, query, limit=20, verbose=False):
+        """
+        Search all of this user's posts - the text, tags and image ALT text - for words and #tags.
+        The search index is kept with the status store, and only the statuses added since the last
+        search are indexed, so after the first time a search takes milliseconds.
+        :param query: Search words, like 'union station #OTD' - every word must match, and 'turbin*' matches any ending
+        :param limit: Maximum number of results
+        :param verbose: Set to TRUE to have the results printed
+        :return: List of dictionaries with 'record' (StatusRecord), 'score' (higher is better) and 'snippet', best match first
+        """
+        self.sync_statuses(verbose=verbose)
+        if self.search_index is None:
+            self.search_index = SearchIndex(self.status_store, verbose=verbose)
+        results = self.search_index.search(query, limit=limit)
+        self.to_log("search", f"{len(results)} results for >{query}<")
+        if verbose:
+            for result in results:
+                print(f"{result['score']:8.2f}  {datetime.fromtimestamp(result['record'].created_at, self.local_timezone):%Y-%m-%d}  "
+                      f"{result['snippet']}\n\t\t{result['record'].url}")
+        return results
+
+    @timed('refresh_engagement')
+    def refresh_engagement(self, workers=4, page_size=40, verbose=False):
+        """
+        Read the current favourites, reblogs and replies counts for every status in the store. The store's
+        IDs are split into windows of one less than page_size statuses, so a window is usually a single
+        account_statuses() call (since_id / max_id) that comes back short, and the windows can be fetched
+        at the same time - the request scheduler still keeps the calls within the rate limits. A full page
+        means the server has statuses in the window that the store does not, so that window keeps paging
+        until a short page comes back.
+        :param workers: Number of windows fetched at the same time
+        :param page_size: Statuses per page - 40 is the most Mastodon returns in one page
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: Number of statuses refreshed
+        """
+        self.sync_statuses(verbose=verbose)
+        ids = self.status_store.status_ids()
+        window_size = max(page_size - 1, 1)
+        windows = [(ids[i] - 1, ids[min(i + window_size, len(ids)) - 1] + 1) for i in range(0, len(ids), window_size)]
+
+        def fetch_window(window):
+            since_id, max_id = window
+            pages = []
+            while True:
+                page = self.__call_api('account_statuses', id=self.user_id, since_id=since_id, max_id=max_id, limit=page_size)
+                pages.append(page)
+                if len(page) < page_size:
+                    return pages
+                max_id = min(int(status['id']) for status in page)  # Newest first, so carry on below the oldest
+
+        refreshed = 0
+        calls = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Windows come back in order, and are only written to the store from this thread
+            for pages in executor.map(fetch_window, windows):
+                for page in pages:
+                    self.status_store.add_statuses(page)
+                    refreshed += len(page)
+                calls += len(pages)
+        print(f"Refreshed the engagement counts of {refreshed} statuses in {calls} calls") if verbose else None
+        self.to_log("refresh_engagement", f"{refreshed} statuses in {calls} calls")
+        return refreshed
+
+    @timed('engagement_report')
+    def engagement_report(self, refresh=False, min_posts=5, verbose=False):
+        """
+        How this user's posts perform, grouped by tag, posting hour and weekday (in time_zone), media or
+        no media, text length and hours since the previous post - see EngagementAnalytics
+        :param refresh: Set to TRUE to read the current counts for the whole history first (see refresh_engagement()),
+                        otherwise the counts are as of when each status was synced
+        :param min_posts: Leave out tags used on fewer posts than this
+        :param verbose: Set to TRUE to have the report printed
+        :return: Dictionary of name -> pandas DataFrame
+        """
+        if refresh:
+            self.refresh_engagement(verbose=verbose)
+        else:
+            self.sync_statuses(verbose=verbose)
+        report = EngagementAnalytics(self.status_store, self.time_zone, verbose=verbose).report(min_posts=min_posts)
+        if verbose:
+            for name, frame in report.items():
+                print(f"\nEngagement by {name}:\n{frame}")
+        return report
+
+    @timed('import_archive')
+    def import_archive(self, archive_file, verbose=False):
+        """
+        Fill the local status store from an account archive downloaded from the server, rather than paging
+        through the whole history with account_statuses(). Afterwards sync_statuses() only fetches the
+        statuses posted since the archive was made.
+        :param archive_file: The archive .zip file, or its outbox.json
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: Dictionary with the counts of 'statuses' imported, 'media' and 'skipped' activities
+        """
+        counts = ArchiveImporter(self.status_store, verbose=verbose).import_archive(archive_file)
+        self.statuses_synced = False  # So the next check fetches the statuses posted since the archive
+        self.to_log("import_archive", f"{archive_file}: {counts}")
+        return counts
 
     def media_files(self, verbose=False):
         """
-        List the media files already used by this user. (Does NOT include media files uploaded
-        but not actually used, unfortunately.
-        :param vebose: set to TRUE to have some debug and status info printed
-        :return: None
+        List every media attachment in the account's history, with the local file each was uploaded from
+        where that is known. (Does NOT include media files uploaded but not actually used.)
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: List of dictionaries, see MediaInventory.inventory()
         """
-        if not self.recent_toots:  # Don't want to read this again and again
-            print(f"Call account_status() to get recent toots") if verbose else None
-            self.recent_toots = self.m_object.account_statuses(id=self.user_id)
-
-        media_files = []
-        for status in self.recent_toots:
-            if 'media_attachments' in status:
-                # Should do more with this than just print it, but it is a start
-                media_files.extend(status['media_attachments'])
-        print("Details on the media used in this user's recent updates:")
-        for media in media_files:
-            # For all possible fields, see https://mastodonpy.readthedocs.io/en/stable/02_return_values.html#media-dicts
-            # TODO Add IF - different sorts of media have, or don't have, media['meta']['original']['size']
-            print(f"ID: {media['id']} ({media['type']} {media['meta']['original']['size']} px) \n\t{media['description']} \n\tURL: {media['url']}")
+        self.sync_statuses(verbose=verbose)
+        inventory = self.media_inventory.inventory()
+        print(f"Details on the {len(inventory)} media attachments in this user's updates:")
+        for media in inventory:
+            # Not every sort of media has dimensions, and the byte size is only known for files uploaded from here
+            dimensions = f"{media['width']}x{media['height']} px" if media['width'] else "no dimensions"
+            size = f", {media['file_size']:,} bytes from {media['file_name']}" if media['file_name'] else ""
+            print(f"ID: {media['id']} ({media['type']} {dimensions}{size}) \n\t{media['description']} \n\tURL: {media['url']}")
+        return inventory
+
+    @timed('image_posted_before')
+    def image_posted_before(self, file_name, max_distance=6, verbose=False):
+        """
+        Has this image - or a rescan, resize or recompression of it - been posted before? Looks the file up in
+        the media inventory, by its SHA-256 and its perceptual hash, before anything is uploaded.
+        :param file_name: Local image file
+        :param max_distance: Most perceptual hash bits that can differ for a near duplicate (0 for exact copies only)
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: List of dictionaries, closest first, see MediaInventory.find() - empty if it has not been posted
+        """
+        self.sync_statuses(verbose=verbose)
+        found = self.media_inventory.find(file_name, max_distance)
+        if found:
+            closest = found[0]
+            posted_at = datetime.fromtimestamp(closest['created_at'], self.local_timezone)
+            match = "The same image" if closest['distance'] == 0 else f"A near duplicate ({closest['distance']} bits apart)"
+            print(f"{self.color_error}Warning: {self.color_reset}{match} was posted at {posted_at}: {closest['status_url']}")
+            self.to_log("image_posted_before", f"{file_name}: {len(found)} earlier posts, closest {closest['status_url']}")
+        return found
 
     def __repr__(self):
         """
@@ -227,24 +608,46 @@ class MastodonWrapper:
         :param details: Sentence to describe the details
         :return: None
         """
-        self.log = pd.concat([self.log,
-                              pd.DataFrame([[task, details, datetime.now().strftime("%Y-%m-%d %H:%M:%S")]], columns=self.log_column_names)
-                              ], ignore_index=True)
+        self.log.append(task, details)
     def log_df(self):
-        return self.log
+        """
+        The log as a pandas DataFrame, built from the log buffer only when asked for. Only the rows still
+        held are included - rows dropped by flush_log(drop=True) are only in the log_file
+        :return: DataFrame with the log_column_names columns
+        """
+        return self.log.to_dataframe()
+    def flush_log(self, drop=False):
+        """
+        Write any log rows not yet written to the log_file given when the object was created, and
+        the spans not yet written to the span recorder's export_file, if it has one
+        :param drop: Set to TRUE to also drop the written rows from memory (only if there is a log_file)
+        :return: Number of log rows written
+        """
+        self.spans.export()
+        return self.log.flush(drop=drop)
+    @timed('save_log')
     def save_log_to_csv(self, path_name):
         """
-        Write the log dataframe to a csv file, including the current timestamp in the file name
+        Write the log to a csv file, including the current timestamp in the file name. Only the rows
+        still held are written - rows dropped by flush_log(drop=True) are only in the log_file
         :param path_name: Local path for the log CSV file
         :return: None
         """
         file_name=f'MastodonWrapperLog-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.csv'
         print(f"\nWriting log file to:\n\tPath: {path_name}\nFile: \t{file_name}")
         try:
-            self.log.to_csv(f'{path_name}{file_name}', index=False)
+            self.flush_log()
+            self.log.write_csv(f'{path_name}{file_name}')
         except Exception as e:
             print(f'Unable to write log file:\n\t{path_name}{file_name}\n')
-            print(self.log)
+            for row in self.log:
+                print(row)
+    def timing_summary(self):
+        """
+        The time spent in each API call and stage so far, with the call, retry and byte counters
+        :return: String, a plain text table
+        """
+        return self.spans.summary_table()
     def state(self):
         """
         A simple function to return the state of the object.
@@ -252,29 +655,171 @@ class MastodonWrapper:
         """
         return self.object_state
 
+    @timed('already_posted')
     def already_posted(self, next_dict, verbose=False):
         """
-        Return True if the posting data in next_dict has already been posted
+        Return True if the posting data in next_dict has already been posted, at any time in the
+        account's history. Looks up the fingerprint of the text in the local status store.
 
         :param next_dict:
         :return: Boolean
         """
-        if not self.recent_toots:  # Don't want to read this again and again
-            print(f"Call account_status() to get recent toots") if verbose else None
-            self.recent_toots = self.m_object.account_statuses(id=self.user_id)
+        self.sync_statuses(verbose=verbose)
 
         print(f"The next planned update text is:\n{next_dict['full_update_text']}") if verbose else None
-        for status in self.recent_toots:
-            temp_post = re.sub(r'<.*?>', '', status['content'])
-            temp_post = re.sub(r'&#39;', "'", temp_post)
-            temp_post = re.sub(r'&amp;', "&", temp_post)
-            print(temp_post) if verbose else None
-
-            if next_dict['full_update_text'] == temp_post:
-                print(f"{self.color_error}Error: {self.color_reset}The next post defined has already been posted to Mastodon at {status['created_at']}:\n{self.color_quote}{temp_post}{self.color_reset}")
-                self.to_log("no_new_post", f"The next planned update has already been posted at {status['created_at']}")
-                self.to_log("duplicate_content", temp_post)
-                return True
+        posted_at = self.status_store.posted_at(next_dict['full_update_text'])
+        if posted_at is not None:
+            posted_at = datetime.fromtimestamp(posted_at, self.local_timezone)
+            print(f"{self.color_error}Error: {self.color_reset}The next post defined has already been posted to Mastodon at {posted_at}:\n{self.color_quote}{next_dict['full_update_text']}{self.color_reset}")
+            self.to_log("no_new_post", f"The next planned update has already been posted at {posted_at}")
+            self.to_log("duplicate_content", next_dict['full_update_text'])
+            return True
         # If there is no match, all is OK
         self.to_log("next_post_is_new", "The next planned update has NOT already been posted")
         return False
+
+    @timed('already_posted_batch')
+    def already_posted_batch(self, postings, verbose=False):
+        """
+        Check a whole list of planned postings, like DataForUpdates.postings_for(), in one call
+
+        :param postings: List of posting dictionaries, each with a 'full_update_text'
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: List of Booleans, True where that posting has already been posted
+        """
+        self.sync_statuses(verbose=verbose)
+        posted = self.status_store.posted_fingerprints([posting['full_update_text'] for posting in postings])
+        results = [text_fingerprint(posting['full_update_text']) in posted for posting in postings]
+        print(f"{sum(results)} of {len(postings)} planned updates have already been posted") if verbose else None
+        self.to_log("already_posted_batch", f"{sum(results)} of {len(postings)} planned updates have already been posted")
+        return results
+
+    def start_streaming(self, reconnect_seconds=5, max_reconnect_seconds=300, read_timeout=300, verbose=False):
+        """
+        Keep the status store current from the user stream instead of polling: the account's new, edited and
+        deleted statuses are applied as they arrive, in a background thread, so already_posted() and
+        hours_since_last_post() see posts made from anywhere else. Every time the stream (re)connects, the
+        statuses posted while it was down are backfilled with sync_statuses(). A dropped connection is retried,
+        waiting twice as long after each failed attempt.
+        :param reconnect_seconds: First wait before reconnecting
+        :param max_reconnect_seconds: Longest wait before reconnecting
+        :param read_timeout: Reconnect if nothing (not even a heartbeat) arrives for this many seconds
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: The StatusStreamListener, with the counts of the events applied
+        """
+        if self.streaming():
+            return self.stream_listener
+        from StatusStreamListener import StatusStreamListener  # Imports Mastodon.py's streaming module
+        self.stream_listener = StatusStreamListener(self.status_store, self.user_id,
+                                                    on_connect=lambda: self.__stream_connected(verbose), verbose=verbose)
+        self.stream_stop.clear()
+        self.stream_reconnect_seconds = reconnect_seconds
+        self.stream_delay = reconnect_seconds
+        self.stream_thread = threading.Thread(target=self.__stream_loop, name='status-stream', daemon=True,
+                                              args=(max_reconnect_seconds, read_timeout, verbose))
+        self.stream_thread.start()
+        self.to_log("stream-start", f"Following the user stream for {self.user_name}")
+        return self.stream_listener
+
+    def stop_streaming(self, wait_seconds=5):
+        """
+        Close the stream and wait for its thread to finish
+        :param wait_seconds: Longest wait for the thread
+        :return: True if the thread has finished
+        """
+        if self.stream_thread is None:
+            return True
+        self.stream_stop.set()
+        self.stream_listener.stop()
+        self.stream_thread.join(wait_seconds)
+        stopped = not self.stream_thread.is_alive()
+        self.to_log("stream-stop", f"Events applied: {self.stream_listener.counts}")
+        return stopped
+
+    def streaming(self):
+        """
+        :return: True while the user stream is being followed (connected, or waiting to reconnect)
+        """
+        return self.stream_thread is not None and self.stream_thread.is_alive() and not self.stream_stop.is_set()
+
+    def __stream_loop(self, max_reconnect_seconds, read_timeout, verbose):
+        from StatusStreamListener import StreamStopped
+        while not self.stream_stop.is_set():
+            try:
+                self.m_object.stream_user(self.stream_listener, timeout=read_timeout)  # Blocks until the connection drops
+                details = "The server closed the stream"
+            except StreamStopped:
+                break
+            except Exception as e:
+                if self.stream_stop.is_set():
+                    break  # Closing the connection to stop interrupts the read with an error
+                details = f"Error 7150: {e}"
+            self.spans.count('stream_disconnects')
+            print(f"Stream disconnected ({details}), reconnecting in {self.stream_delay} seconds") if verbose else None
+            self.to_log("stream-disconnected", details)
+            if self.stream_stop.wait(self.stream_delay):
+                break
+            self.stream_delay = min(self.stream_delay * 2, max_reconnect_seconds)
+
+    def __stream_connected(self, verbose=False):
+        """
+        Called by the listener once the stream is open, before its first event: fetch whatever was posted
+        while it was not connected (from the newest status in the store, with min_id)
+        """
+        fetched = self.sync_statuses(force=True, verbose=verbose)
+        self.spans.count('stream_connects')
+        self.stream_delay = self.stream_reconnect_seconds  # Connected again, so the next drop starts the backoff over
+        print(f"Stream connected, backfilled {fetched} statuses") if verbose else None
+        self.to_log("stream-connected", f"Backfilled {fetched} statuses")
+
+    @timed('sync_statuses')
+    def sync_statuses(self, force=False, verbose=False):
+        """
+        Bring the local status store up to date. Fetches only the statuses newer than the newest one
+        in the store (using min_id), and until the store has the account's entire history, keeps paging
+        back through older statuses (using max_id). Each page is committed as it is read, so an interrupted
+        first sync carries on where it left off. Only done once per object unless force is set.
+        Statuses deleted on the server after they were stored stay in the store: there is no API to list
+        deletions, and finding them would mean fetching the whole history again.
+        :param force: Set to TRUE to check the server for new statuses again
+        :param verbose: Set to TRUE to have some debug and status info printed
+        :return: Number of statuses fetched
+        """
+        if self.statuses_synced and not force:
+            return 0
+        fetched = 0
+        newest_id = self.status_store.newest_id()
+        if newest_id is not None:
+            print(f"Call account_statuses() for statuses newer than {newest_id}") if verbose else None
+            for page in self.__fetch_statuses(since_id=newest_id):
+                fetched += self.status_store.add_statuses(page)
+        # An empty store (a new account, or one whose every status was deleted) is fetched from the newest down
+        if self.status_store.get_state('history_complete') != 'yes' or newest_id is None:
+            oldest_id = self.status_store.oldest_id()
+            print(f"Call account_statuses() for the history before {oldest_id}") if verbose else None
+            for page in self.__fetch_statuses(max_id=oldest_id):
+                fetched += self.status_store.add_statuses(page)
+            self.status_store.set_state('history_complete', 'yes')
+        self.statuses_synced = True
+        self.to_log("status_sync", f"Fetched {fetched} statuses, {len(self.status_store)} in the store")
+        return fetched
+
+    def __fetch_statuses(self, since_id=None, max_id=None, page_size=40):
+        """
+        Page through the account's statuses. With no since_id, walks back through the history
+        (from max_id, or from the newest status) using max_id; otherwise walks forward from since_id using min_id.
+        :param since_id: Only fetch statuses newer than this ID
+        :param max_id: Only fetch statuses older than this ID
+        :param page_size: Statuses per request (40 is the server maximum)
+        :return: Generator of lists of status dictionaries
+        """
+        if since_id is None:
+            page = self.__call_api('account_statuses', id=self.user_id, max_id=max_id, limit=page_size)
+            while page:
+                yield page
+                page = self.__call_api('account_statuses', id=self.user_id, max_id=min(int(s['id']) for s in page), limit=page_size)
+        else:
+            page = self.__call_api('account_statuses', id=self.user_id, min_id=since_id, limit=page_size)
+            while page:
+                yield page
+                page = self.__call_api('account_statuses', id=self.user_id, min_id=max(int(s['id']) for s in page), limit=page_size)
@@ -0,0 +1,165 @@
+import os
+from ImagePreparer import ImagePreparer
+from StatusRecord import text_fingerprint
+
+
+class MediaInventory:
+    schema = """
+        -- The local image files that media attachments were uploaded from, with their hashes
+        CREATE TABLE IF NOT EXISTS image_files (
+            file_name TEXT PRIMARY KEY,
+            file_size INTEGER,  -- bytes
+            file_mtime REAL,
+            content_hash TEXT,  -- SHA-256 of the file, for exact copies
+            dhash INTEGER  -- 64 bit difference hash of the picture, for near duplicates - NULL without Pillow
+        );
+        CREATE INDEX IF NOT EXISTS image_files_content_hash ON image_files (content_hash);
+        CREATE TABLE IF NOT EXISTS media_sources (
+            media_id TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS media_sources_file_name ON media_sources (file_name);
+    """
+    # Each media attachment with its status and, if known, the local file it was uploaded from
+    inventory_query = """
+        SELECT media.id, media.status_id, statuses.created_at, statuses.url AS status_url, media.type, media.width,
+            media.height, image_files.file_size, media.description, media.url, media_sources.file_name,
+            image_files.content_hash, image_files.dhash
+        FROM media JOIN statuses ON statuses.id = media.status_id
+            LEFT JOIN media_sources ON media_sources.media_id = media.id
+            LEFT JOIN image_files ON image_files.file_name = media_sources.file_name"""
+
+    def __init__(self, status_store, verbose=False):
+        """
+        Every media attachment in the account's history - ID, type, dimensions, description and URL from the
+        StatusStore's media table, kept current by sync_statuses() - joined to the local image file each one was
+        uploaded from, where that is known, with its byte size, SHA-256 and a perceptual hash (dHash). So
+        'has this image, or a near-duplicate scan of it, been posted before?' is one indexed query, answered
+        before an upload starts. The file hashes are remembered by size and modification time, so each file is
+        only read again when it changes. The perceptual hash needs Pillow; without it only exact copies are found.
+        :param status_store: The StatusStore, whose database the inventory tables are added to
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.status_store = status_store
+        self.db = status_store.db
+        self.verbose = verbose
+        status_store.create_tables(self.schema)
+        # Number of bits that differ between two hashes, for the near duplicate query
+        with status_store.lock:
+            self.db.create_function('hamming', 2, self.hamming, deterministic=True)
+
+    @staticmethod
+    def hamming(a, b):
+        if a is None or b is None:
+            return None
+        return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count('1')
+
+    @staticmethod
+    def dhash(file_name):
+        """
+        Difference hash: shrink the picture to 9x8 greys and note whether each pixel is brighter than the one to
+        its left. Rescans, recompressions and resizes of the same picture come out within a few bits.
+        :param file_name: Image file
+        :return: Signed 64 bit integer (to fit SQLite's INTEGER), or None without Pillow or if the file can't be read
+        """
+        try:
+            from PIL import Image, ImageOps  # https://pillow.readthedocs.io/ - only imported the first time a file is hashed
+        except ImportError:  # Pillow is optional - without it only exact copies are found
+            return None
+        try:
+            with Image.open(file_name) as img:
+                img.draft('L', (64, 64))  # Lets JPEG decode at a fraction of the size, much faster for big photos
+                pixels = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.LANCZOS).tobytes()  # One byte per pixel
+        except (OSError, ValueError):
+            return None
+        bits = 0
+        for row in range(8):
+            for column in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + column + 1] > pixels[row * 9 + column])
+        return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+    def file_hashes(self, file_name):
+        """
+        The SHA-256 and dHash of a local file, from the inventory if the file has not changed since it was hashed
+        :param file_name: Image file
+        :return: sqlite3.Row with file_name, file_size, file_mtime, content_hash and dhash
+        """
+        stat = os.stat(file_name)
+        with self.status_store.lock:
+            row = self.db.execute("SELECT * FROM image_files WHERE file_name = ?", (file_name,)).fetchone()
+        if row is not None and row['file_size'] == stat.st_size and row['file_mtime'] == stat.st_mtime:
+            return row
+        print(f"Hashing {file_name}") if self.verbose else None
+        values = (file_name, stat.st_size, stat.st_mtime, ImagePreparer.content_hash(file_name), self.dhash(file_name))
+        with self.status_store.lock:
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO image_files VALUES (?, ?, ?, ?, ?)", values)
+            return self.db.execute("SELECT * FROM image_files WHERE file_name = ?", (file_name,)).fetchone()
+
+    def link(self, media_id, file_name):
+        """
+        Record the local file a media attachment was uploaded from
+        :param media_id: Media ID, as returned by the upload
+        :param file_name: The original image file (not the optimized copy)
+        :return: None
+        """
+        self.file_hashes(file_name)
+        with self.status_store.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO media_sources VALUES (?, ?)", (str(media_id), file_name))
+
+    def link_schedule(self, schedule):
+        """
+        Work out the source file of the media in statuses posted from the schedule: a posted status whose text
+        matches a posting with an image was uploaded from that posting's image file. Only the attachments with
+        no source file yet are looked at, so this is cheap to run after every sync.
+        :param schedule: DataForUpdates
+        :return: Number of attachments linked
+        """
+        files_by_fingerprint = {}
+        for postings in schedule.index.values():
+            for posting in postings:
+                if posting['image_name'] and os.path.isfile(posting['full_image_name']):
+                    files_by_fingerprint[text_fingerprint(posting['full_update_text'])] = posting['full_image_name']
+        with self.status_store.lock:
+            unlinked = self.db.execute("""
+                SELECT media.id, statuses.fingerprint FROM media JOIN statuses ON statuses.id = media.status_id
+                WHERE media.id NOT IN (SELECT media_id FROM media_sources)""").fetchall()
+        linked = 0
+        for row in unlinked:
+            file_name = files_by_fingerprint.get(row['fingerprint'])
+            if file_name:
+                self.link(row['id'], file_name)
+                linked += 1
+        print(f"Linked {linked} of {len(unlinked)} media attachments to files in the schedule") if self.verbose else None
+        return linked
+
+    def find(self, file_name, max_distance=6):
+        """
+        The attachments already posted from this image, or from a near-duplicate of it
+        :param file_name: Local image file about to be posted
+        :param max_distance: Most dHash bits that can differ for a near duplicate (0 for exact copies only)
+        :return: List of dictionaries, closest first, each an inventory row with 'distance' (0 for the same file contents)
+        """
+        hashes = self.file_hashes(file_name)
+        with self.status_store.lock:
+            rows = self.db.execute(f"""
+                SELECT * FROM (
+                    SELECT inventory.*, CASE WHEN content_hash = ? THEN 0 ELSE hamming(dhash, ?) END AS distance
+                    FROM ({self.inventory_query}) AS inventory
+                    WHERE content_hash = ? OR dhash IS NOT NULL)
+                WHERE distance <= ? ORDER BY distance, created_at""",
+                (hashes['content_hash'], hashes['dhash'], hashes['content_hash'], max_distance)).fetchall()
+        return [dict(row) for row in rows]
+
+    def inventory(self):
+        """
+        Every media attachment, newest status first
+        :return: List of dictionaries with id, status_id, created_at, status_url, type, width, height, file_size,
+                 description, url, file_name, content_hash and dhash (the last four None if the source is unknown)
+        """
+        with self.status_store.lock:
+            return [dict(row) for row in self.db.execute(f"{self.inventory_query} ORDER BY statuses.created_at DESC, media.id")]
+
+    def __len__(self):
+        with self.status_store.lock:
+            return self.db.execute("SELECT COUNT(*) FROM media").fetchone()[0]
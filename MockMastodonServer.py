@@ -0,0 +1,438 @@
+import bisect
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockMastodonServer:
+    def __init__(self, statuses=0, latency_seconds=0.0, max_page_size=40, rate_limit=300, rate_limit_window_seconds=300,
+                 media_processing_seconds=0.0, media_every=5, heartbeat_seconds=15.0, port=0, verbose=False):
+        """
+        A local stand-in for a Mastodon server, implementing just the endpoints MastodonWrapper uses, so the
+        wrapper and the client scripts can be tested and benchmarked without touching a live instance.
+        Run it with start() and point MastodonWrapper's base_url at base_url.
+        :param statuses: Number of statuses to seed the account's history with
+        :param latency_seconds: Added to every response
+        :param max_page_size: Largest page of statuses returned, whatever 'limit' asks for
+        :param rate_limit: Requests allowed per rate limit window, reported in the X-RateLimit-* headers
+        :param rate_limit_window_seconds: Length of the rate limit window
+        :param media_processing_seconds: How long an uploaded media attachment takes to be 'processed'
+        :param media_every: Every media_every'th seeded status has an image attached (0 for none)
+        :param heartbeat_seconds: How often the user stream sends a heartbeat when there are no events
+        :param port: Port to listen on, or 0 for any free port
+        :param verbose: Set to TRUE to have every request printed
+        """
+        self.latency_seconds = latency_seconds
+        self.max_page_size = max_page_size
+        self.rate_limit = rate_limit
+        self.rate_limit_window_seconds = rate_limit_window_seconds
+        self.media_processing_seconds = media_processing_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.verbose = verbose
+        self.account = {
+            'id': '109000000000000001', 'username': 'mockbot', 'acct': 'mockbot', 'display_name': 'Mock Bot',
+            'locked': False, 'bot': True, 'created_at': '2020-01-01T00:00:00.000Z', 'note': '',
+            'url': 'http://localhost/@mockbot', 'avatar': '', 'header': '', 'followers_count': 0,
+            'following_count': 0, 'statuses_count': 0, 'fields': [], 'emojis': []
+        }
+        self.statuses = []  # Ascending by ID
+        self.status_ids = []  # The IDs of statuses, as integers, for binary searches
+        self.media = {}  # Media ID -> (media dictionary, epoch time it is processed)
+        self.lock = threading.Lock()
+        self.next_id = 110000000000000000
+        self.window_start = time.time()
+        self.window_requests = 0
+        self.requests = 0
+        self.streams = []  # A queue of events for each open user stream connection
+        self.streaming_available = True  # Set to False to refuse stream connections, to test reconnecting
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), self.__make_handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = None
+        self.seed_statuses(statuses, media_every)
+
+    def start(self):
+        """
+        Start serving requests in a background thread
+        :return: self, so this can be chained
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __new_id(self):
+        self.next_id += 1
+        return str(self.next_id)
+
+    def make_status(self, content, created_at=None, media_attachments=None, tags=None):
+        """
+        Build a status dictionary in the shape the Mastodon API returns
+        :param content: HTML content
+        :return: Dictionary
+        """
+        status_id = self.__new_id()
+        created_at = created_at if created_at else datetime.now(timezone.utc)
+        return {
+            'id': status_id, 'uri': f"{self.base_url}/statuses/{status_id}",
+            'url': f"http://localhost/@mockbot/{status_id}",
+            'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z', 'edited_at': None,
+            'account': self.account, 'content': content, 'visibility': 'public', 'sensitive': False, 'spoiler_text': '',
+            'media_attachments': media_attachments or [], 'mentions': [], 'emojis': [],
+            'tags': [{'name': tag, 'url': f"http://localhost/tags/{tag}"} for tag in (tags or [])],
+            'reblogs_count': 0, 'favourites_count': 0, 'replies_count': 0, 'reblog': None, 'in_reply_to_id': None,
+            'in_reply_to_account_id': None, 'language': 'en', 'poll': None, 'card': None, 'application': None
+        }
+
+    @staticmethod
+    def escape(text):
+        """
+        HTML escape status text the way Mastodon does
+        """
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;').replace("'", '&#39;')
+
+    def make_media(self, description, file_size=0):
+        media_id = self.__new_id()
+        return {
+            'id': media_id, 'type': 'image', 'url': f"http://localhost/media/{media_id}.jpeg",
+            'preview_url': f"http://localhost/media/{media_id}-small.jpeg", 'remote_url': None,
+            'meta': {'original': {'width': 1600, 'height': 1200, 'size': '1600x1200', 'aspect': 1.333},
+                     'file_size': file_size},
+            'description': description, 'blurhash': None
+        }
+
+    def seed_statuses(self, count, media_every=5):
+        """
+        Add count statuses to the history, one every six hours up to now
+        :return: None
+        """
+        start_time = datetime.now(timezone.utc) - timedelta(hours=6 * (count + 1))
+        for i in range(count):
+            media = [self.make_media(f"Historic photo {i}")] if media_every and i % media_every == 0 else []
+            status = self.make_status(
+                f"<p>Seeded post number {i} - it&#39;s from the archive &amp; more <a href=\"http://localhost/tags/OTD\">#<span>OTD</span></a></p>",
+                created_at=start_time + timedelta(hours=6 * i), media_attachments=media, tags=['otd'])
+            # Some made up engagement, more for posts with media, so there is something to analyze
+            status['favourites_count'] = (i * 7) % 23 + (10 if media else 0)
+            status['reblogs_count'] = (i * 3) % 5
+            status['replies_count'] = i % 4
+            self.add_status(status)
+
+    def add_status(self, status):
+        """
+        Add a status to the account's history - IDs only ever go up, so it goes at the end
+        """
+        with self.lock:
+            self.statuses.append(status)
+            self.status_ids.append(int(status['id']))
+            self.account['statuses_count'] = len(self.statuses)
+        self.publish('update', status)
+
+    def __find_status(self, status_id):
+        i = bisect.bisect_left(self.status_ids, int(status_id))
+        return i if i < len(self.statuses) and self.status_ids[i] == int(status_id) else None
+
+    def edit_status(self, status_id, content):
+        """
+        Change a status' content, as if it was edited from the web UI
+        :return: The edited status dictionary, or None if there is no such status
+        """
+        with self.lock:
+            i = self.__find_status(status_id)
+            if i is None:
+                return None
+            status = {**self.statuses[i], 'content': content,
+                      'edited_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'}
+            self.statuses[i] = status
+        self.publish('status.update', status)
+        return status
+
+    def delete_status(self, status_id):
+        """
+        Remove a status from the history, as if it was deleted from the web UI
+        :return: The deleted status dictionary, or None if there is no such status
+        """
+        with self.lock:
+            i = self.__find_status(status_id)
+            if i is None:
+                return None
+            status = self.statuses.pop(i)
+            self.status_ids.pop(i)
+            self.account['statuses_count'] = len(self.statuses)
+        self.publish('delete', status['id'])
+        return status
+
+    def publish(self, event, payload):
+        """
+        Send an event to every open user stream, in the server-sent events format Mastodon uses -
+        a status as JSON, or for 'delete' just the ID
+        """
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        with self.lock:
+            for events in self.streams:
+                events.put(f"event: {event}\ndata: {data}\n\n")
+
+    def disconnect_streams(self):
+        """
+        Close every open user stream connection, as a restart of the streaming server would
+        """
+        with self.lock:
+            for events in self.streams:
+                events.put(None)
+
+    def export_archive(self, archive_file):
+        """
+        Write the account's history as an account archive, like the one the server offers to download:
+        a .zip file with outbox.json, an ActivityPub collection with a 'Create' activity for each post
+        :param archive_file: The .zip file to write
+        :return: Number of statuses in the archive
+        """
+        actor = f"{self.base_url}/users/{self.account['username']}"
+        with self.lock:
+            statuses = list(self.statuses)
+        items = [{
+            'id': f"{status['uri']}/activity", 'type': 'Create', 'actor': actor, 'published': status['created_at'],
+            'object': {
+                'id': status['uri'], 'type': 'Note', 'published': status['created_at'], 'url': status['url'],
+                'attributedTo': actor, 'content': status['content'], 'sensitive': status['sensitive'],
+                'to': ['https://www.w3.org/ns/activitystreams#Public'], 'cc': [f"{actor}/followers"],
+                'tag': [{'type': 'Hashtag', 'href': tag['url'], 'name': f"#{tag['name']}"} for tag in status['tags']],
+                'attachment': [{'type': 'Document', 'mediaType': 'image/jpeg', 'name': media['description'],
+                                'url': f"/media_attachments/files/{media['id']}/original/{media['id']}.jpeg",
+                                'width': 1600, 'height': 1200} for media in status['media_attachments']]
+            }
+        } for status in statuses]
+        outbox = {'@context': 'https://www.w3.org/ns/activitystreams', 'id': 'outbox.json', 'type': 'OrderedCollection',
+                  'totalItems': len(items), 'orderedItems': items}
+        with zipfile.ZipFile(archive_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('outbox.json', json.dumps(outbox, indent=2))
+            archive.writestr('actor.json', json.dumps({'id': actor, 'type': 'Person', 'preferredUsername': self.account['username']}))
+        return len(items)
+
+    def instance(self):
+        return {
+            'uri': '127.0.0.1', 'domain': '127.0.0.1', 'title': 'Mock Mastodon', 'version': '4.2.0',
+            'description': 'A local stand-in for benchmarks and tests', 'languages': ['en'],
+            'urls': {'streaming_api': self.base_url.replace('http', 'ws')},
+            'configuration': {
+                'urls': {'streaming': self.base_url.replace('http', 'ws')},
+                'statuses': {'max_characters': 500, 'max_media_attachments': 4},
+                'media_attachments': {'image_size_limit': 16777216, 'image_matrix_limit': 33177600,
+                                      'supported_mime_types': ['image/jpeg', 'image/png']}
+            },
+            'rules': []
+        }
+
+    def account_statuses(self, query):
+        """
+        The page of statuses for GET /api/v1/accounts/:id/statuses, following Mastodon's max_id,
+        since_id and min_id rules. Always newest first.
+        """
+        limit = min(int(query.get('limit', 20)), self.max_page_size)
+        max_id = int(query['max_id']) if query.get('max_id') else None
+        since_id = int(query['since_id']) if query.get('since_id') else None
+        min_id = int(query['min_id']) if query.get('min_id') else None
+        with self.lock:
+            # Statuses are kept in ID order, so a binary search finds the range
+            low = max(since_id or 0, min_id or 0)
+            first = bisect.bisect_right(self.status_ids, low)
+            last = bisect.bisect_left(self.status_ids, max_id) if max_id is not None else len(self.status_ids)
+            # min_id pages forward from the oldest matching status, everything else pages back from the newest
+            if min_id is not None:
+                page = self.statuses[first:min(first + limit, last)]
+            else:
+                page = self.statuses[max(last - limit, first):last]
+        return list(reversed(page))
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Otherwise every keep-alive response waits on a delayed ACK
+
+            def log_message(self, format, *args):
+                if server.verbose:
+                    super().log_message(format, *args)
+
+            def __send(self, code, body, headers=None):
+                data = json.dumps(body).encode('utf-8')
+                if self.command == 'GET' and code == 200:
+                    # A weak ETag of the body, like Rails adds to Mastodon's responses, so clients can revalidate
+                    etag = f'W/"{hashlib.md5(data).hexdigest()}"'
+                    headers = {**(headers or {}), 'ETag': etag}
+                    if self.headers.get('If-None-Match') == etag:
+                        code, data = 304, b''
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                with server.lock:
+                    now = time.time()
+                    if now - server.window_start >= server.rate_limit_window_seconds:
+                        server.window_start = now
+                        server.window_requests = 0
+                    reset = datetime.fromtimestamp(server.window_start + server.rate_limit_window_seconds, timezone.utc)
+                    remaining = max(server.rate_limit - server.window_requests, 0)
+                self.send_header('X-RateLimit-Limit', str(server.rate_limit))
+                self.send_header('X-RateLimit-Remaining', str(remaining))
+                self.send_header('X-RateLimit-Reset', reset.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z')
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def __read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('application/json'):
+                    return json.loads(body or b'{}'), {}
+                if content_type.startswith('multipart/form-data'):
+                    message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+                    fields, files = {}, {}
+                    for part in message.get_payload():
+                        name = part.get_param('name', header='content-disposition')
+                        if part.get_filename() is not None:
+                            files[name] = part.get_payload(decode=True)
+                        else:
+                            fields[name] = part.get_payload(decode=True).decode('utf-8')
+                    return fields, files
+                return {key: values if key.endswith('[]') else values[0]
+                        for key, values in parse_qs(body.decode('utf-8')).items()}, {}
+
+            def __handle(self, method):
+                if server.latency_seconds:
+                    time.sleep(server.latency_seconds)
+                with server.lock:
+                    server.requests += 1
+                    server.window_requests += 1
+                    over_limit = server.window_requests > server.rate_limit
+                if over_limit:
+                    return self.__send(429, {'error': 'Too many requests'})
+                if not self.headers.get('Authorization', '').startswith('Bearer '):
+                    if not urlparse(self.path).path.startswith('/api/v1/instance') and not urlparse(self.path).path.startswith('/api/v2/instance'):
+                        return self.__send(401, {'error': 'The access token is invalid'})
+                url = urlparse(self.path)
+                path = url.path.rstrip('/')
+                if method == 'GET' and path == '/api/v1/streaming/user':
+                    return self.__stream_events()
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                handled = server.handle_request(method, path, query, self.__read_body if method in ('POST', 'PUT') else None)
+                if handled is None:
+                    return self.__send(404, {'error': 'Record not found'})
+                self.__send(*handled)
+
+            def __stream_events(self):
+                """
+                Hold the connection open and write each published event as a chunk, with a heartbeat
+                comment whenever there has been nothing to send for heartbeat_seconds
+                """
+                if not server.streaming_available:
+                    return self.__send(503, {'error': 'Streaming is not available'})
+                events = queue.Queue()
+                with server.lock:
+                    server.streams.append(events)
+                self.close_connection = True
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Transfer-Encoding', 'chunked')
+                    self.end_headers()
+                    while True:
+                        try:
+                            event = events.get(timeout=server.heartbeat_seconds)
+                        except queue.Empty:
+                            event = ':thump\n'
+                        if event is None:
+                            break
+                        data = event.encode('utf-8')
+                        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.write(b'0\r\n\r\n')
+                except OSError:
+                    pass  # The client went away
+                finally:
+                    with server.lock:
+                        server.streams.remove(events)
+
+            def do_GET(self):
+                self.__handle('GET')
+
+            def do_POST(self):
+                self.__handle('POST')
+
+            def do_PUT(self):
+                self.__handle('PUT')
+
+            def do_DELETE(self):
+                self.__handle('DELETE')
+
+        return Handler
+
+    def handle_request(self, method, path, query, read_body):
+        """
+        Route one request
+        :return: Tuple of (HTTP status code, JSON body) or (code, body, headers), or None for a 404
+        """
+        if method == 'GET' and path in ('/api/v1/instance', '/api/v2/instance'):
+            return 200, self.instance()
+        if method == 'GET' and path == '/api/v1/accounts/verify_credentials':
+            return 200, self.account
+        match = re.fullmatch(r'/api/v1/accounts/(\d+)/statuses', path)
+        if method == 'GET' and match:
+            if match.group(1) != self.account['id']:
+                return 404, {'error': 'Record not found'}
+            return 200, self.account_statuses(query)
+        match = re.fullmatch(r'/api/v1/statuses/(\d+)', path)
+        if method == 'GET' and match:
+            with self.lock:
+                i = self.__find_status(match.group(1))
+                found = self.statuses[i] if i is not None else None
+            return (200, found) if found else None
+        if method == 'POST' and path in ('/api/v1/media', '/api/v2/media'):
+            fields, files = read_body()
+            media = self.make_media(fields.get('description'), len(files.get('file') or b''))
+            with self.lock:
+                self.media[media['id']] = (media, time.time() + self.media_processing_seconds)
+            if self.media_processing_seconds and path == '/api/v2/media':
+                return 202, {**media, 'url': None}
+            return 200, media
+        match = re.fullmatch(r'/api/v1/media/(\d+)', path)
+        if method == 'GET' and match:
+            with self.lock:
+                media, ready_at = self.media.get(match.group(1), (None, 0))
+            if media is None:
+                return None
+            if time.time() < ready_at:
+                return 206, {**media, 'url': None}
+            return 200, media
+        if method == 'POST' and path == '/api/v1/statuses':
+            fields, files = read_body()
+            media_ids = fields.get('media_ids[]') or fields.get('media_ids') or []
+            media_ids = [media_ids] if isinstance(media_ids, str) else media_ids
+            with self.lock:
+                attachments = [self.media[str(media_id)][0] for media_id in media_ids if str(media_id) in self.media]
+            if len(attachments) != len(media_ids):
+                return 422, {'error': 'Validation failed: media not found'}
+            status = self.make_status(f"<p>{self.escape(fields.get('status', ''))}</p>", media_attachments=attachments)
+            status['spoiler_text'] = fields.get('spoiler_text') or ''
+            status['sensitive'] = str(fields.get('sensitive')).lower() in ('true', '1')
+            self.add_status(status)
+            return 200, status
+        return None
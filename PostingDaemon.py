@@ -0,0 +1,152 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from DataForUpdates import DataForUpdates
+
+
+class PostingDaemon:
+    def __init__(self, wrapper, schedule, post_limit_hours, prepare_ahead_seconds=600, max_sleep_seconds=3600,
+                 retry_seconds=300, verbose=False):
+        """
+        Keeps one MastodonWrapper connected and posts each scheduled update at the earliest moment
+        post_limit_hours allows, instead of cron starting a new process every few minutes to check.
+        Works out exactly when the next post can be made, sleeps until then, and uploads the next
+        posting's image a little ahead of time so the post itself is a single call.
+        :param wrapper: A connected MastodonWrapper, with ok_to_post set to 'yes' (or 'no' to only go through the motions)
+        :param schedule: DataForUpdates for the schedule CSV file - reloaded whenever the file changes
+        :param post_limit_hours: Minimum hours between posts
+        :param prepare_ahead_seconds: How long before the next post to upload its image
+        :param max_sleep_seconds: Longest single sleep, so changes to the schedule are picked up
+        :param retry_seconds: How long to wait after a failed post before trying again
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.wrapper = wrapper
+        self.schedule = schedule
+        self.post_limit_hours = post_limit_hours
+        self.prepare_ahead_seconds = prepare_ahead_seconds
+        self.max_sleep_seconds = max_sleep_seconds
+        self.retry_seconds = retry_seconds
+        self.verbose = verbose
+        self.schedule_mtime = self.__schedule_mtime()
+        self.skipped = set()  # full_update_text of today's postings that can't be or weren't posted
+        self.skipped_day = None
+        self.stop_event = threading.Event()
+        self.media_linked = False  # Whether the media inventory knows which schedule image each posted attachment came from
+        self.posts = 0
+
+    def __schedule_mtime(self):
+        try:
+            return os.stat(self.schedule.csv_input_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def __reload_schedule_if_changed(self):
+        mtime = self.__schedule_mtime()
+        if mtime == self.schedule_mtime:
+            return
+        print(f"The schedule {self.schedule.csv_input_file} has changed, reloading it") if self.verbose else None
+        self.schedule = DataForUpdates(csv_file=self.schedule.csv_input_file, image_folder=self.schedule.image_folder,
+                                       include_calc_url=self.schedule.include_calc_url, max_len=self.schedule.max_len,
+                                       max_image_text=self.schedule.max_image_text, verbose=self.verbose)
+        self.schedule_mtime = mtime
+        self.media_linked = False
+
+    def next_midnight(self):
+        """
+        When the current day ends in the wrapper's time zone, when the next day's postings take over
+        :return: UTC epoch seconds
+        """
+        tomorrow = datetime.fromtimestamp(self.wrapper.clock(), self.wrapper.local_timezone).date() + timedelta(days=1)
+        return self.wrapper.local_timezone.localize(datetime(tomorrow.year, tomorrow.month, tomorrow.day)).timestamp()
+
+    def next_eligible_time(self):
+        """
+        The earliest time the next post can be made - post_limit_hours after the last post
+        :return: UTC epoch seconds, possibly in the past - 0 if the account has not posted yet
+        """
+        last_post = self.wrapper.status_store.latest_created_at()
+        return last_post + self.post_limit_hours * 3600 if last_post is not None else 0
+
+    def next_posting(self):
+        """
+        The first of today's postings that has not been posted yet and is ready to go: text not too
+        long, and its image (if any) in place
+        :return: Posting dictionary, or None if there is nothing left to post today
+        """
+        today = datetime.fromtimestamp(self.wrapper.clock(), self.wrapper.local_timezone).date()
+        if today != self.skipped_day:
+            self.skipped.clear()
+            self.skipped_day = today
+        postings = [p for p in self.schedule.postings_for(today.month, today.day) if p['full_update_text'] not in self.skipped]
+        if not postings:
+            return None
+        for posting, posted in zip(postings, self.wrapper.already_posted_batch(postings)):
+            if posted:
+                continue
+            if posting['full_update_len'] > self.schedule.max_len:
+                self.wrapper.to_log("Posting skipped", f"Text is {posting['full_update_len']} characters: {posting['full_update_text']}")
+            elif posting['image_name'] and not os.path.isfile(posting['full_image_name']):
+                self.wrapper.to_log("Posting skipped", f"Missing file >{posting['full_image_name']}<")
+            else:
+                return posting
+            self.skipped.add(posting['full_update_text'])
+        return None
+
+    def run_once(self):
+        """
+        Take the next step: post if it is time, upload the next image if it is nearly time, or work out how long to sleep
+        :return: Dictionary with 'action' ('posted', 'prepared', 'waiting', 'done_for_today' or 'error'),
+                 'details' and 'wake_at' (UTC epoch seconds to call run_once() again)
+        """
+        now = self.wrapper.clock()
+        try:
+            self.__reload_schedule_if_changed()
+            # Picks up posts made from anywhere else - unless the user stream is already applying them as they happen
+            self.wrapper.sync_statuses(force=not self.wrapper.streaming())
+            if not self.media_linked:
+                self.wrapper.media_inventory.link_schedule(self.schedule)
+                self.media_linked = True
+            posting = self.next_posting()
+            midnight = self.next_midnight()
+            if posting is None:
+                return self.__step('done_for_today', "Nothing left to post today", midnight + 1)
+            eligible = max(self.next_eligible_time(), now)
+            if eligible >= midnight:
+                return self.__step('done_for_today', "Too soon to post again before the day ends", midnight + 1)
+            if eligible - now > self.prepare_ahead_seconds:
+                return self.__step('waiting', f"Next post at {datetime.fromtimestamp(eligible, self.wrapper.local_timezone)}",
+                                   eligible - self.prepare_ahead_seconds)
+            if eligible > now:
+                if self.wrapper.ok_to_post == 'yes':
+                    self.wrapper.prepare_upload(posting, verbose=self.verbose)
+                return self.__step('prepared', posting['full_update_text'], eligible)
+            if self.wrapper.post_update(posting, verbose=self.verbose):
+                self.posts += 1
+                return self.__step('posted', posting['full_update_text'], self.wrapper.clock())
+            self.skipped.add(posting['full_update_text'])
+            return self.__step('waiting', f"Ready to post, but not posted: {posting['full_update_text']}", self.wrapper.clock())
+        except Exception as e:
+            return self.__step('error', f"Error 7140: {e}", now + self.retry_seconds)
+
+    def __step(self, action, details, wake_at):
+        wake_at = min(wake_at, self.wrapper.clock() + self.max_sleep_seconds)
+        print(f"{datetime.fromtimestamp(self.wrapper.clock(), self.wrapper.local_timezone):%Y-%m-%d %H:%M:%S} {action}: {details}") if self.verbose else None
+        self.wrapper.to_log(f"daemon-{action}", details)
+        self.wrapper.flush_log(drop=True)  # Runs for months, so only the log_file keeps the older rows
+        return {'action': action, 'details': details, 'wake_at': wake_at}
+
+    def run(self):
+        """
+        Run until stop() is called, sleeping between steps
+        :return: Number of posts made
+        """
+        while not self.stop_event.is_set():
+            step = self.run_once()
+            self.stop_event.wait(max(step['wake_at'] - self.wrapper.clock(), 0))
+        return self.posts
+
+    def stop(self):
+        """
+        Stop run() - safe to call from a signal handler or another thread
+        """
+        self.stop_event.set()
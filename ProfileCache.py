@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import time
+
+
+class ProfileCache:
+    def __init__(self, cache_file, ttl_seconds=86400, verbose=False):
+        """
+        A small on-disk cache of the account profile (id, username, display_name) associated with
+        an access token, so repeated runs don't need to call account_verify_credentials() at all.
+        Entries are keyed by the base URL and a hash of the token - the token itself is never saved.
+        :param cache_file: JSON file to keep the cached profiles in
+        :param ttl_seconds: Cached profiles older than this are ignored
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self.verbose = verbose
+
+    @staticmethod
+    def cache_key(base_url, access_token):
+        """
+        The key for one base URL and token pair
+        :return: String
+        """
+        return f"{base_url.rstrip('/')}|{hashlib.sha256(access_token.encode('utf-8')).hexdigest()}"
+
+    def get(self, base_url, access_token):
+        """
+        Return the cached profile for this base URL and token, if there is one and it is not too old
+        :return: Dictionary with id, username and display_name, or None
+        """
+        entry = self.__read_all().get(self.cache_key(base_url, access_token))
+        if not entry:
+            return None
+        if time.time() - entry.get('cached_at', 0) > self.ttl_seconds:
+            print(f"Cached profile in {self.cache_file} has expired") if self.verbose else None
+            return None
+        return entry
+
+    def put(self, base_url, access_token, profile):
+        """
+        Save the profile for this base URL and token
+        :param profile: Dictionary with id, username and display_name
+        :return: None
+        """
+        entries = self.__read_all()
+        entries[self.cache_key(base_url, access_token)] = {
+            'id': profile['id'],
+            'username': profile['username'],
+            'display_name': profile['display_name'],
+            'cached_at': time.time()
+        }
+        self.__write_all(entries)
+
+    def invalidate(self, base_url, access_token):
+        """
+        Remove the cached profile for this base URL and token
+        :return: None
+        """
+        entries = self.__read_all()
+        if entries.pop(self.cache_key(base_url, access_token), None) is not None:
+            self.__write_all(entries)
+
+    def __read_all(self):
+        if not os.path.isfile(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as infile:
+                return json.load(infile)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable profile cache {self.cache_file}: {e}") if self.verbose else None
+            return {}
+
+    def __write_all(self, entries):
+        try:
+            temp_file = f"{self.cache_file}.tmp"
+            with open(temp_file, "w", encoding="utf-8") as outfile:
+                json.dump(entries, outfile, indent=1, default=str)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"Unable to write the profile cache {self.cache_file}: {e}") if self.verbose else None
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+
+
+class RequestScheduler:
+    # Which endpoint class each Mastodon method belongs to - anything not listed is a 'read'
+    endpoint_classes = {
+        'media_post': 'media',
+        'status_post': 'post',
+    }
+    # Token bucket for each endpoint class: (capacity, seconds to refill completely).
+    # These are Mastodon's default limits: 300 calls per 5 minutes, 30 media uploads per
+    # 30 minutes and 300 statuses per 3 hours.
+    default_buckets = {
+        'read': (300, 5 * 60),
+        'media': (30, 30 * 60),
+        'post': (300, 3 * 60 * 60),
+    }
+    # Only calls that can safely be repeated are retried after network and server errors. A post
+    # that timed out may well have been made, so those are only retried after a 429 'rate limited'.
+    idempotent_classes = {'read'}
+
+    def __init__(self, buckets=None, max_retries=3, backoff_seconds=1.0, max_backoff_seconds=60.0, verbose=False):
+        """
+        Spaces out the calls made to the Mastodon server: a token bucket for each endpoint class,
+        the remaining budget reported by the server's X-RateLimit-* headers, and retries with
+        jittered exponential backoff.
+        :param buckets: Dictionary of endpoint class -> (capacity, seconds to refill), to override default_buckets
+        :param max_retries: Number of times to retry a call that was rate limited or failed
+        :param backoff_seconds: Base delay for the exponential backoff between retries
+        :param max_backoff_seconds: Longest delay between retries
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.buckets = {**self.default_buckets, **(buckets or {})}
+        self.tokens = {name: float(capacity) for name, (capacity, refill) in self.buckets.items()}
+        self.last_refill = {name: time.monotonic() for name in self.buckets}
+        # From the server's headers, per endpoint class: remaining calls and the epoch time the limit resets
+        self.server_remaining = {}
+        self.server_limit = {}
+        self.server_reset = {}
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.waiting = 0  # Calls currently queued, waiting for budget
+        self.calls = 0
+        self.retries = 0
+
+    def endpoint_class(self, method_name):
+        return self.endpoint_classes.get(method_name, 'read')
+
+    def __refill(self, name):
+        capacity, refill_seconds = self.buckets[name]
+        now = time.monotonic()
+        self.tokens[name] = min(capacity, self.tokens[name] + (now - self.last_refill[name]) * capacity / refill_seconds)
+        self.last_refill[name] = now
+
+    def __wait_time(self, name):
+        """
+        Seconds until a call of this endpoint class can be made - takes a token if it can be made now
+        """
+        self.__refill(name)
+        if self.server_remaining.get(name, 1) <= 0:
+            until_reset = self.server_reset.get(name, 0) - time.time()
+            if until_reset > 0:
+                return until_reset
+            self.server_remaining.pop(name, None)  # The server's limit has reset since
+        if self.tokens[name] >= 1:
+            self.tokens[name] -= 1
+            return 0
+        capacity, refill_seconds = self.buckets[name]
+        return (1 - self.tokens[name]) * refill_seconds / capacity
+
+    def acquire(self, name):
+        """
+        Block until a call of this endpoint class is within budget
+        :param name: Endpoint class, like 'read'
+        :return: Seconds spent waiting
+        """
+        waited = 0.0
+        with self.lock:
+            wait = self.__wait_time(name)
+            if wait <= 0:
+                return waited
+            self.waiting += 1
+        try:
+            while wait > 0:
+                print(f"Waiting {wait:.2f} seconds for the '{name}' rate limit budget") if self.verbose else None
+                time.sleep(wait)
+                waited += wait
+                with self.lock:
+                    wait = self.__wait_time(name)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+        return waited
+
+    def record_limits(self, name, m_object, last_call_before):
+        """
+        Note the budget the server reported in the X-RateLimit-* headers of the response, which Mastodon.py
+        keeps in ratelimit_remaining, ratelimit_limit and ratelimit_reset. Mastodon.py only updates those
+        (and ratelimit_lastcall) when a response has the headers, so unless ratelimit_lastcall has moved on
+        since before the call, the values are left over from an earlier call - or Mastodon.py's defaults.
+        :param name: Endpoint class, like 'read'
+        :param m_object: The Mastodon object
+        :param last_call_before: m_object.ratelimit_lastcall from before the call was made
+        """
+        if getattr(m_object, 'ratelimit_lastcall', None) == last_call_before:
+            return
+        with self.lock:
+            # Only ever lower the bucket to the server's remaining budget: another client using the
+            # same token may have spent some of it, but a server budget is no reason to go faster
+            self.__refill(name)
+            self.tokens[name] = min(self.tokens[name], float(m_object.ratelimit_remaining))
+            self.server_remaining[name] = m_object.ratelimit_remaining
+            self.server_limit[name] = getattr(m_object, 'ratelimit_limit', None)
+            self.server_reset[name] = getattr(m_object, 'ratelimit_reset', 0)
+
+    def call(self, m_object, method_name, *args, **kwargs):
+        """
+        Make one call to a method of the Mastodon object, within the rate limits, retrying if needed
+        :param m_object: The Mastodon object
+        :param method_name: Name of the Mastodon method, like 'account_statuses'
+        :return: Whatever the Mastodon method returns
+        """
+        from mastodon import MastodonNetworkError, MastodonRatelimitError, MastodonServerError  # Only once there is a call to make
+        name = self.endpoint_class(method_name)
+        attempt = 0
+        while True:
+            self.acquire(name)
+            with self.lock:
+                self.calls += 1
+            last_call_before = getattr(m_object, 'ratelimit_lastcall', None)
+            try:
+                result = getattr(m_object, method_name)(*args, **kwargs)
+                self.record_limits(name, m_object, last_call_before)
+                return result
+            except MastodonRatelimitError:
+                # acquire() will now wait for the server's reset time before the next try
+                self.record_limits(name, m_object, last_call_before)
+                with self.lock:
+                    self.server_remaining[name] = 0
+                if attempt >= self.max_retries:
+                    raise
+            except (MastodonNetworkError, MastodonServerError):
+                if name not in self.idempotent_classes or attempt >= self.max_retries:
+                    raise
+            # Full jitter: anywhere between no wait and the exponential backoff
+            delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+            print(f"{method_name}() failed, retrying in {delay:.2f} seconds") if self.verbose else None
+            time.sleep(delay)
+            attempt += 1
+            with self.lock:
+                self.retries += 1
+
+    def budget(self):
+        """
+        The current budget for each endpoint class
+        :return: Dictionary of endpoint class -> dictionary of tokens, capacity, server_remaining, server_limit and reset_in seconds
+        """
+        with self.lock:
+            status = {}
+            for name, (capacity, refill_seconds) in self.buckets.items():
+                self.__refill(name)
+                status[name] = {
+                    'tokens': self.tokens[name],
+                    'capacity': capacity,
+                    'server_remaining': self.server_remaining.get(name),
+                    'server_limit': self.server_limit.get(name),
+                    'reset_in': max(self.server_reset[name] - time.time(), 0) if name in self.server_reset else None
+                }
+            return status
+
+    def queue_depth(self):
+        """
+        Number of calls currently waiting for budget
+        :return: Integer
+        """
+        return self.waiting
@@ -0,0 +1,254 @@
+import bisect
+import contextlib
+import io
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+import pytz
+from MastodonWrapper import MastodonWrapper
+from PostingDaemon import PostingDaemon
+from RequestScheduler import RequestScheduler
+from SpanRecorder import SpanRecorder
+from StatusRecord import text_fingerprint
+
+_re_hashtags = re.compile(r'(?<![\w/])#(\w+)')
+
+
+class VirtualClock:
+    def __init__(self, start):
+        """
+        A clock that only moves when it is told to, for MastodonWrapper's clock argument
+        :param start: UTC epoch seconds to start at
+        """
+        self.now = float(start)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def set(self, epoch_seconds):
+        self.now = float(epoch_seconds)
+
+
+class SimulatedAccount:
+    max_characters = 500
+
+    def __init__(self, clock, username='simulated'):
+        """
+        An in-memory stand-in for a Mastodon account, for MastodonWrapper's mastodon_client argument. Implements
+        the Mastodon.py methods the wrapper calls, returning what Mastodon.py would, with every status stamped
+        with the clock's time and given an ID that sorts by that time, as Mastodon's do.
+        :param clock: Callable returning the current UTC epoch seconds, like VirtualClock
+        :param username: Account name
+        """
+        self.clock = clock
+        self.account = {'id': 1, 'username': username, 'acct': username, 'display_name': username.title(),
+                        'statuses_count': 0}
+        self.statuses = []  # Ascending by ID
+        self.status_ids = []
+        self.media_attachments = {}
+        self.last_id = 0
+        self.calls = 0
+
+    def __new_id(self):
+        # Like Mastodon's IDs: the milliseconds since the epoch in the high bits
+        self.last_id = max(self.last_id + 1, int(self.clock() * 1000) << 16)
+        return self.last_id
+
+    def __now(self):
+        return datetime.fromtimestamp(self.clock(), timezone.utc)
+
+    def account_verify_credentials(self):
+        self.calls += 1
+        return dict(self.account)
+
+    def instance(self):
+        self.calls += 1
+        return {'configuration': {'statuses': {'max_characters': self.max_characters},
+                                  'media_attachments': {'image_size_limit': 16777216, 'image_matrix_limit': 33177600}}}
+
+    def account_statuses(self, id, max_id=None, min_id=None, since_id=None, limit=20):
+        """
+        A page of statuses, newest first, following Mastodon's max_id, since_id and min_id rules
+        """
+        self.calls += 1
+        first = bisect.bisect_right(self.status_ids, max(int(since_id or 0), int(min_id or 0)))
+        last = bisect.bisect_left(self.status_ids, int(max_id)) if max_id is not None else len(self.status_ids)
+        if min_id is not None:
+            page = self.statuses[first:min(first + limit, last)]
+        else:
+            page = self.statuses[max(last - limit, first):last]
+        return list(reversed(page))
+
+    def media_post(self, media_file, description=None, **kwargs):
+        self.calls += 1
+        media_id = self.__new_id()
+        media = {'id': media_id, 'type': 'image', 'url': f"simulated://media/{media_id}", 'description': description,
+                 'meta': {'original': {'width': None, 'height': None}}}
+        self.media_attachments[media_id] = media
+        return media
+
+    def media(self, id):
+        self.calls += 1
+        return self.media_attachments[int(id)]
+
+    def status_post(self, status, media_ids=None, spoiler_text=None, sensitive=False, **kwargs):
+        from mastodon import MastodonAPIError
+        from MockMastodonServer import MockMastodonServer  # For its escape(), only once something is posted
+        self.calls += 1
+        if len(status) > self.max_characters:
+            raise MastodonAPIError('Mastodon API returned error', 422, 'Unprocessable Entity',
+                                   f"Validation failed: Text character limit of {self.max_characters} exceeded")
+        media_ids = [media_ids] if media_ids is not None and not isinstance(media_ids, (list, tuple)) else media_ids or []
+        status_id = self.__new_id()
+        posted = {
+            'id': status_id, 'created_at': self.__now(), 'content': f"<p>{MockMastodonServer.escape(status)}</p>",
+            'visibility': 'public', 'url': f"simulated://{self.account['username']}/{status_id}",
+            'spoiler_text': spoiler_text or '', 'sensitive': sensitive, 'account': self.account, 'mentions': [],
+            'tags': [{'name': tag} for tag in dict.fromkeys(tag.lower() for tag in _re_hashtags.findall(status))],
+            'media_attachments': [self.media_attachments[int(media_id)] for media_id in media_ids], 'reblog': None,
+            'favourites_count': 0, 'reblogs_count': 0, 'replies_count': 0
+        }
+        self.statuses.append(posted)
+        self.status_ids.append(status_id)
+        self.account['statuses_count'] = len(self.statuses)
+        return posted
+
+
+class ScheduleSimulator:
+    def __init__(self, schedule, time_zone, post_limit_hours, start=None, days=None, mode='cron',
+                 check_every_minutes=60, log_file=None, verbose=False):
+        """
+        Replays a posting schedule through the wrapper's real decision pipeline, against a SimulatedAccount and
+        a VirtualClock, so a whole year of posting decisions takes seconds. Time is kept in UTC and every
+        decision is made in time_zone's local time, so the days on either side of the daylight saving changes
+        are simulated as they will happen.
+        mode 'cron' runs the checks client_3_post_update.py makes, every check_every_minutes, the way cron would
+        start it. mode 'daemon' runs PostingDaemon.run_once(), jumping the clock straight to each wake up time.
+        :param schedule: DataForUpdates with the schedule to replay
+        :param time_zone: Time zone to post in, like 'America/Toronto'
+        :param post_limit_hours: Minimum hours between posts
+        :param start: Local date to start on (datetime.date), by default January 1st of this year
+        :param days: Number of days to simulate, by default a year
+        :param mode: 'cron' or 'daemon'
+        :param check_every_minutes: How often cron starts the script, in 'cron' mode
+        :param log_file: File for the wrapper's log, as client_7_posting_daemon.py keeps it - in 'daemon' mode
+                         the rows are then dropped from memory as they are written
+        :param verbose: Set to TRUE to see everything the wrapper prints, rather than only the decisions
+        """
+        self.schedule = schedule
+        self.time_zone = time_zone
+        self.local_timezone = pytz.timezone(time_zone)
+        self.post_limit_hours = post_limit_hours
+        self.start = start if start else datetime.now(self.local_timezone).date().replace(month=1, day=1)
+        self.days = days if days else (date(self.start.year + 1, 1, 1) - date(self.start.year, 1, 1)).days
+        self.mode = mode
+        self.check_every_minutes = check_every_minutes
+        self.log_file = log_file
+        self.verbose = verbose
+        self.decisions = []
+        self.wrapper = None
+        self.account = None
+
+    def __local_midnight(self, day):
+        return self.local_timezone.localize(datetime(day.year, day.month, day.day)).timestamp()
+
+    def run(self):
+        """
+        Simulate every day from start
+        :return: List of decision dictionaries, with the local 'time', 'action', 'details', 'seconds' the decision
+                 took and the number of 'api_calls' it made
+        """
+        clock = VirtualClock(self.__local_midnight(self.start))
+        end = self.__local_midnight(self.start + timedelta(days=self.days))
+        self.account = SimulatedAccount(clock)
+        # A scheduler with no limits: its token buckets refill in real time, which stands still here
+        scheduler = RequestScheduler(buckets={name: (10 ** 9, 1) for name in RequestScheduler.default_buckets})
+        self.wrapper = MastodonWrapper(base_url='simulated://', access_token='simulated', time_zone=self.time_zone,
+                                       ok_to_post='yes', mastodon_client=self.account, clock=clock, log_file=self.log_file,
+                                       request_scheduler=scheduler, span_recorder=SpanRecorder())
+        self.decisions = []
+        daemon = PostingDaemon(self.wrapper, self.schedule, self.post_limit_hours) if self.mode == 'daemon' else None
+        started = time.perf_counter()
+        while clock() < end:
+            if daemon:
+                step = self.__timed(daemon.run_once)
+                self.__record(clock, step['action'], step['details'], step)
+                clock.set(max(step['wake_at'], clock() + 1))
+            else:
+                action, details, step = self.__timed_cron_run()
+                self.__record(clock, action, details, step)
+                clock.advance(self.check_every_minutes * 60)
+        print(f"Simulated {self.days} days from {self.start} ({len(self.decisions)} decisions, "
+              f"{len(self.account.statuses)} posts) in {time.perf_counter() - started:.2f} seconds")
+        return self.decisions
+
+    def __timed(self, function):
+        calls_before, started = self.account.calls, time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()) if not self.verbose else contextlib.nullcontext():
+            result = function()
+        result = result if isinstance(result, dict) else {'result': result}
+        result['seconds'] = time.perf_counter() - started
+        result['api_calls'] = self.account.calls - calls_before
+        return result
+
+    def __timed_cron_run(self):
+        step = self.__timed(self.cron_run)
+        action, details = step.pop('result')
+        return action, details, step
+
+    def cron_run(self):
+        """
+        The decisions client_3_post_update.py makes each time cron starts it
+        :return: Tuple of (action, details) - action is 'nothing_scheduled', 'already_posted', 'deferred',
+                 'posted', 'skipped' (nothing was posted, like for a missing image) or 'error'
+        """
+        m = self.wrapper
+        today = datetime.fromtimestamp(m.clock(), self.local_timezone).date()
+        postings = self.schedule.postings_for(today.month, today.day)
+        if not postings:
+            return 'nothing_scheduled', f"No posting for {today:%B %d}"
+        m.sync_statuses(force=True)  # As a new process would
+        new_postings = [p for p, posted in zip(postings, m.already_posted_batch(postings)) if not posted]
+        if not new_postings:
+            return 'already_posted', f"All {len(postings)} postings for {today:%B %d} have been posted"
+        hours_since = m.hours_since_last_post()
+        if hours_since < self.post_limit_hours:
+            return 'deferred', f"{hours_since:.2f} hours since the last post, next at {m.time_for_next_post(self.post_limit_hours):%Y-%m-%d %H:%M}"
+        posting = new_postings[0]
+        try:
+            if m.post_update(posting):
+                return 'posted', posting['full_update_text']
+            return 'skipped', f"Not posted: {posting['full_update_text']}"
+        except Exception as e:
+            return 'error', f"{e}: {posting['full_update_text']}"
+
+    def __record(self, clock, action, details, step):
+        self.decisions.append({
+            'time': datetime.fromtimestamp(clock(), self.local_timezone).strftime('%Y-%m-%d %H:%M:%S %Z'),
+            'action': action, 'details': details, 'seconds': step['seconds'], 'api_calls': step['api_calls']
+        })
+
+    def unposted(self):
+        """
+        The postings in the schedule that were never posted during the simulation - scheduled outside the
+        simulated days (like February 29th in most years), or never posted on their day
+        :return: List of posting dictionaries
+        """
+        posted = {text_fingerprint(record.text) for record in self.wrapper.status_store.records()}
+        return [posting for postings in self.schedule.index.values() for posting in postings
+                if text_fingerprint(posting['full_update_text']) not in posted]
+
+    def summary(self):
+        """
+        The number of decisions of each kind and how long they took
+        :return: pandas DataFrame indexed by action
+        """
+        import pandas as pd  # Only needed for the report
+        decisions = pd.DataFrame(self.decisions)
+        decisions['ms'] = decisions['seconds'] * 1000
+        return decisions.groupby('action').agg(
+            decisions=('ms', 'size'), mean_ms=('ms', 'mean'), p95_ms=('ms', lambda ms: ms.quantile(0.95)),
+            max_ms=('ms', 'max'), api_calls=('api_calls', 'sum')).round(3)
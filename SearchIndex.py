@@ -0,0 +1,114 @@
+import re
+from StatusRecord import StatusRecord
+
+_re_query_terms = re.compile(r'#?[\w\'-]+\*?')
+
+
+class SearchIndex:
+    # Bump this if the layout of the index changes, so it is rebuilt from the statuses
+    index_version = 1
+    schema = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS status_search USING fts5 (
+            text, tags, media, tokenize = 'unicode61 remove_diacritics 2'
+        );
+        -- Statuses added (or replaced) since the last update() - filled by the trigger on the statuses table
+        CREATE TABLE IF NOT EXISTS search_pending (
+            status_id INTEGER PRIMARY KEY
+        );
+        CREATE TRIGGER IF NOT EXISTS statuses_search_pending AFTER INSERT ON statuses BEGIN
+            INSERT OR IGNORE INTO search_pending VALUES (new.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS statuses_search_delete AFTER DELETE ON statuses BEGIN
+            DELETE FROM status_search WHERE rowid = old.id;
+            DELETE FROM search_pending WHERE status_id = old.id;
+        END;
+    """
+    # Relative weight of a match in the text, the tags and the media descriptions (ALT text)
+    column_weights = (1.0, 2.0, 0.5)
+
+    def __init__(self, status_store, verbose=False):
+        """
+        A full text index of the account's own posts - the normalized text, the tags and the ALT text of the
+        media - kept in SQLite's FTS5 alongside the StatusStore tables, so it is saved with them. Statuses
+        added to the store are queued by a trigger and indexed by the next update(), so the index is built
+        up incrementally as the history is synced.
+        :param status_store: The StatusStore to index
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.status_store = status_store
+        self.db = status_store.db
+        self.verbose = verbose
+        status_store.create_tables(self.schema)
+        if self.status_store.get_state('search_index_version') != str(self.index_version):
+            # A new (or outdated) index - queue every status already in the store
+            with self.status_store.lock, self.db:
+                self.db.execute("DELETE FROM status_search")
+                self.db.execute("INSERT OR IGNORE INTO search_pending SELECT id FROM statuses")
+            self.status_store.set_state('search_index_version', self.index_version)
+
+    def update(self):
+        """
+        Index the statuses added to the store since the last update
+        :return: Number of statuses indexed
+        """
+        with self.status_store.lock, self.db:
+            pending = self.db.execute("SELECT COUNT(*) FROM search_pending").fetchone()[0]
+            if not pending:
+                return 0
+            self.db.execute("DELETE FROM status_search WHERE rowid IN (SELECT status_id FROM search_pending)")
+            self.db.execute("""
+                INSERT INTO status_search (rowid, text, tags, media)
+                SELECT statuses.id, statuses.text,
+                    (SELECT group_concat(tag, ' ') FROM status_tags WHERE status_id = statuses.id),
+                    (SELECT group_concat(description, ' ') FROM media WHERE status_id = statuses.id)
+                FROM search_pending JOIN statuses ON statuses.id = search_pending.status_id
+                WHERE statuses.reblog_id IS NULL""")
+            self.db.execute("DELETE FROM search_pending")
+        print(f"Added {pending} statuses to the search index") if self.verbose else None
+        return pending
+
+    @staticmethod
+    def match_expression(query):
+        """
+        Turn a plain search like 'union station #OTD' into an FTS5 query: every word has to match,
+        #words only match tags, and a trailing * matches any word starting with what comes before it
+        :param query: Search words
+        :return: FTS5 MATCH expression, or None if there is nothing to search for
+        """
+        terms = []
+        for term in _re_query_terms.findall(query):
+            prefix = '*' if term.endswith('*') else ''
+            word = term.rstrip('*').lstrip('#').replace('"', '')
+            if not word:
+                continue
+            terms.append(f'tags : "{word.lower()}"{prefix}' if term.startswith('#') else f'"{word}"{prefix}')
+        return ' AND '.join(terms) if terms else None
+
+    def search(self, query, limit=20):
+        """
+        The posts that best match the query, best match first
+        :param query: Search words, like 'union station #OTD' or 'turbin*'
+        :param limit: Maximum number of results
+        :return: List of dictionaries with 'record' (StatusRecord), 'score' (higher is better) and 'snippet'
+        """
+        self.update()
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in self.column_weights)
+        with self.status_store.lock:
+            rows = self.db.execute(f"""
+                SELECT status_search.rowid AS status_id, bm25(status_search, {weights}) AS rank,
+                    snippet(status_search, 0, '[', ']', '...', 12) AS snippet
+                FROM status_search WHERE status_search MATCH ? ORDER BY rank LIMIT ?""", (expression, limit)).fetchall()
+            if not rows:
+                return []
+            records = {row['id']: StatusRecord.from_row(row) for row in self.db.execute(
+                f"{self.status_store.records_query} WHERE statuses.id IN ({','.join('?' * len(rows))})",
+                [row['status_id'] for row in rows])}
+        return [{'record': records[row['status_id']], 'score': -row['rank'], 'snippet': row['snippet']}
+                for row in rows if row['status_id'] in records]
+
+    def __len__(self):
+        with self.status_store.lock:
+            return self.db.execute("SELECT COUNT(*) FROM status_search").fetchone()[0]
@@ -0,0 +1,165 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+
+# The recorder of the span running on each thread, for count_transfer_bytes()
+_current = threading.local()
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'attributes', 'start_ns', 'outer_recorder')
+
+    def __init__(self, recorder, name, attributes):
+        self.recorder = recorder
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.outer_recorder = getattr(_current, 'recorder', None)
+        _current.recorder = self.recorder
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current.recorder = self.outer_recorder
+        self.recorder.record(self.name, self.start_ns, time.perf_counter_ns() - self.start_ns,
+                             exc_type.__name__ if exc_type else None, self.attributes)
+        return False
+
+
+class SpanRecorder:
+    def __init__(self, export_file=None, keep_spans=10000):
+        """
+        Timings of the API calls and stages of a run. Each span is timed with time.perf_counter_ns()
+        and kept as a tuple, along with running totals per span name and a set of counters, so it is
+        cheap enough to leave on. The spans can be exported as JSONL, or summarized as a table.
+        :param export_file: JSONL file that export() appends the spans to, or None to keep them in memory only
+        :param keep_spans: Number of the most recent spans to keep - the totals in summary() include every span
+        """
+        self.export_file = export_file
+        self.spans = deque(maxlen=keep_spans)  # (name, start_ns, duration_ns, error, attributes)
+        self.recorded_spans = 0
+        self.exported_spans = 0
+        self.totals = {}  # name -> [count, total_ns, max_ns, errors]
+        self.counters = {}
+        self.epoch_ns = time.time_ns() - time.perf_counter_ns()  # To turn perf_counter_ns() into wall clock time
+        self.lock = threading.Lock()
+
+    def span(self, name, **attributes):
+        """
+        Time a block of code:
+            with spans.span('api.status_post'):
+                ...
+        :param name: Name of the span, like 'api.account_statuses' or 'already_posted'
+        :param attributes: Any extra details to keep with the span
+        :return: Context manager
+        """
+        return _Span(self, name, attributes)
+
+    def record(self, name, start_ns, duration_ns, error=None, attributes=None):
+        """
+        Add a span that was timed elsewhere
+        :param name: Name of the span
+        :param start_ns: time.perf_counter_ns() when it started
+        :param duration_ns: How long it took, in nanoseconds
+        :param error: Name of the exception it ended with, if any
+        :param attributes: Dictionary of any extra details
+        :return: None
+        """
+        with self.lock:
+            self.spans.append((name, start_ns, duration_ns, error, attributes))
+            self.recorded_spans += 1
+            totals = self.totals.get(name)
+            if totals is None:
+                self.totals[name] = [1, duration_ns, duration_ns, 1 if error else 0]
+            else:
+                totals[0] += 1
+                totals[1] += duration_ns
+                totals[2] = max(totals[2], duration_ns)
+                totals[3] += 1 if error else 0
+
+    def count(self, name, value=1):
+        """
+        Add to a counter, like 'api_calls' or 'bytes_sent'
+        :return: None
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """
+        Totals for each span name, slowest total first
+        :return: List of dictionaries with name, count, total_ms, mean_ms, max_ms and errors
+        """
+        with self.lock:
+            rows = [{'name': name, 'count': count, 'total_ms': total_ns / 1e6, 'mean_ms': total_ns / count / 1e6,
+                     'max_ms': max_ns / 1e6, 'errors': errors}
+                    for name, (count, total_ns, max_ns, errors) in self.totals.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def summary_table(self):
+        """
+        The summary() and the counters as a plain text table
+        :return: String
+        """
+        lines = [f"{'span': <36}{'count': >8}{'total ms': >12}{'mean ms': >12}{'max ms': >12}{'errors': >8}"]
+        for row in self.summary():
+            lines.append(f"{row['name']: <36}{row['count']: >8}{row['total_ms']: >12.2f}{row['mean_ms']: >12.2f}"
+                         f"{row['max_ms']: >12.2f}{row['errors']: >8}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name: <36}{value: >8}")
+        return "\n".join(lines)
+
+    def export(self, file_name=None):
+        """
+        Append the spans not yet exported to a JSONL file, one span per line with wall clock start times
+        :param file_name: JSONL file, or None for the export_file given when the object was created
+        :return: Number of spans written
+        """
+        file_name = file_name if file_name else self.export_file
+        if not file_name:
+            return 0
+        with self.lock:
+            # Spans dropped from the deque before they were exported are only counted in the totals
+            new_count = min(self.recorded_spans - self.exported_spans, len(self.spans))
+            new_spans = list(self.spans)[len(self.spans) - new_count:]
+            self.exported_spans = self.recorded_spans
+        with open(file_name, "a", encoding="utf-8") as outfile:
+            for name, start_ns, duration_ns, error, attributes in new_spans:
+                outfile.write(json.dumps({'name': name, 'start': (self.epoch_ns + start_ns) / 1e9,
+                                          'duration_ms': duration_ns / 1e6, 'error': error, **(attributes or {})},
+                                         default=str) + "\n")
+        return len(new_spans)
+
+    def __len__(self):
+        return len(self.spans)
+
+
+def timed(name):
+    """
+    Decorator to time every call of a method as a span, for objects with a SpanRecorder in self.spans
+    :param name: Name of the span
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.spans.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count_transfer_bytes(response, *args, **kwargs):
+    """
+    A requests response hook that adds the bytes sent and received to the counters of the SpanRecorder
+    whose span is running on this thread - so one session can be shared by several recorders.
+    Install it with session.hooks['response'].append(count_transfer_bytes)
+    """
+    recorder = getattr(_current, 'recorder', None)
+    if recorder is None:
+        return
+    recorder.count('bytes_sent', len(response.request.body or b''))
+    if not kwargs.get('stream'):  # Reading a streamed body here would consume it
+        recorder.count('bytes_received', len(response.content))
@@ -0,0 +1,104 @@
+import hashlib
+import html
+import re
+
+_re_html_tags = re.compile(r'<.*?>')
+
+
+def normalize_status_text(content):
+    """
+    Turn the HTML content of a status into the plain text that was originally posted
+    :param content: HTML content of a status, as returned by the Mastodon API
+    :return: String
+    """
+    # Tags first, then entities - so an escaped "&lt;b&gt;" in the text is kept as the "<b>" that was typed
+    return html.unescape(_re_html_tags.sub('', content or ''))
+
+
+def text_fingerprint(text):
+    """
+    A short, stable hash of the (already normalized) text of a post
+    :param text: Plain text, like DataForUpdates' full_update_text
+    :return: 32 character hex string
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class StatusRecord:
+    # Only the fields the wrapper uses - no dictionary per record, no nested account or media objects
+    __slots__ = ('id', 'created_at', 'text', 'fingerprint', 'visibility', 'url', 'mentions', 'tags', 'media_ids',
+                 'reblog_id', 'reblog_text', 'reblog_created_at')
+
+    def __init__(self, id, created_at, text, fingerprint=None, visibility=None, url=None, mentions=(), tags=(),
+                 media_ids=(), reblog_id=None, reblog_text=None, reblog_created_at=None):
+        """
+        A compact copy of one status. The text is already normalized and the times are UTC epoch
+        seconds, so nothing needs to be parsed again after the status is read.
+        :param id: Status ID, as an integer
+        :param created_at: UTC epoch seconds
+        :param text: Plain text of the status, as compared by already_posted()
+        :param fingerprint: text_fingerprint() of the text, None for reblogs
+        :param tags: Tuple of lower case tag names, without the '#'
+        :param media_ids: Tuple of the IDs of the media attachments
+        """
+        self.id = id
+        self.created_at = created_at
+        self.text = text
+        self.fingerprint = fingerprint
+        self.visibility = visibility
+        self.url = url
+        self.mentions = mentions
+        self.tags = tags
+        self.media_ids = media_ids
+        self.reblog_id = reblog_id
+        self.reblog_text = reblog_text
+        self.reblog_created_at = reblog_created_at
+
+    @classmethod
+    def from_status(cls, status):
+        """
+        Convert a status dictionary, as returned by Mastodon.account_statuses(), once as it is read
+        :param status: Status dictionary
+        :return: StatusRecord
+        """
+        reblog = status.get('reblog')
+        text = normalize_status_text(status.get('content'))
+        return cls(
+            id=int(status['id']),
+            created_at=status['created_at'].timestamp(),
+            text=text,
+            fingerprint=None if reblog else text_fingerprint(text),
+            visibility=status.get('visibility'),
+            url=status.get('url'),
+            mentions=tuple(mention['acct'] for mention in status.get('mentions') or []),
+            tags=tuple(dict.fromkeys(tag['name'].lower() for tag in status.get('tags') or [])),
+            media_ids=tuple(str(media['id']) for media in status.get('media_attachments') or []),
+            reblog_id=int(reblog['id']) if reblog else None,
+            reblog_text=normalize_status_text(reblog['content']) if reblog else None,
+            reblog_created_at=reblog['created_at'].timestamp() if reblog else None
+        )
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Build a record from a row of StatusStore's records query
+        :param row: sqlite3.Row with the statuses columns, plus space separated 'tag_names' and 'media_list'
+        :return: StatusRecord
+        """
+        return cls(
+            id=row['id'],
+            created_at=row['created_at'],
+            text=row['text'],
+            fingerprint=row['fingerprint'],
+            visibility=row['visibility'],
+            url=row['url'],
+            mentions=tuple(row['mentions'].split()) if row['mentions'] else (),
+            tags=tuple(row['tag_names'].split()) if row['tag_names'] else (),
+            media_ids=tuple(row['media_list'].split()) if row['media_list'] else (),
+            reblog_id=row['reblog_id'],
+            reblog_text=row['reblog_text'],
+            reblog_created_at=row['reblog_created_at']
+        )
+
+    def __repr__(self):
+        return f"StatusRecord {self.id} at {self.created_at}: {self.text[:40]!r}"
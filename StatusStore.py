@@ -0,0 +1,247 @@
+import sqlite3  # https://docs.python.org/3/library/sqlite3.html
+import threading
+import time
+from StatusRecord import StatusRecord, text_fingerprint
+
+
+class StatusStore:
+    schema = """
+        CREATE TABLE IF NOT EXISTS statuses (
+            id INTEGER PRIMARY KEY,
+            created_at REAL NOT NULL,  -- UTC epoch seconds
+            text TEXT,  -- normalized, as compared by already_posted()
+            fingerprint TEXT,  -- text_fingerprint() of the text, NULL for reblogs
+            visibility TEXT,
+            url TEXT,
+            mentions TEXT,
+            reblog_id INTEGER,
+            reblog_text TEXT,  -- normalized, like text
+            reblog_created_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS statuses_created_at ON statuses (created_at);
+        CREATE INDEX IF NOT EXISTS statuses_fingerprint ON statuses (fingerprint);
+        CREATE TABLE IF NOT EXISTS status_tags (
+            status_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (status_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS status_tags_tag ON status_tags (tag);
+        CREATE TABLE IF NOT EXISTS media (
+            id TEXT PRIMARY KEY,
+            status_id INTEGER NOT NULL,
+            type TEXT,
+            url TEXT,
+            description TEXT,
+            width INTEGER,
+            height INTEGER,
+            size TEXT
+        );
+        CREATE INDEX IF NOT EXISTS media_status_id ON media (status_id);
+        CREATE TABLE IF NOT EXISTS engagement (
+            status_id INTEGER PRIMARY KEY,
+            favourites INTEGER,
+            reblogs INTEGER,
+            replies INTEGER,
+            checked_at REAL  -- UTC epoch seconds when the counts were read
+        );
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file=None, verbose=False):
+        """
+        A local SQLite copy of the account's statuses, tags and media, so the wrapper can answer
+        questions about the whole posting history with a local query instead of an API call.
+        :param db_file: SQLite database file, or None to keep the store in memory for this run only
+        :param verbose: Set to TRUE to have some debug and status info printed
+        """
+        self.db_file = db_file if db_file else ':memory:'
+        self.verbose = verbose
+        # check_same_thread=False: callers may use the store from a worker thread (like the streaming listener),
+        # so every query holds the lock - to keep one thread's transaction from committing another's half done,
+        # and a read from seeing another thread's uncommitted rows
+        self.db = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.db.row_factory = sqlite3.Row
+        self.create_tables(self.schema)
+
+    def create_tables(self, sql):
+        """
+        Run a script of CREATE statements, like the schema of SearchIndex or MediaInventory, on the store's
+        database. executescript() commits any open transaction first, so it holds the lock like a write.
+        :param sql: SQL script
+        :return: None
+        """
+        with self.lock:
+            self.db.executescript(sql)
+
+    def add_statuses(self, statuses):
+        """
+        Insert or update a page of statuses, as returned by Mastodon.account_statuses()
+        :param statuses: List of status dictionaries
+        :return: Number of statuses stored
+        """
+        checked_at = time.time()
+        with self.lock, self.db:
+            for status in statuses:
+                record = StatusRecord.from_status(status)  # All the parsing is done here, once
+                status_id = record.id
+                self.db.execute(
+                    "INSERT OR REPLACE INTO statuses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (status_id, record.created_at, record.text, record.fingerprint, record.visibility, record.url,
+                     ' '.join(record.mentions), record.reblog_id, record.reblog_text, record.reblog_created_at))
+                self.db.execute("DELETE FROM status_tags WHERE status_id = ?", (status_id,))
+                self.db.executemany("INSERT OR IGNORE INTO status_tags VALUES (?, ?)", [(status_id, tag) for tag in record.tags])
+                if 'favourites_count' in status:  # Not in statuses imported from an archive
+                    self.db.execute("INSERT OR REPLACE INTO engagement VALUES (?, ?, ?, ?, ?)",
+                                    (status_id, status.get('favourites_count') or 0, status.get('reblogs_count') or 0,
+                                     status.get('replies_count') or 0, checked_at))
+                self.db.execute("DELETE FROM media WHERE status_id = ?", (status_id,))
+                for media in status.get('media_attachments') or []:
+                    original = (media.get('meta') or {}).get('original') or {}
+                    self.db.execute("INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (str(media['id']), status_id, media.get('type'), media.get('url'),
+                                     media.get('description'), original.get('width'), original.get('height'),
+                                     original.get('size')))
+        return len(statuses)
+
+    def delete_status(self, status_id):
+        """
+        Remove a status deleted on the server, with its tags, media and engagement counts
+        :param status_id: ID of the status
+        :return: True if the status was in the store
+        """
+        status_id = int(status_id)
+        with self.lock, self.db:
+            deleted = self.db.execute("DELETE FROM statuses WHERE id = ?", (status_id,)).rowcount
+            for table in ('status_tags', 'media', 'engagement'):
+                self.db.execute(f"DELETE FROM {table} WHERE status_id = ?", (status_id,))
+        return deleted > 0
+
+    def newest_id(self):
+        """
+        ID of the newest status in the store - the starting point for fetching newer statuses
+        :return: Integer, or None if the store is empty
+        """
+        with self.lock:
+            return self.db.execute("SELECT MAX(id) FROM statuses").fetchone()[0]
+
+    def oldest_id(self):
+        """
+        ID of the oldest status in the store - the starting point for fetching older history
+        :return: Integer, or None if the store is empty
+        """
+        with self.lock:
+            return self.db.execute("SELECT MIN(id) FROM statuses").fetchone()[0]
+
+    def status_ids(self):
+        """
+        The IDs of every status in the store, oldest first
+        :return: List of integers
+        """
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT id FROM statuses ORDER BY id")]
+
+    def latest_created_at(self):
+        """
+        When the newest status in the store was posted - enough to check the posting frequency
+        without connecting to the server
+        :return: UTC epoch seconds, or None if the store is empty
+        """
+        with self.lock:
+            return self.db.execute("SELECT MAX(created_at) FROM statuses").fetchone()[0]
+
+    # Each status with its tags and media IDs, for StatusRecord.from_row()
+    records_query = """
+        SELECT statuses.*,
+            (SELECT group_concat(tag, ' ') FROM status_tags WHERE status_id = statuses.id) AS tag_names,
+            (SELECT group_concat(id, ' ') FROM media WHERE status_id = statuses.id) AS media_list
+        FROM statuses"""
+
+    def latest(self, limit=20):
+        """
+        The most recent statuses, newest first
+        :param limit: Maximum number of statuses to return
+        :return: List of StatusRecord
+        """
+        with self.lock:
+            rows = self.db.execute(f"{self.records_query} ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        return [StatusRecord.from_row(row) for row in rows]
+
+    def records(self, batch_size=1000):
+        """
+        Every status in the store as a StatusRecord, oldest first, read from the database in batches
+        :param batch_size: Number of rows to fetch at a time
+        :return: Generator of StatusRecord
+        """
+        # The lock is only held while reading each batch, not while the caller works through it
+        last = (float('-inf'), 0)
+        while True:
+            with self.lock:
+                rows = self.db.execute(f"{self.records_query} WHERE (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?",
+                                       (*last, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield StatusRecord.from_row(row)
+            last = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def tags_for(self, status_id):
+        with self.lock:
+            return [row['tag'] for row in self.db.execute("SELECT tag FROM status_tags WHERE status_id = ?", (status_id,))]
+
+    def media_for(self, status_id):
+        with self.lock:
+            return self.db.execute("SELECT * FROM media WHERE status_id = ?", (status_id,)).fetchall()
+
+    def all_media(self):
+        """
+        Every media attachment in the store, newest status first
+        :return: List of sqlite3.Row
+        """
+        with self.lock:
+            return self.db.execute("SELECT media.* FROM media JOIN statuses ON statuses.id = media.status_id "
+                                   "ORDER BY statuses.created_at DESC").fetchall()
+
+    def posted_at(self, text):
+        """
+        When the text was first posted by the account, if it ever was
+        :param text: Plain text, like DataForUpdates' full_update_text
+        :return: UTC epoch seconds, or None if it has not been posted
+        """
+        with self.lock:
+            return self.db.execute("SELECT MIN(created_at) FROM statuses WHERE fingerprint = ?",
+                                   (text_fingerprint(text),)).fetchone()[0]
+
+    def posted_fingerprints(self, texts):
+        """
+        Which of a list of texts have already been posted, in a single query
+        :param texts: List of plain texts
+        :return: Set of the fingerprints of those texts that have been posted
+        """
+        fingerprints = list({text_fingerprint(text) for text in texts})
+        found = set()
+        for i in range(0, len(fingerprints), 500):  # Stay well under SQLite's limit on query parameters
+            chunk = fingerprints[i:i + 500]
+            with self.lock:
+                found.update(row[0] for row in self.db.execute(
+                    f"SELECT DISTINCT fingerprint FROM statuses WHERE fingerprint IN ({','.join('?' * len(chunk))})", chunk))
+        return found
+
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, str(value)))
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM statuses").fetchone()[0]
+
+    def __repr__(self):
+        return f"StatusStore {self.db_file} with {len(self)} statuses"
@@ -0,0 +1,77 @@
+import time
+from mastodon.streaming import StreamListener
+
+
+class StreamStopped(Exception):
+    """
+    Raised inside the stream to leave it once stop() has been called
+    """
+
+
+class StatusStreamListener(StreamListener):
+    def __init__(self, status_store, user_id, on_connect=None, verbose=False):
+        """
+        Applies the account's own new, edited and deleted statuses from the user stream to a StatusStore
+        as they arrive. Run it with Mastodon.stream_user(), which blocks until the connection drops.
+        :param status_store: The StatusStore to keep current
+        :param user_id: The account's ID - the user stream also carries the home timeline, which is left out
+        :param on_connect: Called once each connection is open, before any of its events are read -
+                           the place to backfill whatever was missed while disconnected
+        :param verbose: Set to TRUE to have every event applied printed
+        """
+        super().__init__()
+        self.status_store = status_store
+        self.user_id = str(user_id)
+        self.on_connect = on_connect
+        self.verbose = verbose
+        self.response = None  # The open connection, so stop() can close it
+        self.stopping = False
+        self.connects = 0
+        self.last_event_at = None  # time.time() of the last event or heartbeat
+        self.counts = {'update': 0, 'status.update': 0, 'delete': 0, 'ignored': 0}
+
+    def handle_stream(self, response):
+        self.response = response
+        self.connects += 1
+        if self.on_connect:
+            self.on_connect()
+        super().handle_stream(response)
+
+    def __apply(self, event, status):
+        self.__check_stopping()
+        if str(status['account']['id']) != self.user_id:
+            self.counts['ignored'] += 1
+            return
+        self.status_store.add_statuses([status])
+        self.counts[event] += 1
+        print(f"Stream {event}: status {status['id']}") if self.verbose else None
+
+    def on_update(self, status):
+        self.__apply('update', status)
+
+    def on_status_update(self, status):
+        self.__apply('status.update', status)
+
+    def on_delete(self, status_id):
+        self.__check_stopping()
+        # Deletes are sent for any status the account can see, so only count those that were in the store
+        if self.status_store.delete_status(status_id):
+            self.counts['delete'] += 1
+            print(f"Stream delete: status {status_id}") if self.verbose else None
+
+    def handle_heartbeat(self):
+        self.__check_stopping()
+
+    def __check_stopping(self):
+        self.last_event_at = time.time()
+        if self.stopping:
+            raise StreamStopped()
+
+    def stop(self):
+        """
+        Leave the stream - at once if closing the connection interrupts the read, otherwise at the next
+        event or heartbeat
+        """
+        self.stopping = True
+        if self.response is not None:
+            self.response.close()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from MockMastodonServer import MockMastodonServer
+from MastodonWrapper import MastodonWrapper
+from RequestScheduler import RequestScheduler
+
+# Benchmarks for MastodonWrapper, run against a local MockMastodonServer rather than a live instance:
+#
+#   python benchmark_mastodon_wrapper.py --sizes 100,10000,100000 --output benchmark-results.json
+#
+# The results are written as JSON, so they can be compared release to release.
+#
+
+
+def unlimited_scheduler():
+    """
+    A RequestScheduler that never holds a call back - the benchmarks measure the wrapper, not Mastodon's rate limits
+    """
+    return RequestScheduler(buckets={name: (10 ** 9, 1) for name in RequestScheduler.default_buckets})
+
+
+def new_wrapper(server, **kwargs):
+    return MastodonWrapper(base_url=server.base_url, access_token='benchmark-token', time_zone='America/Toronto',
+                           ok_to_post=kwargs.pop('ok_to_post', 'no'), request_scheduler=unlimited_scheduler(), **kwargs)
+
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start_time, result
+
+
+def bench_construction(args, work_folder):
+    results = []
+    with MockMastodonServer(latency_seconds=args.latency) as server:
+        seconds, m = timed(new_wrapper, server)
+        results.append({'name': 'construct', 'seconds': seconds, 'requests': server.requests})
+        cache_file = os.path.join(work_folder, 'profile-cache.json')
+        new_wrapper(server, profile_cache_file=cache_file)
+        requests_before = server.requests
+        seconds, m = timed(new_wrapper, server, profile_cache_file=cache_file)
+        results.append({'name': 'construct_profile_cached', 'seconds': seconds, 'requests': server.requests - requests_before})
+    return results
+
+
+def bench_already_posted(args, work_folder):
+    results = []
+    for size in args.sizes:
+        with MockMastodonServer(statuses=size, latency_seconds=args.latency) as server:
+            m = new_wrapper(server)
+            old_text = "Seeded post number 1 - it's from the archive & more #OTD"
+            seconds, found = timed(m.already_posted, {'full_update_text': old_text})
+            assert found, "The seeded post should be found"
+            results.append({'name': f'already_posted_first_call_{size}', 'n': size, 'seconds': seconds, 'requests': server.requests})
+
+            lookups = 1000
+            start_time = time.perf_counter()
+            for i in range(lookups):
+                m.already_posted({'full_update_text': f"Not posted yet {i}"})
+            seconds = time.perf_counter() - start_time
+            results.append({'name': f'already_posted_lookup_{size}', 'n': size, 'seconds': seconds / lookups, 'lookups': lookups})
+
+            postings = [{'full_update_text': f"Seeded post number {i} - it's from the archive & more #OTD"} for i in range(366)]
+            seconds, posted = timed(m.already_posted_batch, postings)
+            results.append({'name': f'already_posted_batch_366_{size}', 'n': size, 'seconds': seconds})
+    return results
+
+
+def bench_log(args, work_folder):
+    results = []
+    with MockMastodonServer() as server:
+        m = new_wrapper(server)
+        response = {'id': '110000000000000001', 'content': '<p>' + 'x' * 300 + '</p>', 'media_attachments': [],
+                    'account': {'id': '1', 'username': 'mockbot'}, 'visibility': 'public'}
+        start_time = time.perf_counter()
+        for i in range(args.log_rows):
+            m.to_log("Benchmark status_post()", response)
+        results.append({'name': f'to_log_{args.log_rows}', 'n': args.log_rows, 'seconds': time.perf_counter() - start_time})
+        seconds, df = timed(m.log_df)
+        results.append({'name': f'log_df_{args.log_rows}', 'n': args.log_rows, 'seconds': seconds})
+        seconds, _ = timed(m.save_log_to_csv, path_name=work_folder + os.sep)
+        results.append({'name': f'save_log_to_csv_{args.log_rows}', 'n': args.log_rows, 'seconds': seconds})
+    return results
+
+
+def bench_post_cycle(args, work_folder):
+    results = []
+    image_file = os.path.join(work_folder, 'benchmark-image.jpeg')
+    with open(image_file, 'wb') as outfile:
+        outfile.write(os.urandom(200_000))
+    for with_media in (False, True):
+        with MockMastodonServer(statuses=100, latency_seconds=args.latency,
+                                media_processing_seconds=args.media_processing) as server:
+            details = {
+                'month': 12, 'day': 28, 'image_name': 'benchmark-image.jpeg' if with_media else '',
+                'full_image_name': image_file, 'image_text': 'A benchmark image',
+                'full_update_text': f"Benchmark post {'with' if with_media else 'without'} media #OTD",
+                'spoiler_text': None, 'sensitive': False
+            }
+
+            def post_cycle():
+                m = new_wrapper(server, ok_to_post='yes')
+                if m.already_posted_batch([details])[0]:
+                    raise RuntimeError("Benchmark post already posted")
+                m.hours_since_last_post()
+                return m.post_update(details)
+
+            seconds, res = timed(post_cycle)
+            assert res, "The benchmark post should have been made"
+            results.append({'name': f"post_cycle_{'media' if with_media else 'text'}", 'seconds': seconds,
+                            'requests': server.requests})
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+benchmarks = {
+    'construction': bench_construction,
+    'already_posted': bench_already_posted,
+    'log': bench_log,
+    'post_cycle': bench_post_cycle,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark MastodonWrapper against a local mock Mastodon server")
+    parser.add_argument('--sizes', default='100,10000,100000', help="History sizes for the already_posted benchmarks")
+    parser.add_argument('--log-rows', type=int, default=5000, help="Rows for the to_log benchmarks")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of latency the mock server adds to each request")
+    parser.add_argument('--media-processing', type=float, default=0.5, help="Seconds the mock server takes to process media")
+    parser.add_argument('--only', default=','.join(benchmarks), help="Comma separated benchmarks to run")
+    parser.add_argument('--output', default='benchmark-results.json', help="JSON file to write the results to")
+    args = parser.parse_args()
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    all_results = []
+    with tempfile.TemporaryDirectory() as work_folder:
+        for name in args.only.split(','):
+            print(f"Running the {name} benchmarks...")
+            all_results.extend(benchmarks[name](args, work_folder))
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'settings': {'sizes': args.sizes, 'log_rows': args.log_rows, 'latency': args.latency,
+                     'media_processing': args.media_processing},
+        'results': all_results
+    }
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=1)
+
+    print(f"\n{'benchmark': <40}{'seconds': >14}")
+    for result in all_results:
+        print(f"{result['name']: <40}{result['seconds']: >14.6f}")
+    print(f"\nResults written to {args.output}")
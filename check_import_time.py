@@ -0,0 +1,86 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Checks how long it takes to import each module of the package, against a budget:
+#
+#   python check_import_time.py
+#
+# Each module is imported in a fresh interpreter with -X importtime, best of a few runs, and the
+# script exits with 1 if any module is over its budget - so a heavy import that sneaks back in
+# at module level (pandas, Mastodon.py, Pillow) is caught before it slows down every cron run.
+#
+
+# Milliseconds, for the cumulative import time of each module on a small VM
+import_budgets = {
+    'LogBuffer': 15,
+    'ProfileCache': 15,
+    'StatusRecord': 15,
+    'StatusStore': 20,
+    'SearchIndex': 20,
+    'ArchiveImporter': 20,
+    'EngagementAnalytics': 10,
+    'RequestScheduler': 15,
+    'CachingSession': 150,  # Almost all of it is requests, which Mastodon.py needs anyway
+    'SpanRecorder': 15,
+    'ImagePreparer': 20,
+    'MediaInventory': 20,
+    'DataForUpdates': 20,
+    'PostingDaemon': 25,
+    'MastodonWrapper': 80,
+    'ScheduleSimulator': 90,
+}
+
+_re_import_line = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_time_ms(module, runs=3):
+    """
+    Cumulative time to import a module in a fresh interpreter, as reported by -X importtime
+    :param module: Module name, like 'MastodonWrapper'
+    :param runs: Number of runs - the fastest one is reported
+    :return: Tuple of (milliseconds, list of the (milliseconds, name) of the slowest modules it imported)
+    """
+    best = None
+    for run in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            raise RuntimeError(f"Unable to import {module}: {result.stderr.strip().splitlines()[-1]}")
+        imports = []
+        for line in result.stderr.splitlines():
+            match = _re_import_line.match(line)
+            if match:
+                imports.append((int(match.group(2)) / 1000, match.group(4), len(match.group(3))))
+        position = next(i for i, (ms, name, indent) in enumerate(imports) if name == module)
+        total, module_indent = imports[position][0], imports[position][2]
+        if best is None or total < best[0]:
+            # The modules it imported are listed just before it, indented one level deeper
+            direct = []
+            for ms, name, indent in reversed(imports[:position]):
+                if indent <= module_indent:
+                    break
+                if indent == module_indent + 2:
+                    direct.append((ms, name))
+            best = (total, sorted(direct, reverse=True)[:3])
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the import time of each module against a budget")
+    parser.add_argument('--runs', type=int, default=3, help="Runs per module, the fastest one counts")
+    args = parser.parse_args()
+
+    over_budget = []
+    print(f"{'module': <20}{'ms': >10}{'budget': >10}   slowest imports")
+    for module, budget in import_budgets.items():
+        ms, slowest = import_time_ms(module, runs=args.runs)
+        print(f"{module: <20}{ms: >10.1f}{budget: >10}   {', '.join(f'{name} {t:.1f}' for t, name in slowest)}")
+        if ms > budget:
+            over_budget.append(module)
+    if over_budget:
+        print(f"\nOver budget: {', '.join(over_budget)}")
+        exit(1)
+    print("\nAll modules are within their import time budget")
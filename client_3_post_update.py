@@ -1,8 +1,14 @@
 import csv  # https://docs.python.org/3/library/csv.html
-from MastodonWrapper import *
-from DataForUpdates import *
-# from datetime import datetime, timedelta
-# import pytz
+import os
+import time
+from datetime import datetime
+import pytz
+from DataForUpdates import DataForUpdates
+from LogBuffer import LogBuffer
+from MastodonWrapper import MastodonWrapper
+from SpanRecorder import SpanRecorder
+from StatusRecord import text_fingerprint
+from StatusStore import StatusStore
 # Third client file - actually make a post
 #
 
@@ -10,6 +16,12 @@ show_verbose_details = False
 post_if_all_ok = "ask"  # no | yes | ask
 
 # Step 1. Read local configuration file and get API key
+start_ns = time.perf_counter_ns()
+profile_cache_file = None  # Optional - cache the account profile between runs
+status_store_file = None  # Optional - SQLite file to keep the local copy of the posting history between runs
+image_cache_folder = None  # Optional - folder for optimized images and not yet used uploads
+timing_file = None  # Optional - JSONL file to append the timing of each API call and stage to
+response_cache_file = None  # Optional - SQLite file to cache the server's responses in between runs
 with open("mastodon-private-metadata.csv", "r") as infile:
     mpm = csv.DictReader(infile, fieldnames=("variable_name", "set_to"))
     for row in mpm:  # Iterate through the rows to find the variables we need
@@ -25,6 +37,20 @@ with open("mastodon-private-metadata.csv", "r") as infile:
             csv_file_location = row['set_to']
         if row['variable_name'] == 'image-file-location':
             image_file_location = row['set_to']
+        if row['variable_name'] == 'schedule-csv-file':
+            schedule_csv_file = row['set_to']
+        if row['variable_name'] == 'profile-cache-file':
+            profile_cache_file = row['set_to']
+        if row['variable_name'] == 'status-store-file':
+            status_store_file = row['set_to']
+        if row['variable_name'] == 'image-cache-folder':
+            image_cache_folder = row['set_to']
+        if row['variable_name'] == 'timing-file':
+            timing_file = row['set_to']
+        if row['variable_name'] == 'response-cache-file':
+            response_cache_file = row['set_to']
+spans = SpanRecorder(export_file=timing_file)
+spans.record('load_config', start_ns, time.perf_counter_ns() - start_ns)
 if show_verbose_details:
     print("Variables read from local CSV configuration file:")
     print(f"         m_base_url: {m_base_url}")
@@ -36,20 +62,57 @@ if show_verbose_details:
 # Get the details on the next update we can make now
 # u.update_data() will contain the Python dictionary of values we'll need to
 # pass to the MastodonWrapper to make the update
+start_ns = time.perf_counter_ns()
 u = DataForUpdates(
-    csv_file='tbd',
+    csv_file=schedule_csv_file,
     image_folder=image_file_location,
     include_calc_url=True,  # False if we don't want to calculate URL added today
-    verbose=show_verbose_details
+    verbose=show_verbose_details,
+    post_date=datetime.now(pytz.timezone(local_time_zone)).date()  # 'Today' in the bot's own time zone
 )
+spans.record('load_schedule', start_ns, time.perf_counter_ns() - start_ns)
+if u.next_posting() is None:
+    print(f"\n*** Nothing to post ***\n{u.state()}")
+    exit(-322)
+
+# Step 1b. Fast path: check the local status store before connecting to the server (which loads Mastodon.py).
+# Connecting would only add newer posts to the store (posts deleted on the server stay in it, see the README),
+# so if it already shows it's too soon to post, or that all of today's postings have been made, the full run
+# would say the same. The run is still logged, with just that one row, in the same log file save_log_to_csv() writes.
+def fast_path_exit(task, details):
+    print(details)
+    fast_path_log = LogBuffer(("task", "details", "timestamp"))
+    fast_path_log.append(task, f"{details} (from the local status store, without connecting)")
+    fast_path_log.write_csv(f'{csv_file_location}MastodonWrapperLog-{datetime.now().strftime("%Y-%m-%d-%H-%M-%S")}.csv')
+    spans.export()
+    exit(0)
+
+
+if status_store_file and os.path.isfile(status_store_file):
+    local_store = StatusStore(status_store_file)
+    last_post = local_store.latest_created_at()
+    if last_post is not None and (time.time() - last_post) / 3600 < post_limit_hours:
+        fast_path_exit("Update rate exceeded", f"It has only been {(time.time() - last_post) / 3600:.2f} hours since the last post, which is less than the {post_limit_hours} minimum")
+    todays_postings = u.postings_for(u.next_posting()['month'], u.next_posting()['day'])
+    if len(local_store.posted_fingerprints([p['full_update_text'] for p in todays_postings])) == len({text_fingerprint(p['full_update_text']) for p in todays_postings}):
+        fast_path_exit("no_new_post", f"All {len(todays_postings)} postings for today have already been posted to Mastodon")
 
 # Step 2. Create our Mastodon Wrapper object, connected to the server
+session = None
+if response_cache_file:
+    from CachingSession import CachingSession  # Only once we know we need the server
+    session = CachingSession(response_cache_file, verbose=show_verbose_details)
 m = MastodonWrapper(
     base_url=m_base_url,
     access_token=m_access_token,
     time_zone=local_time_zone,
     ok_to_post=post_if_all_ok,
-    verbose=show_verbose_details
+    verbose=show_verbose_details,
+    profile_cache_file=profile_cache_file,
+    status_store_file=status_store_file,
+    image_cache_folder=image_cache_folder,
+    span_recorder=spans,
+    session=session
 )
 if m.state() != "Connected to server":
     print(f"\n*** Unable to continue ***\n{m.state()}")
@@ -57,8 +120,15 @@ if m.state() != "Connected to server":
     exit(-321)
 
 ready_to_post = True
-# Do we have a new posting?
-if m.already_posted(u.next_posting(), verbose=show_verbose_details) == True:
+# Do we have a new posting? Check all of today's postings in one call, and use the first one not yet posted
+next_details = u.next_posting()
+todays_postings = u.postings_for(next_details['month'], next_details['day'])
+new_postings = [p for p, posted in zip(todays_postings, m.already_posted_batch(todays_postings, verbose=show_verbose_details)) if not posted]
+if new_postings:
+    next_details = new_postings[0]
+else:
+    print(f"All {len(todays_postings)} postings for today have already been posted to Mastodon")
+    m.to_log("no_new_post", f"All {len(todays_postings)} postings for today have already been posted")
     ready_to_post = False
 if m.hours_since_last_post() < post_limit_hours:
     print(f"Warning: It has only been been {m.hours_since_last_post()} hours since the last post, which is less than the {post_limit_hours} minimum")
@@ -68,9 +138,11 @@ if m.hours_since_last_post() < post_limit_hours:
 
 if ready_to_post:
     m.to_log("Frequency OK", f"It has been been {m.hours_since_last_post()} hours since the last post, which is more than the {post_limit_hours} minimum") if show_verbose_details else None
-    m.post_update(details=u.return_dict, verbose=show_verbose_details)
+    m.post_update(details=next_details, verbose=show_verbose_details)
 
 
 # Write this log to the csv file defined in csv_file_location
 m.save_log_to_csv(path_name=csv_file_location)
 print(m.log_df()) if show_verbose_details else None
+print(m.timing_summary()) if show_verbose_details else None
+print(f"Response cache: {session.stats()}") if show_verbose_details and session else None
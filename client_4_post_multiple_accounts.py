@@ -0,0 +1,64 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import sys
+from datetime import datetime
+import pytz
+from AsyncMastodonWrapper import MultiAccountPoster
+from DataForUpdates import DataForUpdates
+
+# Fourth client file - run the posting cycle for several bot accounts at the same time
+#
+#   python client_4_post_multiple_accounts.py bot-one-metadata.csv bot-two-metadata.csv ...
+#
+# Each configuration file has the same variables as mastodon-private-metadata.csv
+#
+
+show_verbose_details = False
+post_if_all_ok = "no"  # no | yes - 'ask' does not make sense with several accounts posting at once
+
+
+def read_config(file_name):
+    """
+    Read one local configuration file into a dictionary of variable_name -> set_to
+    """
+    with open(file_name, "r") as infile:
+        return {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+
+
+config_files = sys.argv[1:] if len(sys.argv) > 1 else ["mastodon-private-metadata.csv"]
+accounts = []
+for config_file in config_files:
+    config = read_config(config_file)
+    u = DataForUpdates(
+        csv_file=config['schedule-csv-file'],
+        image_folder=config['image-file-location'],
+        include_calc_url=True,
+        verbose=show_verbose_details,
+        post_date=datetime.now(pytz.timezone(config['local-timezone'])).date()
+    )
+    if u.next_posting() is None:
+        print(f"{config_file}: nothing to post - {u.state()}")
+        continue
+    accounts.append({
+        'name': config_file,
+        'wrapper_args': {
+            'base_url': config['mastodon-base-url'],
+            'access_token': config['access-token'],
+            'time_zone': config['local-timezone'],
+            'ok_to_post': post_if_all_ok,
+            'verbose': show_verbose_details,
+            'profile_cache_file': config.get('profile-cache-file'),
+            'status_store_file': config.get('status-store-file'),
+            'image_cache_folder': config.get('image-cache-folder')
+        },
+        'post_limit_hours': float(config['post-limit-hours']),
+        'postings': u.postings_for(u.post_date.month, u.post_date.day)
+    })
+
+poster = MultiAccountPoster(accounts, verbose=show_verbose_details)
+for result in poster.run():
+    print(f"{result['account']}: {result['result']} ({result['seconds']:.2f} seconds)\n\t{result['details']}")
+
+# Write each account's log to the csv file defined in its csv_file_location
+for config_file in config_files:
+    if config_file in poster.wrappers:
+        poster.wrappers[config_file].wrapper.save_log_to_csv(path_name=read_config(config_file)['csv-file-location'])
@@ -0,0 +1,33 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import os
+import sys
+from DataForUpdates import DataForUpdates
+
+# Fifth client file - check the whole posting schedule before any of it is posted
+#
+#   python client_5_preflight_schedule.py [mastodon-private-metadata.csv]
+#
+# Writes a report with one row per row of the schedule CSV file, and exits with 1 if any row has an error
+#
+
+show_verbose_details = False
+
+config_file = sys.argv[1] if len(sys.argv) > 1 else "mastodon-private-metadata.csv"
+with open(config_file, "r") as infile:
+    config = {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+
+u = DataForUpdates(
+    csv_file=config['schedule-csv-file'],
+    image_folder=config['image-file-location'],
+    include_calc_url=True,
+    verbose=show_verbose_details
+)
+report = u.preflight()
+
+report_file = os.path.join(config['csv-file-location'], "mastodon-schedule-preflight.csv")
+report.to_csv(report_file, index=False)
+problems = report[report['issues'] != '']
+print(f"{len(report)} rows checked, {(~report['ok']).sum()} with errors and {(report['ok'] & (report['issues'] != '')).sum()} with warnings")
+print(f"{problems[['row', 'month', 'day', 'issues']].head(20).to_string(index=False)}") if len(problems) else None
+print(f"Full report written to {report_file}")
+exit(0 if report['ok'].all() else 1)
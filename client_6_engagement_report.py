@@ -0,0 +1,37 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import os
+import sys
+from MastodonWrapper import MastodonWrapper
+
+# Sixth client file - how the account's posts perform, to help choose post-limit-hours and the schedule
+#
+#   python client_6_engagement_report.py [mastodon-private-metadata.csv] [--refresh]
+#
+# --refresh reads the current favourites, reblogs and replies counts for the whole history first,
+# otherwise the counts are as of when each status was last synced
+#
+
+show_verbose_details = False
+
+config_file = next((arg for arg in sys.argv[1:] if not arg.startswith('--')), "mastodon-private-metadata.csv")
+with open(config_file, "r") as infile:
+    config = {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+
+m = MastodonWrapper(
+    base_url=config['mastodon-base-url'],
+    access_token=config['access-token'],
+    time_zone=config['local-timezone'],
+    ok_to_post='no',
+    verbose=show_verbose_details,
+    profile_cache_file=config.get('profile-cache-file'),
+    status_store_file=config.get('status-store-file')
+)
+if m.state() != "Connected to server":
+    print(f"\n*** Unable to continue ***\n{m.state()}")
+    exit(-321)
+
+report = m.engagement_report(refresh='--refresh' in sys.argv, verbose=True)
+for name, frame in report.items():
+    frame.to_csv(os.path.join(config['csv-file-location'], f"mastodon-engagement-by-{name}.csv"))
+print(f"\nCurrent post-limit-hours: {config['post-limit-hours']}")
+m.save_log_to_csv(path_name=config['csv-file-location'])
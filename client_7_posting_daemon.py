@@ -0,0 +1,57 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import os
+import signal
+import sys
+from MastodonWrapper import MastodonWrapper
+from DataForUpdates import DataForUpdates
+from PostingDaemon import PostingDaemon
+from CachingSession import CachingSession
+
+# Seventh client file - keep running and post each update as soon as post-limit-hours allows,
+# instead of running client_3_post_update.py from cron
+#
+#   python client_7_posting_daemon.py [mastodon-private-metadata.csv]
+#
+# Stop it with Ctrl-C or kill (SIGTERM) - it finishes the step it is on and exits
+#
+
+show_verbose_details = True
+post_if_all_ok = "no"  # no | yes - 'ask' does not make sense for a daemon
+
+config_file = sys.argv[1] if len(sys.argv) > 1 else "mastodon-private-metadata.csv"
+with open(config_file, "r") as infile:
+    config = {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+
+u = DataForUpdates(
+    csv_file=config['schedule-csv-file'],
+    image_folder=config['image-file-location'],
+    include_calc_url=True,
+    verbose=False
+)
+m = MastodonWrapper(
+    base_url=config['mastodon-base-url'],
+    access_token=config['access-token'],
+    time_zone=config['local-timezone'],
+    ok_to_post=post_if_all_ok,
+    verbose=False,
+    log_file=os.path.join(config['csv-file-location'], "MastodonWrapperLog.csv"),  # Appended to as the daemon runs
+    profile_cache_file=config.get('profile-cache-file'),
+    status_store_file=config.get('status-store-file'),
+    image_cache_folder=config.get('image-cache-folder'),
+    session=CachingSession(config['response-cache-file']) if config.get('response-cache-file') else None
+)
+if m.state() != "Connected to server":
+    print(f"\n*** Unable to continue ***\n{m.state()}")
+    exit(-321)
+
+if config.get('use-streaming-api') == 'yes':
+    m.start_streaming(verbose=show_verbose_details)  # Keeps the status store current, instead of syncing before each step
+daemon = PostingDaemon(m, u, post_limit_hours=float(config['post-limit-hours']), verbose=show_verbose_details)
+signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+signal.signal(signal.SIGINT, lambda signum, frame: daemon.stop())
+posts = daemon.run()
+m.stop_streaming()
+m.flush_log()
+print(f"Stopped after making {posts} posts")
+if isinstance(m.m_object.session, CachingSession):
+    print(f"Response cache: {m.m_object.session.stats()}")
@@ -0,0 +1,44 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import sys
+from MastodonWrapper import MastodonWrapper
+
+# Eighth client file - seed the local status store from an account archive, instead of paging through
+# the whole history with the API
+#
+#   python client_8_import_archive.py [mastodon-private-metadata.csv] archive-20240101.zip
+#
+# Request the archive from the server under Preferences > Import and export. Once it is imported, only the
+# statuses posted since the archive was made are fetched from the server
+#
+
+show_verbose_details = True
+
+args = sys.argv[1:]
+archive_file = args.pop() if args else None
+config_file = args[0] if args else "mastodon-private-metadata.csv"
+if not archive_file:
+    print("Usage: python client_8_import_archive.py [mastodon-private-metadata.csv] archive.zip")
+    exit(-1)
+with open(config_file, "r") as infile:
+    config = {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+if not config.get('status-store-file'):
+    print("Set status-store-file in the configuration file, so there is somewhere to keep the imported statuses")
+    exit(-1)
+
+m = MastodonWrapper(
+    base_url=config['mastodon-base-url'],
+    access_token=config['access-token'],
+    time_zone=config['local-timezone'],
+    ok_to_post='no',
+    verbose=False,
+    profile_cache_file=config.get('profile-cache-file'),
+    status_store_file=config['status-store-file']
+)
+if m.state() != "Connected to server":
+    print(f"\n*** Unable to continue ***\n{m.state()}")
+    exit(-321)
+
+m.import_archive(archive_file, verbose=show_verbose_details)
+print(f"Fetched {m.sync_statuses(verbose=show_verbose_details)} statuses posted since the archive was made")
+print(m.status_store)
+m.save_log_to_csv(path_name=config['csv-file-location'])
@@ -0,0 +1,44 @@
+import csv  # https://docs.python.org/3/library/csv.html
+import sys
+from datetime import date
+from DataForUpdates import DataForUpdates
+from ScheduleSimulator import ScheduleSimulator
+
+# Ninth client file - replay a year of the schedule against a simulated account and clock, to see every
+# posting decision before it happens. Nothing is sent to the server
+#
+#   python client_9_simulate_schedule.py [mastodon-private-metadata.csv] [cron|daemon] [year]
+#
+# 'cron' (the default) checks every hour like a crontab running client_3_post_update.py, 'daemon' replays
+# client_7_posting_daemon.py
+#
+
+show_verbose_details = False
+
+args = sys.argv[1:]
+config_file = args[0] if args else "mastodon-private-metadata.csv"
+mode = args[1] if len(args) > 1 else 'cron'
+year = int(args[2]) if len(args) > 2 else date.today().year
+with open(config_file, "r") as infile:
+    config = {row['variable_name']: row['set_to'] for row in csv.DictReader(infile, fieldnames=("variable_name", "set_to"))}
+
+u = DataForUpdates(
+    csv_file=config['schedule-csv-file'],
+    image_folder=config['image-file-location'],
+    include_calc_url=True,
+    verbose=False
+)
+sim = ScheduleSimulator(u, config['local-timezone'], post_limit_hours=float(config['post-limit-hours']),
+                        start=date(year, 1, 1), mode=mode, verbose=show_verbose_details)
+decisions = sim.run()
+
+print("\nDecisions, and how long each kind took:")
+print(sim.summary())
+print("\nEvery post, error and skipped posting:")
+for decision in decisions:
+    if decision['action'] in ('posted', 'error', 'skipped'):
+        print(f"{decision['time']}  {decision['action']:<8} {decision['details'][:100]}")
+unposted = sim.unposted()
+print(f"\n{len(unposted)} postings in the schedule were never posted:")
+for posting in unposted:
+    print(f"\t{posting['month']}/{posting['day']}: {posting['full_update_text'][:100]}")
@@ -0,0 +1,30 @@
+import pytest
+from MockMastodonServer import MockMastodonServer
+from MastodonWrapper import MastodonWrapper
+from RequestScheduler import RequestScheduler
+
+# Shared pytest fixtures for the tests that run MastodonWrapper against MockMastodonServer
+
+
+@pytest.fixture
+def server():
+    with MockMastodonServer(statuses=95, max_page_size=40, media_every=5, heartbeat_seconds=0.5) as server:
+        yield server
+
+
+@pytest.fixture
+def empty_server():
+    with MockMastodonServer(statuses=0, heartbeat_seconds=0.5) as server:
+        yield server
+
+
+@pytest.fixture
+def new_wrapper():
+    """
+    Makes MastodonWrapper objects connected to a mock server, with a request scheduler that never holds a call back
+    """
+    def make(server, **kwargs):
+        scheduler = RequestScheduler(buckets={name: (10 ** 9, 1) for name in RequestScheduler.default_buckets})
+        return MastodonWrapper(base_url=server.base_url, access_token='test-token', time_zone='America/Toronto',
+                               ok_to_post=kwargs.pop('ok_to_post', 'no'), request_scheduler=scheduler, **kwargs)
+    return make
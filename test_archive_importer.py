@@ -0,0 +1,51 @@
+import json
+import pytest
+from ArchiveImporter import ArchiveImporter
+from StatusStore import StatusStore
+
+actor = 'https://example.social/users/bot'
+public = 'https://www.w3.org/ns/activitystreams#Public'
+
+
+def create(status_id, content, to=(public,), cc=(), tags=(), attachments=()):
+    return {'type': 'Create', 'published': '2024-01-01T12:00:00Z', 'object': {
+        'id': f'{actor}/statuses/{status_id}', 'type': 'Note', 'published': f'2024-01-{status_id:02d}T12:00:00Z',
+        'content': content, 'to': list(to), 'cc': list(cc), 'tag': list(tags), 'attachment': list(attachments)}}
+
+
+def write_outbox(path, items):
+    with open(path, 'w', encoding='utf-8') as outfile:
+        json.dump({'@context': 'https://www.w3.org/ns/activitystreams', 'type': 'OrderedCollection',
+                   'totalItems': len(items), 'orderedItems': items}, outfile, indent=2)
+    return str(path)
+
+
+def test_import_outbox_in_small_chunks(tmp_path):
+    outbox = write_outbox(tmp_path / 'outbox.json', [
+        create(1, '<p>Union Station &amp; the ferry <a href="#">#<span>OTD</span></a></p>',
+               tags=[{'type': 'Hashtag', 'name': '#OTD'}, {'type': 'Mention', 'name': '@friend@example.social'}],
+               attachments=[{'type': 'Document', 'mediaType': 'image/jpeg', 'name': 'The ferry',
+                             'url': '/media_attachments/files/1/original/1.jpeg', 'width': 800, 'height': 600}]),
+        {'type': 'Announce', 'published': '2024-01-02T12:00:00Z', 'object': 'https://elsewhere.social/statuses/9'},
+        create(3, '<p>Unlisted</p>', to=[f'{actor}/followers'], cc=[public]),
+        create(4, '<p>Followers only</p>', to=[f'{actor}/followers']),
+    ])
+    store = StatusStore()
+    counts = ArchiveImporter(store, batch_size=2, chunk_size=16).import_archive(outbox)
+    assert counts == {'statuses': 3, 'media': 1, 'skipped': 1}
+    records = {record.id: record for record in store.records()}
+    assert [records[i].visibility for i in (1, 3, 4)] == ['public', 'unlisted', 'private']
+    assert records[1].text == 'Union Station & the ferry #OTD'
+    assert records[1].tags == ('otd',) and records[1].mentions == ('friend@example.social',)
+    assert store.all_media()[0]['description'] == 'The ferry'
+    assert store.posted_at('Unlisted') is not None
+    assert store.get_state('history_complete') == 'yes'
+    # Nothing is known about the engagement of imported statuses
+    assert store.db.execute("SELECT COUNT(*) FROM engagement").fetchone()[0] == 0
+
+
+def test_truncated_outbox(tmp_path):
+    outbox = tmp_path / 'outbox.json'
+    outbox.write_text(json.dumps({'orderedItems': [create(1, '<p>Cut off</p>')]})[:-20], encoding='utf-8')
+    with open(outbox, encoding='utf-8') as infile, pytest.raises(ValueError, match='7161'):
+        list(ArchiveImporter(StatusStore(), chunk_size=8).activities(infile))
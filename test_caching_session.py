@@ -0,0 +1,57 @@
+from CachingSession import CachingSession
+
+
+def get(session, server, path, token='test-token'):
+    return session.get(f"{server.base_url}{path}", headers={'Authorization': f'Bearer {token}'})
+
+
+def test_fresh_responses_are_served_locally(empty_server):
+    session = CachingSession()
+    first = get(session, empty_server, '/api/v1/instance')
+    requests_made = empty_server.requests
+    second = get(session, empty_server, '/api/v1/instance')
+    assert second.json() == first.json() and second.from_cache
+    assert empty_server.requests == requests_made
+    # Another access token is another cache entry
+    get(session, empty_server, '/api/v1/instance', token='other-token')
+    assert session.stats()['hits'] == 1 and session.stats()['entries'] == 2
+
+
+def test_statuses_are_revalidated_every_time(server):
+    session = CachingSession()
+    path = f"/api/v1/accounts/{server.account['id']}/statuses"
+    first = get(session, server, path)
+    second = get(session, server, path)
+    assert second.status_code == 200 and second.json() == first.json()
+    assert 'X-RateLimit-Remaining' in second.headers
+    server.add_status(server.make_status("<p>Posted from the web UI</p>"))
+    assert get(session, server, path).json()[0]['content'] == "<p>Posted from the web UI</p>"
+    stats = session.stats()
+    assert (stats['revalidated'], stats['misses'], stats['hits']) == (1, 2, 0)
+    assert stats['bytes_saved'] == len(first.content)
+
+
+def test_writes_make_every_entry_stale(empty_server, tmp_path):
+    session = CachingSession(str(tmp_path / 'responses.sqlite'))
+    get(session, empty_server, '/api/v1/instance')
+    session.post(f"{empty_server.base_url}/api/v1/statuses", data={'status': 'Hello'},
+                 headers={'Authorization': 'Bearer test-token'})
+    get(session, empty_server, '/api/v1/instance')
+    assert session.stats()['hits'] == 0 and session.stats()['revalidated'] == 1
+    session.close()
+    # Kept between runs
+    session = CachingSession(str(tmp_path / 'responses.sqlite'))
+    get(session, empty_server, '/api/v1/instance')
+    assert session.stats()['hits'] == 1
+
+
+def test_least_recently_used_are_evicted(empty_server):
+    session = CachingSession(ttls={r'/api/v1/accounts/verify_credentials': 300}, max_bytes=1)
+    get(session, empty_server, '/api/v1/accounts/verify_credentials')
+    assert session.stats()['entries'] == 0
+    session = CachingSession()
+    size = len(get(session, empty_server, '/api/v1/instance').content)
+    session.max_bytes = size + 10
+    get(session, empty_server, '/api/v1/accounts/verify_credentials')
+    assert session.stats()['evictions'] == 1 and session.stats()['entries'] == 1
+    assert session.total_bytes <= session.max_bytes
@@ -0,0 +1,61 @@
+import csv
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+import pytz
+from DataForUpdates import DataForUpdates
+from StatusStore import StatusStore
+
+repo_folder = os.path.dirname(os.path.abspath(__file__))
+# Runs the post script, and reports whether it got as far as importing Mastodon.py
+run_script = ("import runpy, sys\n"
+              "try:\n"
+              f"    runpy.run_path({os.path.join(repo_folder, 'client_3_post_update.py')!r}, run_name='__main__')\n"
+              "except SystemExit as e:\n"
+              "    print('exit', e.code, 'mastodon' in sys.modules)\n")
+
+
+def setup_run(tmp_path, hours_since_last_post, posted_today=False):
+    today = datetime.now(pytz.timezone('America/Toronto')).date()
+    schedule_file = tmp_path / 'schedule.csv'
+    with open(schedule_file, 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['month', 'day', 'image_name', 'image_text', 'tags', 'post_text', 'spoiler_text', 'sensitive'])
+        writer.writerow([today.month, today.day, '', '', '#OTD', 'On this day', '', 'False'])
+    store_file = str(tmp_path / 'statuses.sqlite')
+    text = DataForUpdates(csv_file=str(schedule_file), image_folder=str(tmp_path), post_date=today).next_posting()['full_update_text']
+    store = StatusStore(store_file)
+    store.add_statuses([{'id': 1, 'content': f"<p>{text if posted_today else 'Yesterday'}</p>",
+                         'created_at': datetime.now(timezone.utc) - timedelta(hours=hours_since_last_post)}])
+    store.db.close()
+    settings = {'mastodon-base-url': 'http://127.0.0.1:9', 'access-token': 'test-token', 'local-timezone': 'America/Toronto',
+                'post-limit-hours': '6.0', 'csv-file-location': f'{tmp_path}{os.sep}', 'image-file-location': f'{tmp_path}{os.sep}',
+                'schedule-csv-file': str(schedule_file), 'status-store-file': store_file}
+    with open(tmp_path / 'mastodon-private-metadata.csv', 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(['variable_name', 'set_to'])
+        writer.writerows(settings.items())
+
+
+def run(tmp_path):
+    result = subprocess.run([sys.executable, '-c', run_script], cwd=tmp_path, capture_output=True, text=True, timeout=60,
+                            env={**os.environ, 'PYTHONPATH': repo_folder})
+    log_files = [name for name in os.listdir(tmp_path) if name.startswith('MastodonWrapperLog-')]
+    return result.stdout, [(tmp_path / name).read_text() for name in log_files]
+
+
+def test_too_soon_exits_before_connecting(tmp_path):
+    setup_run(tmp_path, hours_since_last_post=1)
+    output, logs = run(tmp_path)
+    assert 'since the last post, which is less than the 6.0 minimum' in output
+    assert output.strip().endswith('exit 0 False')
+    assert len(logs) == 1 and 'Update rate exceeded' in logs[0]
+
+
+def test_already_posted_today_exits_before_connecting(tmp_path):
+    setup_run(tmp_path, hours_since_last_post=12, posted_today=True)
+    output, logs = run(tmp_path)
+    assert 'All 1 postings for today have already been posted' in output
+    assert output.strip().endswith('exit 0 False')
+    assert len(logs) == 1 and 'no_new_post' in logs[0]
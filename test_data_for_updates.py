@@ -0,0 +1,115 @@
+import csv
+import os
+import pytest
+from DataForUpdates import DataForUpdates
+
+columns = ["month", "day", "image_name", "image_text", "tags", "post_text", "spoiler_text", "sensitive"]
+
+
+def write_schedule(path, rows):
+    with open(path, "w", newline='', encoding="utf-8") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    return str(path)
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    return write_schedule(tmp_path / 'schedule.csv', [
+        [1, 2, 'ferry.jpg', 'The ferry', 'Toronto, OTD', 'First for January 2nd', '', 'False'],
+        [1, 2, '', '', '#OTD', 'Second for January 2nd', '', 'yes'],
+        [2, 29, '', '', '', 'Leap day', '', ''],
+    ])
+
+
+def load(csv_file, **kwargs):
+    return DataForUpdates(csv_file=csv_file, image_folder='/images/', **kwargs)
+
+
+def test_postings_for_a_day_in_file_order(schedule):
+    from datetime import date
+    u = load(schedule, post_date=date(2025, 1, 2))
+    assert u.state() == "Data ready"
+    postings = u.postings_for(1, 2)
+    assert [p['post_text'] for p in postings] == ['First for January 2nd', 'Second for January 2nd']
+    assert u.next_posting() is postings[0]
+    assert postings[0]['tags'] == '#Toronto #OTD'
+    assert postings[0]['full_image_name'] == '/images/ferry.jpg'
+    assert postings[1]['sensitive'] is True
+    assert postings[0]['full_update_text'] == \
+        'First for January 2nd #Toronto #OTD https://wholemap.com/historic/toronto.php?month=1&day=2'
+    assert u.postings_for(2, 29)[0]['post_text'] == 'Leap day'
+    assert u.postings_for(3, 1) == []
+
+
+def test_index_is_cached_until_the_file_changes(schedule):
+    load(schedule)
+    assert os.path.isfile(f"{schedule}.index.pickle")
+    cached = load(schedule)
+    assert len(cached.postings_for(1, 2)) == 2
+    write_schedule(schedule, [[1, 2, '', '', '', 'Only one now, in a longer file', '', '']])
+    assert [p['post_text'] for p in load(schedule).postings_for(1, 2)] == ['Only one now, in a longer file']
+
+
+def test_bad_rows_are_skipped_and_reported(tmp_path, capsys):
+    csv_file = write_schedule(tmp_path / 'schedule.csv', [
+        [1, 2, '', '', '', 'Good', '', ''],
+        [''] * 8,
+        ['Jan', 3, '', '', '', 'Text in the month column', '', ''],
+        [13, 1, '', '', '', 'No month 13', '', ''],
+        [2, 30, '', '', '', 'No February 30th', '', ''],
+        [1, 3, '', '', '', 'Also good', '', ''],
+    ])
+    u = load(csv_file, cache_index=False)
+    assert [line_num for line_num, reason in u.skipped_rows] == [3, 4, 5, 6]
+    assert u.postings_for(1, 2)[0]['post_text'] == 'Good'
+    assert u.postings_for(1, 3)[0]['post_text'] == 'Also good'
+    assert 'WARNING 5217: Skipped 4 rows' in capsys.readouterr().out
+    # The skipped rows are remembered with the cached index too
+    load(csv_file)
+    assert len(load(csv_file).skipped_rows) == 4
+
+
+def test_unreadable_file(tmp_path):
+    u = load(str(tmp_path / 'missing.csv'))
+    assert u.state().startswith("Error 5210")
+    assert u.postings_for(1, 2) == []
+
+
+def test_preflight(tmp_path):
+    image_folder = tmp_path / 'images'
+    (image_folder / '1925').mkdir(parents=True)
+    (image_folder / 'ferry.jpg').write_bytes(b'x' * 100)
+    (image_folder / '1925' / 'pump.jpg').write_bytes(b'x' * 2000)
+    schedule = write_schedule(tmp_path / 'schedule.csv', [
+        [1, 2, 'ferry.jpg', 'The ferry', 'Toronto, OTD', 'First for January 2nd', '', ''],
+        [1, 2, '1925/pump.jpg', 'A pump', '#OTD', 'Second for January 2nd', '', ''],
+        [1, 2, 'missing.jpg', '', 'Toronto, OTD', 'First for January 2nd', '', ''],
+        [2, 30, '', '', '', 'Not a date', '', ''],
+        ['x' * 3, 1, '', '', '', 'x' * 500, '', ''],
+    ])
+    u = DataForUpdates(csv_file=schedule, image_folder=f"{image_folder}{os.sep}")
+    report = u.preflight(max_image_bytes=1000)
+    # The same text prepare_posting() builds
+    posting = u.postings_for(1, 2)[0]
+    assert report['tags'][0] == posting['tags']
+    assert report['url'][0] == posting['url']
+    assert report['full_update_len'][0] == posting['full_update_len']
+    assert list(report['row']) == [2, 3, 4, 5, 6]
+    assert list(report['postings_that_day'][:3]) == [3, 3, 3]
+    assert list(report['ok']) == [True, True, False, False, False]
+    assert report['issues'][0] == ''
+    # Found in a subfolder, the way post_update() looks for it
+    assert report['image_bytes'][1] == 2000 and report['issues'][1] == 'Warning 5215: Image is > 1,000 bytes'
+    assert 'Error 5213' in report['issues'][2] and 'Error 5214' in report['issues'][2]
+    assert 'Warning 5216' in report['issues'][2]
+    assert report['issues'][3] == 'Error 5212: Not a valid month and day'
+    assert 'Error 5212' in report['issues'][4] and 'Error 8812' in report['issues'][4]
+
+
+def test_preflight_with_an_image_folder_without_a_separator(tmp_path):
+    (tmp_path / 'img-ferry.jpg').write_bytes(b'x' * 100)
+    schedule = write_schedule(tmp_path / 'schedule.csv', [[1, 2, 'ferry.jpg', 'The ferry', '', 'Ferry', '', '']])
+    report = DataForUpdates(csv_file=schedule, image_folder=f"{tmp_path}{os.sep}img-").preflight()
+    assert report['image_bytes'][0] == 100 and report['ok'][0]
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+from EngagementAnalytics import EngagementAnalytics
+from StatusStore import StatusStore
+
+
+def status(status_id, hour, tags=(), media=False, favourites=0, reblog=None):
+    return {'id': status_id, 'created_at': datetime(2024, 1, 1 + status_id, hour, tzinfo=timezone.utc),
+            'content': f'<p>Posting {status_id}</p>', 'tags': [{'name': tag} for tag in tags],
+            'media_attachments': [{'id': status_id}] if media else [], 'reblog': reblog,
+            'favourites_count': favourites, 'reblogs_count': 1, 'replies_count': 0}
+
+
+def test_report():
+    store = StatusStore()
+    store.add_statuses([status(1, 14, tags=['otd'], media=True, favourites=9),
+                        status(2, 14, tags=['otd'], favourites=3),
+                        status(3, 20, tags=['cats'], favourites=0),
+                        status(4, 20, favourites=50, reblog=status(9, 1))])  # A boost isn't the user's own post
+    report = EngagementAnalytics(store, 'UTC').report(min_posts=2)
+    assert list(report['tag'].index) == ['otd']
+    assert report['tag'].loc['otd', 'engagement'] == 7.0
+    assert report['hour'].loc[14, 'posts'] == 2 and report['hour'].loc[20, 'favourites'] == 0
+    assert report['media'].loc[True, 'engagement'] == 10.0
+    assert report['media'].loc[False, 'posts'] == 2
+    assert report['hours_since_previous']['posts'].sum() == 2
+    # Posting hours are in the given time zone
+    assert list(EngagementAnalytics(store, 'America/Toronto').by_hour().index) == [9, 15]
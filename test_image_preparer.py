@@ -0,0 +1,87 @@
+import os
+import random
+from PIL import Image
+from ImagePreparer import ImagePreparer
+
+
+def noise(mode, size, seed=1):
+    """An image that doesn't compress well, so re-encoding can't make it much smaller"""
+    rnd = random.Random(seed)
+    img = Image.new(mode, size)
+    img.putdata([tuple(rnd.randrange(256) for _ in mode) for _ in range(size[0] * size[1])])
+    return img
+
+
+def gps_exif():
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'  # Make
+    exif.get_ifd(0x8825)[2] = (52.0, 22.0, 0.0)  # GPSLatitude
+    return exif
+
+
+def test_big_png_is_resized_and_converted(tmp_path):
+    source = str(tmp_path / 'big.png')
+    noise('RGB', (400, 300)).save(source)
+    preparer = ImagePreparer(str(tmp_path / 'cache'), max_pixels=200 * 150)
+    upload_file, content_hash = preparer.prepare(source)
+    assert upload_file.endswith('.jpeg')
+    with Image.open(upload_file) as img:
+        assert img.format == 'JPEG' and img.width * img.height <= 200 * 150
+    # The second time the cached copy is used
+    assert preparer.prepare(source) == (upload_file, content_hash)
+
+
+def test_transparency_is_kept(tmp_path):
+    source = str(tmp_path / 'logo.png')
+    Image.new('RGBA', (400, 300), (255, 0, 0, 128)).save(source)
+    upload_file, _ = ImagePreparer(str(tmp_path / 'cache'), max_pixels=200 * 150).prepare(source)
+    with Image.open(upload_file) as img:
+        assert img.format == 'PNG' and img.mode == 'RGBA' and img.width * img.height <= 200 * 150
+
+
+def test_metadata_is_stripped_even_if_not_smaller(tmp_path):
+    source = str(tmp_path / 'photo.jpeg')
+    noise('RGB', (64, 64)).save(source, quality=95, exif=gps_exif())
+    upload_file, _ = ImagePreparer(str(tmp_path / 'cache'), jpeg_quality=95).prepare(source)
+    assert upload_file != source
+    with Image.open(upload_file) as img:
+        assert 'exif' not in img.info and not img.getexif()
+
+
+def test_png_metadata_is_stripped(tmp_path):
+    source = str(tmp_path / 'screenshot.png')
+    noise('RGB', (32, 32)).save(source, exif=gps_exif())
+    upload_file, _ = ImagePreparer(str(tmp_path / 'cache')).prepare(source)
+    assert upload_file.endswith('.png')
+    with Image.open(upload_file) as img:
+        assert not img.getexif()
+
+
+def test_originals_that_need_nothing(tmp_path):
+    preparer = ImagePreparer(str(tmp_path / 'cache'), jpeg_quality=95)
+    small_jpeg = str(tmp_path / 'small.jpeg')
+    noise('RGB', (64, 64)).save(small_jpeg, quality=30)
+    assert preparer.prepare(small_jpeg)[0] == small_jpeg
+    small_png = str(tmp_path / 'small.png')
+    noise('RGB', (32, 32)).save(small_png)
+    assert preparer.prepare(small_png)[0] == small_png
+    animated = str(tmp_path / 'animated.gif')
+    frames = [Image.new('RGB', (400, 300), color) for color in ('red', 'blue')]
+    frames[0].save(animated, save_all=True, append_images=frames[1:])
+    assert ImagePreparer(str(tmp_path / 'cache'), max_pixels=100).prepare(animated)[0] == animated
+
+
+def test_server_limits_only_lower(tmp_path):
+    preparer = ImagePreparer(str(tmp_path / 'cache'))
+    preparer.set_server_limits(image_matrix_limit=33177600, image_size_limit=1024)
+    assert (preparer.max_pixels, preparer.max_bytes) == (ImagePreparer.default_max_pixels, 1024)
+
+
+def test_uploads_are_remembered_until_used(tmp_path):
+    preparer = ImagePreparer(str(tmp_path / 'cache'))
+    preparer.remember_upload('abc', 'A cat', 1234)
+    assert preparer.uploaded_media_id('abc', 'A cat') == '1234'
+    assert preparer.uploaded_media_id('abc', 'A dog') is None
+    preparer.forget_upload('abc', 'A cat')
+    assert preparer.uploaded_media_id('abc', 'A cat') is None
+    assert os.path.isfile(preparer.uploads_file)
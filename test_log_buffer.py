@@ -0,0 +1,75 @@
+import csv
+import json
+from LogBuffer import LogBuffer
+
+
+def read_csv(file_name):
+    with open(file_name, newline='', encoding="utf-8") as infile:
+        return list(csv.reader(infile))
+
+
+def test_rows_are_kept_in_order():
+    log = LogBuffer()
+    log.append("connect", "base URL")
+    log.append("post", {'id': 1})
+    assert [row[:2] for row in log] == [("connect", "base URL"), ("post", {'id': 1})]
+    assert len(log) == 2
+
+
+def test_flushes_every_few_rows_to_csv(tmp_path):
+    flush_file = str(tmp_path / 'log.csv')
+    log = LogBuffer(flush_file=flush_file, flush_every=3)
+    for i in range(7):
+        log.append("task", f"row {i}")
+    rows = read_csv(flush_file)
+    assert rows[0] == ["task", "details", "timestamp"]
+    assert [row[1] for row in rows[1:]] == ["row 0", "row 1", "row 2", "row 3", "row 4", "row 5"]
+    assert log.flush() == 1
+    assert log.flush() == 0
+    assert len(read_csv(flush_file)) == 8
+
+
+def test_jsonl_flush(tmp_path):
+    flush_file = str(tmp_path / 'log.jsonl')
+    log = LogBuffer(flush_file=flush_file)
+    log.append("post", {'id': 1})
+    log.flush()
+    with open(flush_file, encoding="utf-8") as infile:
+        row = json.loads(infile.readline())
+    assert row['task'] == "post" and row['details'] == {'id': 1}
+
+
+def test_flush_can_drop_written_rows(tmp_path):
+    flush_file = str(tmp_path / 'log.csv')
+    log = LogBuffer(flush_file=flush_file)
+    log.append("task", "row 0")
+    log.append("task", "row 1")
+    assert log.flush(drop=True) == 2
+    assert len(log) == 0 and log.dropped_rows == 2
+    log.append("task", "row 2")
+    assert log.flush(drop=True) == 1
+    assert [row[1] for row in read_csv(flush_file)[1:]] == ["row 0", "row 1", "row 2"]
+    # Nothing is dropped without a file to keep the rows in
+    log = LogBuffer()
+    log.append("task", "row 0")
+    assert log.flush(drop=True) == 0 and len(log) == 1
+
+
+def test_rotates_once_the_file_is_too_big(tmp_path):
+    flush_file = str(tmp_path / 'log.csv')
+    log = LogBuffer(flush_file=flush_file, flush_every=1, max_bytes=200, backup_count=2)
+    for i in range(40):
+        log.append("task", f"row {i} " + "x" * 40)
+    assert (tmp_path / 'log.csv.1').is_file()
+    assert (tmp_path / 'log.csv.2').is_file()
+    assert not (tmp_path / 'log.csv.3').is_file()
+    # Every file starts with the header, and the newest rows are in the current file
+    assert read_csv(flush_file)[0] == ["task", "details", "timestamp"]
+    assert read_csv(flush_file)[-1][1].startswith("row 39 ")
+
+
+def test_write_csv(tmp_path):
+    log = LogBuffer()
+    log.append("a", "b")
+    log.write_csv(str(tmp_path / 'out.csv'))
+    assert read_csv(str(tmp_path / 'out.csv'))[1][:2] == ["a", "b"]
@@ -0,0 +1,215 @@
+import time
+import pytest
+from MockMastodonServer import MockMastodonServer
+from ProfileCache import ProfileCache
+
+# Regression tests of MastodonWrapper against MockMastodonServer - nothing is sent to a real server.
+# The server, empty_server and new_wrapper fixtures are in conftest.py
+
+
+def posting(text, image_file=None, image_text=''):
+    """
+    A posting dictionary, as DataForUpdates builds them
+    """
+    return {'full_update_text': text, 'image_name': image_file.name if image_file else '',
+            'full_image_name': str(image_file) if image_file else '', 'image_text': image_text,
+            'spoiler_text': None, 'sensitive': False}
+
+
+def wait_for(condition, seconds=10):
+    end = time.time() + seconds
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_sync_pages_through_the_whole_history(server, new_wrapper):
+    m = new_wrapper(server)
+    assert m.sync_statuses() == 95
+    assert len(m.status_store) == 95
+    assert [record.id for record in reversed(m.status_store.latest(1000))] == [int(status['id']) for status in server.statuses]
+    assert len(m.status_store.all_media()) == 19
+
+
+def test_sync_only_fetches_newer_statuses(server, new_wrapper):
+    m = new_wrapper(server)
+    m.sync_statuses()
+    server.add_status(server.make_status("<p>Posted from the web UI</p>"))
+    requests_before = server.requests
+    assert m.sync_statuses(force=True) == 1
+    assert server.requests - requests_before <= 2
+    assert len(m.status_store) == 96
+
+
+def test_sync_an_account_with_no_posts(empty_server, new_wrapper, tmp_path):
+    store_file = str(tmp_path / 'statuses.sqlite')
+    first_run = new_wrapper(empty_server, ok_to_post='yes', status_store_file=store_file)
+    assert first_run.sync_statuses() == 0
+    assert first_run.hours_since_last_post() == float('inf')
+    first_run.post_update(posting("The first post"))
+    # The next cron run, with the same store file, has to see it
+    second_run = new_wrapper(empty_server, ok_to_post='yes', status_store_file=store_file)
+    assert second_run.already_posted(posting("The first post"))
+    assert second_run.hours_since_last_post() < 1
+    assert len(empty_server.statuses) == 1
+
+
+def test_stale_cached_profile_is_revalidated(server, new_wrapper, tmp_path):
+    cache_file = str(tmp_path / 'profiles.json')
+    ProfileCache(cache_file).put(server.base_url, 'test-token', {**server.account, 'id': 999})
+    m = new_wrapper(server, profile_cache_file=cache_file)
+    assert m.user_id == 999
+    # The cached account ID is no longer found, so the profile is read again and the call retried
+    assert m.sync_statuses() == 95
+    assert m.user_id == int(server.account['id'])
+    assert ProfileCache(cache_file).get(server.base_url, 'test-token')['id'] == int(server.account['id'])
+
+
+def test_already_posted(server, new_wrapper):
+    m = new_wrapper(server)
+    posted_text = "Tom's & Jerry's \"quoted\" <b>"
+    server.add_status(server.make_status(f"<p>{MockMastodonServer.escape(posted_text)}</p>"))
+    assert m.already_posted(posting(posted_text))
+    assert not m.already_posted(posting("Never posted"))
+
+
+def test_already_posted_batch(server, new_wrapper):
+    m = new_wrapper(server)
+    server.add_status(server.make_status("<p>Posted today</p>"))
+    postings = [posting("Not yet"), posting("Posted today"), posting("Also not yet")]
+    assert m.already_posted_batch(postings) == [False, True, False]
+
+
+def test_post_without_media(empty_server, new_wrapper):
+    m = new_wrapper(empty_server, ok_to_post='yes')
+    status = m.post_update(posting("Text only #OTD"))
+    assert status is not None
+    assert empty_server.statuses[-1]['content'] == "<p>Text only #OTD</p>"
+    assert empty_server.statuses[-1]['media_attachments'] == []
+    assert m.already_posted(posting("Text only #OTD"))
+
+
+def test_post_with_media(empty_server, new_wrapper, tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    image_file = tmp_path / 'union-station.jpg'
+    Image.new('RGB', (64, 48), (120, 90, 60)).save(image_file)
+    empty_server.media_processing_seconds = 0.3
+    m = new_wrapper(empty_server, ok_to_post='yes', image_cache_folder=str(tmp_path / 'cache'))
+    status = m.post_update(posting("With a picture", image_file, "Union Station"))
+    assert status is not None
+    attachments = empty_server.statuses[-1]['media_attachments']
+    assert len(attachments) == 1
+    assert attachments[0]['description'] == "Union Station"
+    assert {row['name']: row for row in m.spans.summary()}['wait_for_media']['count'] == 1
+
+
+def test_prepared_upload_is_used_by_the_post(empty_server, new_wrapper, tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    image_file = tmp_path / 'union-station.jpg'
+    Image.new('RGB', (64, 48), (120, 90, 60)).save(image_file)
+    m = new_wrapper(empty_server, ok_to_post='yes')
+    details = posting("Prepared ahead", image_file, "Union Station")
+    media = m.prepare_upload(details)
+    assert m.prepare_upload(details) is media
+    assert m.prepare_upload(posting("No picture")) is None
+    assert m.post_update(details) is not None
+    assert [attachment['id'] for attachment in empty_server.statuses[-1]['media_attachments']] == [str(media['id'])]
+    assert len(empty_server.media) == 1 and m.prepared_media == {}
+
+
+def test_image_posted_before(empty_server, new_wrapper, tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    image_file = tmp_path / 'union-station.jpg'
+    Image.linear_gradient('L').convert('RGB').save(image_file)
+    m = new_wrapper(empty_server, ok_to_post='yes')
+    assert m.image_posted_before(str(image_file)) == []
+    assert m.post_update(posting("With a picture", image_file, "Union Station")) is not None
+    found = m.image_posted_before(str(image_file))
+    assert [(row['id'], row['distance']) for row in found] == [(str(empty_server.statuses[-1]['media_attachments'][0]['id']), 0)]
+    assert m.media_files()[0]['file_name'] == str(image_file)
+
+
+def test_post_not_made_when_not_ok_to_post(empty_server, new_wrapper):
+    m = new_wrapper(empty_server, ok_to_post='no')
+    assert m.post_update(posting("Not posted")) is None
+    assert empty_server.statuses == []
+
+
+def test_refresh_engagement(server, new_wrapper):
+    m = new_wrapper(server)
+    m.sync_statuses()
+    server.statuses[0]['favourites_count'] = 1000
+    # Statuses the store does not have make a window's page come back full, so it is paged to the end
+    missing = [int(status['id']) for status in server.statuses[10:50]]
+    m.status_store.db.execute(f"DELETE FROM statuses WHERE id IN ({','.join('?' * len(missing))})", missing)
+    assert m.refresh_engagement() == len(server.statuses)
+    assert len(m.status_store) == len(server.statuses)
+    assert m.engagement_report(min_posts=1)['tag'].loc['otd', 'posts'] == len(server.statuses)
+    assert m.status_store.db.execute("SELECT MAX(favourites) FROM engagement").fetchone()[0] == 1000
+
+
+def test_stream_applies_new_edited_and_deleted_statuses(server, new_wrapper):
+    m = new_wrapper(server)
+    m.sync_statuses()
+    listener = m.start_streaming(reconnect_seconds=0.2)
+    try:
+        assert wait_for(lambda: listener.connects == 1)
+        status = server.make_status("<p>Posted from the web UI</p>")
+        server.add_status(status)
+        assert wait_for(lambda: m.status_store.posted_at("Posted from the web UI") is not None)
+        someone_else = server.make_status("<p>Someone else</p>")
+        someone_else['account'] = {**server.account, 'id': '999'}
+        server.publish('update', someone_else)
+        server.edit_status(status['id'], "<p>Edited from the web UI</p>")
+        assert wait_for(lambda: m.status_store.posted_at("Edited from the web UI") is not None)
+        server.delete_status(status['id'])
+        assert wait_for(lambda: m.status_store.posted_at("Edited from the web UI") is None)
+        assert m.status_store.posted_at("Someone else") is None
+        assert listener.counts['ignored'] == 1
+    finally:
+        assert m.stop_streaming()
+
+
+def test_stream_reconnects_and_backfills(server, new_wrapper):
+    m = new_wrapper(server)
+    m.sync_statuses()
+    listener = m.start_streaming(reconnect_seconds=0.2)
+    try:
+        assert wait_for(lambda: listener.connects == 1)
+        server.streaming_available = False
+        server.disconnect_streams()
+        time.sleep(0.3)
+        # Posted while the stream is down, so only the backfill on reconnecting can find it
+        server.add_status(server.make_status("<p>Posted while the stream was down</p>"))
+        server.streaming_available = True
+        assert wait_for(lambda: listener.connects == 2)
+        assert m.status_store.posted_at("Posted while the stream was down") is not None
+        assert m.spans.counters['stream_disconnects'] >= 1
+    finally:
+        assert m.stop_streaming()
+
+
+def test_import_archive_then_sync_only_newer(server, new_wrapper, tmp_path):
+    archive_file = str(tmp_path / 'archive.zip')
+    assert server.export_archive(archive_file) == 95
+    server.add_status(server.make_status("<p>Posted after the archive was made</p>"))
+    m = new_wrapper(server)
+    assert m.import_archive(archive_file)['statuses'] == 95
+    assert m.sync_statuses() == 1
+    assert len(m.status_store) == 96
+    assert m.status_store.posted_at("Posted after the archive was made") is not None
+
+
+def test_sync_through_the_response_cache(server, new_wrapper):
+    from CachingSession import CachingSession
+    session = CachingSession()
+    m = new_wrapper(server, session=session)
+    assert m.sync_statuses() == 95
+    assert m.sync_statuses(force=True) == 0
+    # The same request for anything newer than the newest stored status - answered with 304 Not Modified
+    assert m.sync_statuses(force=True) == 0
+    assert session.stats()['revalidated'] == 1
+    server.add_status(server.make_status("<p>Posted from the web UI</p>"))
+    assert m.sync_statuses(force=True) == 1
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from MediaInventory import MediaInventory
+from StatusStore import StatusStore
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def picture(path, size=(160, 120), flip=False):
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    img.paste((200, 40, 40), (size[0] // 4, size[1] // 4, size[0] // 2, size[1] // 2))
+    (img.transpose(Image.Transpose.FLIP_LEFT_RIGHT) if flip else img).save(path, quality=90)
+    return str(path)
+
+
+def store_with_media(text='<p>Union Station</p>', media_id=77):
+    store = StatusStore()
+    store.add_statuses([{'id': 1, 'created_at': datetime(2024, 1, 1, tzinfo=timezone.utc), 'content': text,
+                         'url': 'https://example.social/@bot/1', 'reblog': None,
+                         'media_attachments': [{'id': media_id, 'type': 'image', 'description': 'The station'}]}])
+    return store
+
+
+def test_hamming():
+    assert MediaInventory.hamming(0b1011, 0b0001) == 2
+    assert MediaInventory.hamming(-1, 0) == 64
+    assert MediaInventory.hamming(None, 0) is None
+
+
+def test_finds_copies_and_near_duplicates(tmp_path):
+    inventory = MediaInventory(store_with_media())
+    original = picture(tmp_path / 'station.jpg')
+    inventory.link(77, original)
+    assert [(row['id'], row['distance']) for row in inventory.find(original)] == [('77', 0)]
+    # A smaller, recompressed copy is a near duplicate, a mirror image is not
+    resized = picture(tmp_path / 'station-small.jpg', size=(80, 60))
+    assert 0 <= inventory.find(resized)[0]['distance'] <= 6
+    assert inventory.find(picture(tmp_path / 'flipped.jpg', flip=True)) == []
+    assert inventory.find(resized, max_distance=0) == []
+    row = inventory.inventory()[0]
+    assert (row['file_name'], row['status_url'], row['description']) == (original, 'https://example.social/@bot/1', 'The station')
+    assert len(inventory) == 1
+
+
+def test_file_hashes_are_kept_until_the_file_changes(tmp_path):
+    inventory = MediaInventory(StatusStore())
+    file_name = picture(tmp_path / 'station.jpg')
+    first = inventory.file_hashes(file_name)
+    assert inventory.file_hashes(file_name)['content_hash'] == first['content_hash']
+    picture(file_name, flip=True)
+    assert inventory.file_hashes(file_name)['content_hash'] != first['content_hash']
+
+
+def test_link_schedule(tmp_path):
+    inventory = MediaInventory(store_with_media())
+    file_name = picture(tmp_path / 'station.jpg')
+    posting = {'full_update_text': 'Union Station', 'image_name': 'station.jpg', 'full_image_name': file_name}
+    missing = {'full_update_text': 'Gone', 'image_name': 'gone.jpg', 'full_image_name': str(tmp_path / 'gone.jpg')}
+    schedule = SimpleNamespace(index={(1, 1): [posting, missing]})
+    assert inventory.link_schedule(schedule) == 1
+    assert inventory.link_schedule(schedule) == 0
+    assert inventory.inventory()[0]['file_name'] == file_name
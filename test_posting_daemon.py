@@ -0,0 +1,33 @@
+import csv
+from datetime import datetime
+from DataForUpdates import DataForUpdates
+from PostingDaemon import PostingDaemon
+
+
+def write_schedule(path, day, rows):
+    with open(path, "w", newline='', encoding="utf-8") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["month", "day", "image_name", "image_text", "tags", "post_text", "spoiler_text", "sensitive"])
+        writer.writerows([[day.month, day.day, *row] for row in rows])
+    return str(path)
+
+
+def test_posts_once_then_done_for_the_day(empty_server, new_wrapper, tmp_path):
+    m = new_wrapper(empty_server, ok_to_post='yes')
+    today = datetime.now(m.local_timezone).date()
+    schedule = DataForUpdates(csv_file=write_schedule(tmp_path / 'schedule.csv', today, [
+        ['missing.jpg', 'Not there', '', 'Has a missing image', '', ''],
+        ['', '', '', 'Posted by the daemon', '', ''],
+    ]), image_folder=str(tmp_path) + '/', post_date=today)
+    daemon = PostingDaemon(m, schedule, post_limit_hours=4)
+    step = daemon.run_once()
+    assert step['action'] == 'posted'
+    assert len(empty_server.statuses) == 1
+    assert empty_server.statuses[0]['content'].startswith('<p>Posted by the daemon ')
+    step = daemon.run_once()
+    assert step['action'] == 'done_for_today'
+    assert step['wake_at'] <= daemon.next_midnight() + 1
+    assert [p['post_text'] for p in schedule.postings_for(today.month, today.day) if p['full_update_text'] in daemon.skipped] == \
+        ['Has a missing image']
+    daemon.stop()
+    assert daemon.run() == 1
@@ -0,0 +1,49 @@
+import json
+import time
+from ProfileCache import ProfileCache
+
+profile = {'id': '109000000000000001', 'username': 'mockbot', 'display_name': 'Mock Bot'}
+
+
+def test_put_and_get(tmp_path):
+    cache = ProfileCache(str(tmp_path / 'profiles.json'))
+    assert cache.get('https://example.social', 'token') is None
+    cache.put('https://example.social/', 'token', profile)
+    cached = cache.get('https://example.social', 'token')
+    assert {key: cached[key] for key in profile} == profile
+    # A different token or server is a different entry
+    assert cache.get('https://example.social', 'other token') is None
+    assert cache.get('https://other.social', 'token') is None
+
+
+def test_token_is_never_saved(tmp_path):
+    cache_file = tmp_path / 'profiles.json'
+    ProfileCache(str(cache_file)).put('https://example.social', 'secret-token', profile)
+    assert 'secret-token' not in cache_file.read_text()
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache_file = tmp_path / 'profiles.json'
+    cache = ProfileCache(str(cache_file), ttl_seconds=60)
+    cache.put('https://example.social', 'token', profile)
+    entries = json.loads(cache_file.read_text())
+    for entry in entries.values():
+        entry['cached_at'] = time.time() - 120
+    cache_file.write_text(json.dumps(entries))
+    assert cache.get('https://example.social', 'token') is None
+
+
+def test_invalidate(tmp_path):
+    cache = ProfileCache(str(tmp_path / 'profiles.json'))
+    cache.put('https://example.social', 'token', profile)
+    cache.invalidate('https://example.social', 'token')
+    assert cache.get('https://example.social', 'token') is None
+
+
+def test_unreadable_file_is_ignored(tmp_path):
+    cache_file = tmp_path / 'profiles.json'
+    cache_file.write_text('{not json')
+    cache = ProfileCache(str(cache_file))
+    assert cache.get('https://example.social', 'token') is None
+    cache.put('https://example.social', 'token', profile)
+    assert cache.get('https://example.social', 'token') is not None
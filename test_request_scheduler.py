@@ -0,0 +1,102 @@
+import threading
+import time
+import pytest
+from mastodon import MastodonNetworkError
+from RequestScheduler import RequestScheduler
+
+
+class FakeMastodon:
+    """Just the rate limit attributes Mastodon.py keeps, set the way it sets them from a response"""
+    def __init__(self, headers=None):
+        self.ratelimit_remaining = 300  # Mastodon.py's defaults, before any response
+        self.ratelimit_limit = 300
+        self.ratelimit_reset = time.time()
+        self.ratelimit_lastcall = time.time()
+        self.headers = headers  # (remaining, seconds to reset) to 'send' with every response, or None
+        self.failures = 0
+
+    def respond(self):
+        if self.headers:
+            self.ratelimit_remaining, reset_in = self.headers
+            self.ratelimit_reset = time.time() + reset_in
+            self.ratelimit_lastcall = max(time.time(), self.ratelimit_lastcall + 0.001)
+        return {'id': 1}
+
+    def media_post(self, *args, **kwargs):
+        return self.respond()
+
+    def account_statuses(self, *args, **kwargs):
+        return self.respond()
+
+    def status_post(self, *args, **kwargs):
+        raise MastodonNetworkError("Timed out")
+
+    def flaky(self):
+        if self.failures < 2:
+            self.failures += 1
+            raise MastodonNetworkError("Connection reset")
+        return self.respond()
+
+
+def test_bucket_spaces_out_uploads():
+    scheduler = RequestScheduler(buckets={'media': (3, 0.3)})
+    start = time.monotonic()
+    for _ in range(10):
+        scheduler.call(FakeMastodon(), 'media_post', 'image.jpeg')
+    # 3 right away, then one every 0.1 seconds
+    assert time.monotonic() - start >= 0.6
+    assert scheduler.calls == 10
+
+
+def test_server_budget_only_lowers_the_bucket():
+    scheduler = RequestScheduler(buckets={'read': (3, 300)})
+    m_object = FakeMastodon(headers=(300, 300))
+    for _ in range(3):
+        scheduler.call(m_object, 'account_statuses')
+    # The server says 300 are left, but that is no reason to go faster than the bucket
+    assert scheduler.budget()['read']['tokens'] < 1
+    assert scheduler.budget()['read']['server_remaining'] == 300
+
+    scheduler = RequestScheduler()
+    scheduler.call(FakeMastodon(headers=(2, 300)), 'account_statuses')
+    assert 2 <= scheduler.budget()['read']['tokens'] < 2.1
+    assert 299 < scheduler.budget()['read']['reset_in'] <= 300
+
+
+def test_values_from_an_earlier_response_are_ignored():
+    scheduler = RequestScheduler()
+    m_object = FakeMastodon()  # A response without X-RateLimit-* headers leaves the old values in place
+    m_object.ratelimit_remaining = 0
+    m_object.ratelimit_reset = time.time() + 300
+    scheduler.call(m_object, 'account_statuses')
+    budget = scheduler.budget()['read']
+    assert budget['server_remaining'] is None and budget['tokens'] > 298
+    start = time.monotonic()
+    scheduler.call(m_object, 'account_statuses')
+    assert time.monotonic() - start < 1
+
+
+def test_only_reads_are_retried():
+    scheduler = RequestScheduler(backoff_seconds=0.01)
+    m_object = FakeMastodon()
+    assert scheduler.call(m_object, 'flaky') == {'id': 1}
+    assert (scheduler.calls, scheduler.retries) == (3, 2)
+    with pytest.raises(MastodonNetworkError):
+        scheduler.call(m_object, 'status_post', 'Hello')
+    assert (scheduler.calls, scheduler.retries) == (4, 2)
+
+
+def test_counters_from_several_threads():
+    scheduler = RequestScheduler(buckets={'read': (10000, 1)})
+
+    def worker():
+        m_object = FakeMastodon(headers=(9000, 60))
+        for _ in range(200):
+            scheduler.call(m_object, 'account_statuses')
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.calls == 1600
+    assert scheduler.queue_depth() == 0
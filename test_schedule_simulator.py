@@ -0,0 +1,55 @@
+import csv
+from datetime import date
+import pytest
+from DataForUpdates import DataForUpdates
+from ScheduleSimulator import ScheduleSimulator
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    csv_file = str(tmp_path / 'schedule.csv')
+    with open(csv_file, "w", newline='', encoding="utf-8") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["month", "day", "image_name", "image_text", "tags", "post_text", "spoiler_text", "sensitive"])
+        writer.writerows([
+            [3, 8, '', '', 'OTD', 'First for March 8th', '', ''],
+            [3, 8, '', '', '', 'Second for March 8th', '', ''],
+            [3, 9, 'missing.jpg', 'Not there', '', 'Image missing on March 9th', '', ''],
+            [3, 10, '', '', '', 'Only one for March 10th', '', ''],
+        ])
+    return DataForUpdates(csv_file=csv_file, image_folder=str(tmp_path) + '/', include_calc_url=False)
+
+
+def posts(sim):
+    return [(decision['time'][:16], decision['details'].strip()) for decision in sim.decisions if decision['action'] == 'posted']
+
+
+def test_cron_mode_across_the_clock_change(schedule):
+    # Clocks in Toronto go forward at 2am on March 9th 2025, so that day is 23 hours long
+    sim = ScheduleSimulator(schedule, 'America/Toronto', post_limit_hours=4, start=date(2025, 3, 8), days=3)
+    sim.run()
+    assert posts(sim) == [('2025-03-08 00:00', 'First for March 8th #OTD'), ('2025-03-08 04:00', 'Second for March 8th'),
+                          ('2025-03-10 00:00', 'Only one for March 10th')]
+    assert len(sim.decisions) == 24 + 23 + 24
+    assert {decision['action'] for decision in sim.decisions if decision['time'].startswith('2025-03-09')} == {'skipped'}
+    assert [posting['post_text'] for posting in sim.unposted()] == ['Image missing on March 9th']
+    assert sim.summary().loc['posted', 'decisions'] == 3
+
+
+def test_daemon_mode_sleeps_until_each_post(schedule, tmp_path):
+    log_file = str(tmp_path / 'log.csv')
+    sim = ScheduleSimulator(schedule, 'America/Toronto', post_limit_hours=4, start=date(2025, 3, 8), days=3,
+                            mode='daemon', log_file=log_file)
+    sim.run()
+    assert posts(sim) == [('2025-03-08 00:00', 'First for March 8th #OTD'), ('2025-03-08 04:00', 'Second for March 8th'),
+                          ('2025-03-10 00:00', 'Only one for March 10th')]
+    # The second post waits for post_limit_hours, with its upload prepared a few minutes ahead
+    actions = [decision['action'] for decision in sim.decisions]
+    assert actions[actions.index('prepared') + 1] == 'posted'
+    assert sim.decisions[actions.index('prepared')]['time'].startswith('2025-03-08 03:50')
+    assert {decision['action'] for decision in sim.decisions if decision['time'].startswith('2025-03-09')} == {'done_for_today'}
+    assert [posting['post_text'] for posting in sim.unposted()] == ['Image missing on March 9th']
+    # The log went to the file as it was written, not kept in memory
+    assert len(sim.wrapper.log) < 5
+    with open(log_file, encoding="utf-8") as infile:
+        assert sum(1 for _ in infile) > len(sim.decisions)
@@ -0,0 +1,40 @@
+from datetime import datetime, timezone
+from SearchIndex import SearchIndex
+from StatusStore import StatusStore
+
+
+def status(status_id, content, tags=(), alt_text=None, reblog=None):
+    return {'id': status_id, 'created_at': datetime(2024, 1, status_id, tzinfo=timezone.utc), 'content': content,
+            'tags': [{'name': tag} for tag in tags], 'reblog': reblog,
+            'media_attachments': [{'id': status_id * 10, 'description': alt_text}] if alt_text else []}
+
+
+def test_text_tags_and_alt_text():
+    store = StatusStore()
+    store.add_statuses([status(1, '<p>Union Station opened today</p>', tags=['OTD']),
+                        status(2, '<p>The station was closed</p>', alt_text='A steam turbine'),
+                        status(3, '', reblog=status(4, '<p>Union Station, boosted</p>'))])
+    index = SearchIndex(store)
+    assert [result['record'].id for result in index.search('union station')] == [1]
+    assert {result['record'].id for result in index.search('station')} == {1, 2}
+    assert [result['record'].id for result in index.search('#otd')] == [1]
+    assert index.search('#station') == []
+    assert [result['record'].id for result in index.search('turbin*')] == [2]
+    assert index.search('union station')[0]['snippet'] == '[Union] [Station] opened today'
+    assert index.search('  ') == [] and len(index) == 2
+
+
+def test_indexes_only_new_statuses(tmp_path):
+    db_file = str(tmp_path / 'statuses.sqlite')
+    store = StatusStore(db_file)
+    store.add_statuses([status(1, '<p>First posting</p>')])
+    index = SearchIndex(store)
+    assert index.update() == 1
+    assert index.update() == 0
+    store.add_statuses([status(2, '<p>Second posting</p>'), status(1, '<p>First posting, edited</p>')])
+    assert index.update() == 2
+    assert [result['record'].id for result in index.search('edited')] == [1]
+    store.db.close()
+    # Saved with the store, so nothing needs to be indexed again
+    index = SearchIndex(StatusStore(db_file))
+    assert index.update() == 0 and len(index) == 2
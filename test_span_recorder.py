@@ -0,0 +1,37 @@
+import json
+from SpanRecorder import SpanRecorder
+
+
+def test_totals_include_errors_and_dropped_spans():
+    spans = SpanRecorder(keep_spans=2)
+    for _ in range(3):
+        with spans.span('api.status_post'):
+            pass
+    try:
+        with spans.span('api.media_post'):
+            raise ValueError("upload failed")
+    except ValueError:
+        pass
+    spans.count('api_calls', 4)
+    totals = {row['name']: row for row in spans.summary()}
+    assert totals['api.status_post']['count'] == 3
+    assert totals['api.media_post']['errors'] == 1
+    assert spans.counters == {'api_calls': 4}
+    assert len(spans) == 2
+
+
+def test_export_appends_only_new_spans(tmp_path):
+    export_file = str(tmp_path / 'spans.jsonl')
+    spans = SpanRecorder(export_file=export_file)
+    spans.record('load_config', 0, 1_500_000)
+    assert spans.export() == 1
+    assert spans.export() == 0
+    with spans.span('already_posted', statuses=3):
+        pass
+    assert spans.export() == 1
+    with open(export_file, encoding="utf-8") as infile:
+        rows = [json.loads(line) for line in infile]
+    assert [row['name'] for row in rows] == ['load_config', 'already_posted']
+    assert rows[0]['duration_ms'] == 1.5
+    assert rows[1]['statuses'] == 3
+    assert SpanRecorder().export() == 0
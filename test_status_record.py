@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+from StatusRecord import StatusRecord, normalize_status_text, text_fingerprint
+
+
+def test_tags_are_stripped():
+    assert normalize_status_text('<p>Hello <a href="https://example.social/tags/python">#<span>python</span></a></p>') == 'Hello #python'
+
+
+def test_quoted_posting():
+    # Mastodon escapes quotes, apostrophes and ampersands in the HTML content of a status
+    content = '<p>&quot;Don&#39;t panic&quot; &amp; carry a towel &lt;3</p>'
+    assert normalize_status_text(content) == '"Don\'t panic" & carry a towel <3'
+
+
+def test_escaped_markup_is_kept_as_text():
+    assert normalize_status_text('<p>Use &lt;b&gt; for bold</p>') == 'Use <b> for bold'
+
+
+def test_missing_content():
+    assert normalize_status_text(None) == ''
+
+
+def test_fingerprint():
+    assert text_fingerprint('"Don\'t panic"') == text_fingerprint(normalize_status_text('<p>&quot;Don&#39;t panic&quot;</p>'))
+    assert text_fingerprint('Hello') != text_fingerprint('Hello ')
+    assert len(text_fingerprint('Hello')) == 32
+
+
+def test_record_from_status():
+    status = {'id': '110', 'created_at': datetime(2024, 3, 1, 12, tzinfo=timezone.utc), 'content': '<p>Tea &amp; #Cake</p>',
+              'visibility': 'public', 'url': 'https://example.social/@bot/110', 'mentions': [{'acct': 'friend'}],
+              'tags': [{'name': 'Cake'}, {'name': 'cake'}], 'media_attachments': [{'id': 7}], 'reblog': None}
+    record = StatusRecord.from_status(status)
+    assert (record.id, record.text, record.tags, record.mentions, record.media_ids) == (110, 'Tea & #Cake', ('cake',), ('friend',), ('7',))
+    assert record.created_at == status['created_at'].timestamp()
+    assert record.fingerprint == text_fingerprint('Tea & #Cake')
+    assert not hasattr(record, '__dict__')
+
+
+def test_reblog_from_status():
+    reblog = {'id': 9, 'created_at': datetime(2024, 2, 1, tzinfo=timezone.utc), 'content': '<p>Someone &quot;else&quot;</p>'}
+    record = StatusRecord.from_status({'id': 10, 'created_at': datetime(2024, 3, 1, tzinfo=timezone.utc), 'content': '', 'reblog': reblog})
+    assert (record.reblog_id, record.reblog_text, record.fingerprint) == (9, 'Someone "else"', None)
+    assert record.reblog_created_at == reblog['created_at'].timestamp()
+
+
+def test_record_from_row():
+    row = {'id': 1, 'created_at': 1.5, 'text': 'Hello', 'fingerprint': 'ab', 'visibility': 'public', 'url': None,
+           'mentions': 'a b', 'tag_names': None, 'media_list': '77 78', 'reblog_id': None, 'reblog_text': None,
+           'reblog_created_at': None}
+    record = StatusRecord.from_row(row)
+    assert (record.mentions, record.tags, record.media_ids) == (('a', 'b'), (), ('77', '78'))
@@ -0,0 +1,99 @@
+import threading
+from datetime import datetime, timezone
+from StatusStore import StatusStore
+
+
+def status(status_id, content, day=1, reblog=None):
+    return {'id': status_id, 'created_at': datetime(2024, 1, day, tzinfo=timezone.utc), 'content': content, 'reblog': reblog}
+
+
+def test_posted_at():
+    store = StatusStore()
+    store.add_statuses([status(2, '<p>Hello &amp; welcome</p>', day=2), status(1, '<p>Hello &amp; welcome</p>')])
+    assert store.posted_at('Hello & welcome') == datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+    assert store.posted_at('Goodbye') is None
+    assert (store.oldest_id(), store.newest_id(), len(store)) == (1, 2, 2)
+
+
+def test_reblogs_are_not_the_users_text():
+    store = StatusStore()
+    store.add_statuses([status(1, '<p>Someone else</p>', reblog=status(9, '<p>Someone else</p>'))])
+    assert store.posted_at('Someone else') is None
+    assert store.newest_id() == 1
+
+
+def test_posted_fingerprints():
+    store = StatusStore()
+    store.add_statuses([status(i, f'<p>Posting {i}</p>') for i in range(1, 1201)])
+    texts = [f'Posting {i}' for i in range(600, 1400)]  # More than one query's worth
+    found = store.posted_fingerprints(texts)
+    assert len(found) == 601
+
+
+def test_tags_media_and_reblogs():
+    store = StatusStore()
+    posting = status(1, '<p>A photo #Cats #cats</p>')
+    posting.update(tags=[{'name': 'Cats'}, {'name': 'cats'}], visibility='public', mentions=[{'acct': 'friend@example.social'}],
+                   media_attachments=[{'id': 77, 'type': 'image', 'url': 'https://example.social/77.jpg',
+                                       'description': 'A cat', 'meta': {'original': {'width': 640, 'height': 480, 'size': '640x480'}}},
+                                      {'id': 78, 'type': 'gifv', 'url': 'https://example.social/78.mp4', 'description': None, 'meta': None}])
+    store.add_statuses([posting, status(2, '', day=2, reblog=status(9, '<p>&quot;Quoted&quot; &amp; boosted</p>'))])
+    latest = store.latest()
+    assert [record.id for record in latest] == [2, 1]
+    assert latest[0].reblog_text == '"Quoted" & boosted'
+    assert latest[0].reblog_id == 9
+    assert latest[1].mentions == ('friend@example.social',)
+    assert latest[1].tags == ('cats',)
+    assert latest[1].media_ids == ('77', '78')
+    assert store.tags_for(1) == ['cats']
+    assert [(media['id'], media['size']) for media in store.all_media()] == [('77', '640x480'), ('78', None)]
+    # A status read again replaces its tags and media
+    posting.update(tags=[], media_attachments=[])
+    store.add_statuses([posting])
+    assert store.tags_for(1) == [] and store.media_for(1) == []
+
+
+def test_records_in_batches():
+    store = StatusStore()
+    store.add_statuses([status(i, f'<p>Posting {i}</p>', day=i) for i in range(5, 0, -1)])
+    records = list(store.records(batch_size=2))
+    assert [record.id for record in records] == [1, 2, 3, 4, 5]
+    assert records[0].text == 'Posting 1' and records[0].tags == () and records[0].media_ids == ()
+
+
+def test_delete_status():
+    store = StatusStore()
+    posting = status(1, '<p>Deleted later #cats</p>')
+    posting.update(tags=[{'name': 'cats'}], media_attachments=[{'id': 77}])
+    store.add_statuses([posting, status(2, '<p>Kept</p>', day=2)])
+    assert store.delete_status('1')
+    assert not store.delete_status(1)
+    assert store.posted_at('Deleted later #cats') is None
+    assert store.tags_for(1) == [] and store.media_for(1) == [] and len(store) == 1
+
+
+def test_reads_while_another_thread_writes():
+    store = StatusStore()
+    store.create_tables("CREATE TABLE IF NOT EXISTS extra (id INTEGER PRIMARY KEY);")
+    writer = threading.Thread(target=lambda: [store.add_statuses([status(i * 10 + j, f'<p>Posting {i} {j}</p>') for j in range(10)])
+                                              for i in range(1, 50)])
+    writer.start()
+    while writer.is_alive():
+        # Every batch is committed whole, so a reader never sees part of one
+        assert len(store) % 10 == 0
+        ids = [record.id for record in store.records(batch_size=7)]
+        assert ids == sorted(set(ids))
+    writer.join()
+    assert len(store) == 490
+
+
+def test_kept_between_runs(tmp_path):
+    db_file = str(tmp_path / 'statuses.sqlite')
+    store = StatusStore(db_file)
+    store.add_statuses([status(1, '<p>Hello</p>')])
+    store.set_state('history_complete', 'yes')
+    store.db.close()
+    store = StatusStore(db_file)
+    assert store.posted_at('Hello') is not None
+    assert store.get_state('history_complete') == 'yes'
+    assert store.get_state('missing', 'default') == 'default'